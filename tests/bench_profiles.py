@@ -0,0 +1,73 @@
+"""Benchmark the SQLite tuning profiles.
+
+For each profile, times adding and popping tasks one transaction at a time, then
+listing the first page of the resulting queue, in a fresh database. Each is
+measured with a connection per call, like separate tqu commands, and over one
+connection, like tqu work or a program holding a db.session():
+
+    python tests/bench_profiles.py --tasks 2000
+
+The database is created in --dir, by default the current directory rather than a
+temporary directory, which may live on tmpfs where syncing to disk costs nothing.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Dict
+
+QUEUE = "bench"
+
+
+def run_benchmark(db_path: str, profile: str, tasks: int, session: bool) -> Dict[str, float]:
+    """Return adds and pops per second and the time to list 100 tasks in milliseconds."""
+    os.environ["TQU_DB_PATH"] = db_path
+    os.environ["TQU_PROFILE"] = profile
+    from tqu import db
+
+    db.init_db()
+    with db.session() if session else nullcontext():
+        start = time.perf_counter()
+        for i in range(tasks):
+            db.add_task(f"task {i}", QUEUE)
+        adds = tasks / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for _ in range(20):
+            db.list_tasks(QUEUE, limit=100)
+        listing = (time.perf_counter() - start) / 20
+
+        start = time.perf_counter()
+        for _ in range(tasks):
+            db.pop_first(QUEUE)
+        pops = tasks / (time.perf_counter() - start)
+    return {"adds_per_second": adds, "pops_per_second": pops, "list_ms": listing * 1000}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, default=2000, help="tasks to add and pop per profile")
+    parser.add_argument("--dir", default=".", help="directory for the benchmark databases")
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from tqu.backends.sqlite import PROFILES
+
+    print(f"{'profile':<12}{'connection':<12}{'adds/s':>10}{'pops/s':>10}{'list ms':>10}")
+    for session in (False, True):
+        for profile in PROFILES:
+            with tempfile.TemporaryDirectory(dir=args.dir) as temp_dir:
+                report = run_benchmark(str(Path(temp_dir) / "bench.sqlite"), profile, args.tasks, session)
+            print(
+                f"{profile:<12}{'shared' if session else 'per call':<12}{report['adds_per_second']:>10.0f}"
+                f"{report['pops_per_second']:>10.0f}{report['list_ms']:>10.2f}"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
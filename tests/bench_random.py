@@ -0,0 +1,97 @@
+"""Benchmark random pops against ORDER BY RANDOM().
+
+Fills a queue, then times popping random tasks with tqu.db.pop_random and with
+the naive query that sorts the whole active set:
+
+    python tests/bench_random.py --tasks 200000 --pops 200
+
+With --queues above 1, tasks are added to the queues in turn, so each queue's IDs
+are sparse and pop_random more often reads a task at a random rank, walking the
+index up to it.
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict
+
+QUEUE = "bench"
+
+NAIVE_POP = """
+    UPDATE tasks SET completed_at = ?, updated_at = ?
+    WHERE id = (
+        SELECT id FROM tasks
+        WHERE queue_id = (SELECT id FROM queues WHERE name = ?) AND completed_at IS NULL AND visible_at <= ?
+        ORDER BY RANDOM()
+        LIMIT 1
+    )
+"""
+
+
+def fill(db_path: str, tasks: int, queues: int) -> None:
+    """Add `tasks` tasks to the benchmark queue, interleaved with `queues - 1` other queues."""
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.executemany(
+            "INSERT INTO queues (name) VALUES (?)", [(f"{QUEUE}{i}" if i else QUEUE,) for i in range(queues)]
+        )
+        conn.execute(
+            """
+            WITH RECURSIVE n(i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM n WHERE i + 1 < ?)
+            INSERT INTO tasks (queue_id, task_text, created_at, updated_at, visible_at, uid)
+            SELECT (SELECT id FROM queues WHERE name = ?) + i % ?, 'task ' || i, 1, 1, 1, lower(hex(randomblob(16)))
+            FROM n
+        """,
+            (tasks * queues, QUEUE, queues),
+        )
+    conn.close()
+
+
+def run_benchmark(db_path: str, tasks: int, pops: int, queues: int = 1) -> Dict[str, Any]:
+    """Time `pops` random pops each way and return the mean latencies in milliseconds."""
+    os.environ["TQU_DB_PATH"] = db_path
+    from tqu import db
+
+    db.init_db()
+    fill(db_path, tasks, queues)
+
+    start = time.perf_counter()
+    for _ in range(pops):
+        db.pop_random(QUEUE)
+    sampled = (time.perf_counter() - start) / pops
+
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    start = time.perf_counter()
+    for _ in range(pops):
+        now = int(time.time())
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(NAIVE_POP, (now, now, QUEUE, now))
+        conn.execute("COMMIT")
+    naive = (time.perf_counter() - start) / pops
+    conn.close()
+    return {"pop_random_ms": sampled * 1000, "order_by_random_ms": naive * 1000, "speedup": naive / sampled}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, default=200_000, help="tasks in the benchmark queue")
+    parser.add_argument("--pops", type=int, default=200, help="random pops to time each way")
+    parser.add_argument("--queues", type=int, default=1, help="queues to interleave the tasks with")
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    with tempfile.TemporaryDirectory() as temp_dir:
+        report = run_benchmark(str(Path(temp_dir) / "bench.sqlite"), args.tasks, args.pops, args.queues)
+
+    print(f"tasks={args.tasks} queues={args.queues} pops={args.pops}")
+    print(f"pop_random={report['pop_random_ms']:.2f}ms order_by_random={report['order_by_random_ms']:.2f}ms")
+    print(f"speedup={report['speedup']:.0f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,146 @@
+"""Multi-process stress harness for tqu.
+
+Runs producer and consumer processes against one SQLite database for a fixed
+duration, then checks that every added task was delivered exactly once:
+
+    python tests/stress.py --producers 4 --consumers 4 --duration 10
+
+Exits non-zero if a task was lost, duplicated or delivered without being added.
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List
+
+QUEUE = "stress"
+
+
+def _use_database(db_path: str) -> None:
+    os.environ["TQU_DB_PATH"] = db_path
+
+
+def produce(db_path: str, producer: int, deadline: float) -> Dict[str, Any]:
+    _use_database(db_path)
+    from tqu import db, instrumentation
+    from tqu.exceptions import TransientDatabaseError
+
+    added: List[str] = []
+    lock_errors = 0
+    n = 0
+    while time.time() < deadline:
+        text = f"p{producer}-{n}"
+        n += 1
+        try:
+            db.add_task(text, QUEUE)
+            added.append(text)
+        except TransientDatabaseError:
+            # Every attempt was rolled back, so the task was not added
+            lock_errors += 1
+    return {"added": added, "lock_errors": lock_errors, "retries": instrumentation.get_counters().get("db.retries", 0)}
+
+
+def consume(db_path: str, consumer: int, deadline: float) -> Dict[str, Any]:
+    _use_database(db_path)
+    from tqu import db, instrumentation
+    from tqu.exceptions import EmptyQueueError, TransientDatabaseError
+
+    # Mix every way of taking tasks so all of them are exercised concurrently
+    operations = [
+        lambda: [db.pop_first(QUEUE)],
+        lambda: [db.pop_last(QUEUE)],
+        lambda: db.claim_tasks(QUEUE, 5),
+        lambda: db.pop_random(QUEUE, 3),
+    ]
+    popped: List[str] = []
+    lock_errors = 0
+    n = consumer
+    while time.time() < deadline:
+        n += 1
+        try:
+            tasks = operations[n % len(operations)]()
+            if not tasks:
+                raise EmptyQueueError(QUEUE)
+            popped.extend(task["task_text"] for task in tasks)
+        except EmptyQueueError:
+            time.sleep(0.001)
+        except TransientDatabaseError:
+            lock_errors += 1
+    return {
+        "popped": popped,
+        "lock_errors": lock_errors,
+        "retries": instrumentation.get_counters().get("db.retries", 0),
+    }
+
+
+def run_stress(db_path: str, producers: int, consumers: int, duration: float) -> Dict[str, Any]:
+    """Run the workload and return its statistics and any delivery violations."""
+    _use_database(db_path)
+    from tqu import db
+
+    db.init_db()
+    context = multiprocessing.get_context("spawn")
+    start = time.time()
+    # Consumers run a little longer so they also see the final burst of adds
+    producer_deadline = start + duration
+    consumer_deadline = producer_deadline + min(1.0, duration / 4)
+    with context.Pool(producers + consumers) as pool:
+        producer_results = [pool.apply_async(produce, (db_path, i, producer_deadline)) for i in range(producers)]
+        consumer_results = [pool.apply_async(consume, (db_path, i, consumer_deadline)) for i in range(consumers)]
+        produced = [result.get() for result in producer_results]
+        consumed = [result.get() for result in consumer_results]
+    elapsed = time.time() - start
+
+    drained = []
+    while True:
+        tasks = db.claim_tasks(QUEUE, 1000)
+        if not tasks:
+            break
+        drained.extend(task["task_text"] for task in tasks)
+
+    added = Counter(text for result in produced for text in result["added"])
+    delivered = Counter(text for result in consumed for text in result["popped"])
+    delivered.update(drained)
+    return {
+        "added": sum(added.values()),
+        "consumed": sum(delivered.values()) - len(drained),
+        "drained": len(drained),
+        "elapsed": elapsed,
+        "lock_errors": sum(result["lock_errors"] for result in produced + consumed),
+        "retries": sum(result["retries"] for result in produced + consumed),
+        "duplicated": sorted(text for text, count in delivered.items() if count > 1),
+        "lost": sorted(set(added) - set(delivered)),
+        "unexpected": sorted(set(delivered) - set(added)),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--producers", type=int, default=4)
+    parser.add_argument("--consumers", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds to produce for")
+    parser.add_argument("--db", help="database path (default: a temporary file)")
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    with tempfile.TemporaryDirectory() as temp_dir:
+        db_path = args.db or str(Path(temp_dir) / "stress.sqlite")
+        report = run_stress(db_path, args.producers, args.consumers, args.duration)
+
+    operations = report["added"] + report["consumed"]
+    print(f"producers={args.producers} consumers={args.consumers} elapsed={report['elapsed']:.1f}s")
+    print(f"added={report['added']} consumed={report['consumed']} drained={report['drained']}")
+    print(f"throughput={operations / report['elapsed']:.0f} ops/s")
+    print(f"retries={report['retries']} lock_errors={report['lock_errors']}")
+    for violation in ("duplicated", "lost", "unexpected"):
+        print(f"{violation}={len(report[violation])} {report[violation][:10]}")
+    return 1 if report["duplicated"] or report["lost"] or report["unexpected"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,632 @@
+"""Conformance suite run against every storage backend."""
+
+import random
+
+import pytest
+
+from tqu import db
+from tqu.backends import MemoryBackend, SQLiteBackend
+from tqu.backends.base import PREVIEW_LENGTH, preview_text
+from tqu.exceptions import (
+    EmptyQueueError,
+    QueueAlreadyExistsError,
+    QueueError,
+    QueueFullError,
+    QueueNotFoundError,
+    TaskAlreadyExistsError,
+    TaskNotFoundError,
+)
+
+
+@pytest.fixture(params=["sqlite", "sqlite-without-returning", "memory"])
+def backend(request, tmp_path, monkeypatch):
+    if request.param == "sqlite-without-returning":
+        # The fallback for SQLite builds older than 3.35
+        monkeypatch.setattr("tqu.backends.sqlite.HAS_RETURNING", False)
+    if request.param.startswith("sqlite"):
+        instance = SQLiteBackend(str(tmp_path / "test.sqlite"))
+    else:
+        instance = MemoryBackend()
+    instance.init()
+    return instance
+
+
+@pytest.fixture
+def populated(backend):
+    backend.add_task("Task 1", "default")
+    backend.add_task("Task 2", "default")
+    backend.add_task("Project task", "project")
+    return backend
+
+
+def test_init_is_idempotent(backend):
+    backend.init()
+    assert backend.list_queues() == []
+
+
+def test_add_and_list(populated):
+    tasks = populated.list_tasks("default")
+    assert [task["task_text"] for task in tasks] == ["Task 1", "Task 2"]
+    assert set(tasks[0]) == {"id", "task_text", "created_at", "visible_at"}
+
+
+@pytest.mark.parametrize(
+    "limit, offset, expected",
+    [(2, 0, [0, 1]), (3, 4, [4, 5, 6]), (None, 8, [8, 9]), (5, 8, [8, 9]), (2, 12, [])],
+)
+def test_list_tasks_pages(backend, limit, offset, expected):
+    for i in range(10):
+        backend.add_task(f"Task {i}", "default")
+    tasks = backend.list_tasks("default", limit=limit, offset=offset)
+    assert [task["task_text"] for task in tasks] == [f"Task {i}" for i in expected]
+
+
+@pytest.mark.parametrize(
+    "after, limit, offset, newest, expected",
+    [
+        (None, 3, 0, True, [7, 8, 9]),
+        (None, 2, 1, True, [7, 8]),
+        (None, None, 7, True, [0, 1, 2]),
+        (3, 2, 0, False, [4, 5]),
+        (3, 2, 1, False, [5, 6]),
+        (3, None, 0, True, [4, 5, 6, 7, 8, 9]),
+        (6, 5, 0, True, [7, 8, 9]),
+        (9, 2, 0, False, []),
+    ],
+)
+def test_list_tasks_after_a_task_and_from_the_end(backend, after, limit, offset, newest, expected):
+    ids = [backend.add_task(f"Task {i}", "default").task_id for i in range(10)]
+    tasks = backend.list_tasks(
+        "default", limit=limit, offset=offset, after_id=None if after is None else ids[after], newest=newest
+    )
+    assert [task["task_text"] for task in tasks] == [f"Task {i}" for i in expected]
+
+
+def test_list_tasks_after_a_task_keeps_list_order(backend, clock):
+    ids = [backend.add_task(f"Task {i}", "default", visible_at=int(clock[0]) + 30 - 10 * i).task_id for i in range(3)]
+    # Scheduled lists are in due order, the reverse of the order these were added in
+    assert [task["task_text"] for task in backend.list_tasks("default", scheduled=True, after_id=ids[1])] == ["Task 0"]
+    assert [task["task_text"] for task in backend.list_tasks("default", match="Task*", after_id=ids[0])] == []
+    added = backend.add_task("Task 3", "default")
+    clock[0] += 60
+    assert backend.pop_first("default")["id"] == added.task_id
+    # The task a page followed on from may have been completed since
+    assert [task["task_text"] for task in backend.list_tasks("default", after_id=added.task_id)] == [
+        "Task 2",
+        "Task 1",
+        "Task 0",
+    ]
+    assert backend.list_tasks("default", after_id=10_000) == []
+
+
+def test_count_tasks(populated):
+    assert populated.count_tasks("default") == 2
+    assert populated.count_tasks("missing") == 0
+    populated.pop_first("default")
+    assert populated.count_tasks("default") == 1
+
+
+def test_count_tasks_leaves_out_scheduled_tasks(backend, clock):
+    backend.add_task("Due", "default")
+    backend.add_task("Later", "default", visible_at=int(clock[0]) + 60)
+    assert backend.count_tasks("default") == 1
+    assert backend.count_tasks("default", scheduled=True) == 1
+    clock[0] += 60
+    assert backend.count_tasks("default") == 2
+    assert backend.count_tasks("default", scheduled=True) == 0
+
+
+def test_list_unknown_queue(backend):
+    assert backend.list_tasks("missing") == []
+
+
+def test_add_duplicate(populated):
+    with pytest.raises(TaskAlreadyExistsError):
+        populated.add_task("Task 1", "default")
+    assert populated.add_task("Task 1", "other")
+
+
+def test_add_after_completion(populated):
+    populated.pop_first("default")
+    assert populated.add_task("Task 1", "default")
+
+
+def test_pop_last(populated):
+    task = populated.pop_last("default")
+    assert task["task_text"] == "Task 2"
+    assert [t["task_text"] for t in populated.list_tasks("default")] == ["Task 1"]
+
+
+def test_pop_first(populated):
+    task = populated.pop_first("default")
+    assert task["task_text"] == "Task 1"
+    assert [t["task_text"] for t in populated.list_tasks("default")] == ["Task 2"]
+
+
+@pytest.mark.parametrize("method", ["pop_first", "pop_last", "delete_queue"])
+def test_empty_queue(backend, method):
+    with pytest.raises(EmptyQueueError, match="No tasks in 'default' queue"):
+        getattr(backend, method)("default")
+
+
+def test_claim_tasks(populated):
+    populated.add_task("Task 3", "default")
+    claimed = populated.claim_tasks("default", 2)
+    assert [task["task_text"] for task in claimed] == ["Task 1", "Task 2"]
+    assert not populated.task_exists(claimed[0]["id"])
+    assert [task["task_text"] for task in populated.claim_tasks("default", 5)] == ["Task 3"]
+    assert populated.claim_tasks("default", 5) == []
+
+
+def test_pop_random(backend, clock):
+    random.seed(1)
+    for i in range(20):
+        backend.add_task(f"Task {i}", "default")
+    backend.add_task("Later", "default", visible_at=int(clock[0]) + 60)
+    backend.add_task("Other", "other")
+    popped = [task["task_text"] for task in backend.pop_random("default", 5)]
+    popped += [backend.pop_random("default", 1)[0]["task_text"] for _ in range(10)]
+    popped += [task["task_text"] for task in backend.pop_random("default", 10)]
+    assert sorted(popped) == sorted(f"Task {i}" for i in range(20))
+    assert popped != [f"Task {i}" for i in range(20)]
+    assert backend.pop_random("default", 1) == []
+    assert backend.pop_random("missing", 1) == []
+    assert backend.list_queues() == [("default", 1), ("other", 1)]
+    assert [event["kind"] for event in backend.list_events()[-20:]] == ["complete"] * 20
+
+
+def test_release_task(populated):
+    first, second = populated.claim_tasks("default", 2)
+    assert populated.release_task(second["id"])
+    assert populated.release_task(first["id"])
+    assert [task["id"] for task in populated.list_tasks("default")] == [first["id"], second["id"]]
+    assert not populated.release_task(first["id"])
+    assert not populated.release_task(999)
+
+
+def test_release_task_respects_duplicates(populated):
+    task = populated.pop_first("default")
+    populated.add_task(task["task_text"], "default")
+    assert not populated.release_task(task["id"])
+    assert populated.count_tasks("default") == 2
+
+
+def test_delete_task(populated):
+    task_id = populated.list_tasks("default")[0]["id"]
+    assert populated.task_exists(task_id)
+    queue_name, task_text = populated.delete_task(task_id)
+    assert (queue_name, task_text) == ("default", "Task 1")
+    assert not populated.task_exists(task_id)
+    with pytest.raises(TaskNotFoundError):
+        populated.delete_task(task_id)
+
+
+def test_delete_queue(populated):
+    tasks = populated.delete_queue("default")
+    assert [task["task_text"] for task in tasks] == ["Task 1", "Task 2"]
+    assert populated.list_tasks("default") == []
+    assert populated.list_queues() == [("project", 1)]
+
+
+def test_list_queues(populated):
+    assert [tuple(row) for row in populated.list_queues()] == [("default", 2), ("project", 1)]
+
+
+def test_rename_queue(populated):
+    populated.rename_queue("project", "work")
+    assert populated.list_tasks("project") == []
+    assert [task["task_text"] for task in populated.list_tasks("work")] == ["Project task"]
+    with pytest.raises(TaskAlreadyExistsError):
+        populated.add_task("Project task", "work")
+    populated.add_task("Project task", "project")
+
+
+def test_rename_queue_errors(populated):
+    with pytest.raises(QueueNotFoundError):
+        populated.rename_queue("missing", "other")
+    with pytest.raises(QueueAlreadyExistsError):
+        populated.rename_queue("project", "default")
+
+
+def test_rename_queue_over_completed_queue(populated):
+    populated.add_task("Old", "archive")
+    populated.pop_first("archive")
+    populated.rename_queue("project", "archive")
+    assert [task["task_text"] for task in populated.list_tasks("archive")] == ["Project task"]
+
+
+def test_merge_queues(populated):
+    populated.add_task("Task 2", "project")
+    populated.add_task("Task 3", "project")
+    assert populated.merge_queues("project", "default") == (2, 1)
+    assert [task["task_text"] for task in populated.list_tasks("default")] == [
+        "Task 1",
+        "Task 2",
+        "Project task",
+        "Task 3",
+    ]
+    assert [tuple(row) for row in populated.list_queues()] == [("default", 4)]
+    with pytest.raises(QueueNotFoundError):
+        populated.merge_queues("project", "default")
+
+
+def test_merge_into_new_queue(populated):
+    assert populated.merge_queues("project", "work") == (1, 0)
+    assert populated.pop_first("work")["task_text"] == "Project task"
+
+
+def test_merge_into_itself(populated):
+    with pytest.raises(QueueError, match="into itself"):
+        populated.merge_queues("default", "default")
+
+
+def test_move_tasks(backend):
+    for i in range(5):
+        backend.add_task(f"Task {i}", "inbox")
+    first = backend.list_tasks("inbox")[0]
+    assert backend.move_tasks("inbox", "processing") == (1, 0)
+    assert backend.move_tasks("inbox", "processing", limit=2, last=True) == (2, 0)
+    assert [task["task_text"] for task in backend.list_tasks("inbox")] == ["Task 1", "Task 2"]
+    moved = backend.list_tasks("processing")
+    assert [task["task_text"] for task in moved] == ["Task 0", "Task 3", "Task 4"]
+    assert (moved[0]["id"], moved[0]["created_at"]) == (first["id"], first["created_at"])
+    assert backend.move_tasks("inbox", "processing", limit=None) == (2, 0)
+    assert backend.list_queues() == [("processing", 5)]
+    assert [(event["kind"], event["queue_name"]) for event in backend.list_events()[-2:]] == [
+        ("move", "processing"),
+        ("move", "processing"),
+    ]
+
+
+def test_move_tasks_drops_duplicates(backend):
+    for text in ["A", "B", "C"]:
+        backend.add_task(text, "inbox")
+    backend.add_task("A", "done")
+    # The duplicate counts towards the two selected tasks
+    assert backend.move_tasks("inbox", "done", limit=2) == (1, 1)
+    assert [task["task_text"] for task in backend.list_tasks("inbox")] == ["C"]
+    assert [task["task_text"] for task in backend.list_tasks("done")] == ["B", "A"]
+
+
+def test_move_task_by_id(backend, clock):
+    backend.add_task("Due", "inbox")
+    backend.add_task("Later", "inbox", visible_at=int(clock[0]) + 60)
+    later = backend.list_tasks("inbox", scheduled=True)[0]
+    assert backend.move_tasks("inbox", "processing", task_id=later["id"]) == (1, 0)
+    assert backend.list_tasks("processing", scheduled=True) == [later]
+    with pytest.raises(TaskNotFoundError):
+        backend.move_tasks("inbox", "processing", task_id=later["id"])
+    assert backend.move_tasks("inbox", "processing", limit=None) == (1, 0)
+    with pytest.raises(EmptyQueueError):
+        backend.move_tasks("inbox", "processing")
+    with pytest.raises(QueueError, match="into itself"):
+        backend.move_tasks("processing", "processing")
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_700_000_000.0]
+    monkeypatch.setattr("time.time", lambda: now[0])
+    return now
+
+
+def test_queue_limit(backend, clock):
+    assert backend.queue_limit("jobs") == (None, 0)
+    backend.set_queue_limit("jobs", 2)
+    backend.add_task("Job 1", "jobs")
+    backend.add_task("Job 2", "jobs", visible_at=int(clock[0]) + 60)
+    assert backend.queue_limit("jobs") == (2, 2)
+    with pytest.raises(QueueFullError, match="limit of 2"):
+        backend.add_task("Job 3", "jobs")
+    assert backend.add_task("Job 3", "other")
+
+    backend.pop_first("jobs")
+    assert backend.add_task("Job 3", "jobs")
+    backend.set_queue_limit("jobs", None)
+    assert backend.add_task("Job 4", "jobs")
+    assert backend.queue_limit("jobs") == (None, 3)
+
+
+def test_active_counts_follow_every_change(backend, clock):
+    backend.set_queue_limit("inbox", 10)
+    for i in range(6):
+        backend.add_task(f"Task {i}", "inbox")
+    backend.add_task("Task 0", "done")
+    claimed = backend.claim_tasks("inbox", 2)
+    backend.release_task(claimed[0]["id"])
+    backend.delete_task(claimed[0]["id"])
+    backend.move_tasks("inbox", "done", limit=2)
+    backend.merge_queues("done", "archive")
+    backend.rename_queue("inbox", "queue")
+    assert backend.queue_limit("queue") == (10, 2)
+    assert backend.queue_limit("archive") == (None, 3)
+    assert backend.list_queues() == [("archive", 3), ("queue", 2)]
+    backend.delete_queue("queue")
+    assert backend.queue_limit("queue") == (10, 0)
+    assert backend.list_queues() == [("archive", 3)]
+
+
+def test_add_with_key_returns_first_task(backend, clock):
+    task_id, replayed = backend.add_task("Resize 1", "images", key="upload-1")
+    assert not replayed
+    assert backend.add_task("Resize 1", "images", key="upload-1") == (task_id, True)
+    assert backend.pop_first("images")["id"] == task_id
+    # Once added, a key never adds again, even after its task is completed
+    assert backend.add_task("Resize 1", "images", key="upload-1") == (task_id, True)
+    assert backend.count_tasks("images") == 0
+    assert backend.add_task("Resize 1", "images", key="upload-2").task_id > task_id
+    with pytest.raises(TaskAlreadyExistsError):
+        backend.add_task("Resize 1", "images", key="upload-3")
+
+
+def test_task_keys_expire(backend, clock):
+    task_id = backend.add_task("Resize 1", "images", key="upload-1", key_retention=60).task_id
+    clock[0] += 60
+    assert backend.add_task("Resize 1", "images", key="upload-1", key_retention=60) == (task_id, True)
+    backend.pop_first("images")
+    clock[0] += 1
+    added = backend.add_task("Resize 1", "images", key="upload-1", key_retention=60)
+    assert added.task_id > task_id and not added.replayed
+
+
+def test_scheduled_tasks_wait_until_due(backend, clock):
+    backend.add_task("Later", "default", visible_at=int(clock[0]) + 60)
+    backend.add_task("Now", "default")
+    assert [task["task_text"] for task in backend.list_tasks("default")] == ["Now"]
+    assert [task["task_text"] for task in backend.list_tasks("default", scheduled=True)] == ["Later"]
+    assert backend.count_tasks("default", scheduled=True) == 1
+    assert backend.list_queues() == [("default", 2)]
+    assert backend.pop_last("default")["task_text"] == "Now"
+    with pytest.raises(EmptyQueueError):
+        backend.pop_first("default")
+
+    clock[0] += 60
+    assert backend.count_tasks("default", scheduled=True) == 0
+    assert backend.claim_tasks("default", 5)[0]["task_text"] == "Later"
+
+
+def test_scheduled_tasks_join_the_queue_when_due(backend, clock):
+    backend.add_task("Second due", "default", visible_at=int(clock[0]) + 20)
+    backend.add_task("First due", "default", visible_at=int(clock[0]) + 10)
+    backend.add_task("Past", "default", visible_at=int(clock[0]) - 10)
+    assert [task["task_text"] for task in backend.list_tasks("default", scheduled=True)] == [
+        "First due",
+        "Second due",
+    ]
+    clock[0] += 15
+    backend.add_task("Added meanwhile", "default")
+    clock[0] += 15
+    assert [task["task_text"] for task in backend.list_tasks("default")] == [
+        "Past",
+        "First due",
+        "Added meanwhile",
+        "Second due",
+    ]
+    assert backend.pop_last("default")["task_text"] == "Second due"
+
+
+def test_tasks_added_in_one_second_keep_their_order(backend, clock):
+    for i in range(6):
+        backend.add_task(f"Task {i}", "default")
+    backend.move_tasks("default", "other", limit=2, last=True)
+    assert [task["task_text"] for task in backend.list_tasks("other")] == ["Task 4", "Task 5"]
+    assert backend.pop_first("default")["task_text"] == "Task 0"
+    assert backend.pop_last("default")["task_text"] == "Task 3"
+    assert [task["task_text"] for task in backend.claim_tasks("default", 2)] == ["Task 1", "Task 2"]
+
+
+def test_scheduled_tasks_follow_queue_operations(backend, clock):
+    backend.add_task("Later", "errands", visible_at=int(clock[0]) + 60)
+    with pytest.raises(TaskAlreadyExistsError):
+        backend.add_task("Later", "errands")
+    backend.rename_queue("errands", "chores")
+    assert backend.merge_queues("chores", "default") == (1, 0)
+    assert backend.list_tasks("default", scheduled=True)[0]["task_text"] == "Later"
+    task_id = backend.list_tasks("default", scheduled=True)[0]["id"]
+    assert backend.delete_task(task_id) == ("default", "Later")
+    assert backend.count_tasks("default", scheduled=True) == 0
+
+    backend.add_task("Later again", "default", visible_at=int(clock[0]) + 60)
+    assert [task["task_text"] for task in backend.delete_queue("default")] == ["Later again"]
+    assert backend.list_queues() == []
+
+
+def test_queue_metrics(populated):
+    populated.pop_first("default")
+    oldest = populated.list_tasks("default")[0]["created_at"]
+    assert populated.queue_metrics() == [
+        {"name": "default", "active": 1, "oldest": oldest, "added": 2, "completed": 1},
+        {
+            "name": "project",
+            "active": 1,
+            "oldest": populated.list_tasks("project")[0]["created_at"],
+            "added": 1,
+            "completed": 0,
+        },
+    ]
+    populated.pop_first("project")
+    assert populated.queue_metrics()[1]["oldest"] is None
+
+
+def test_queue_counters_never_go_back(populated):
+    populated.pop_first("default")
+    populated.move_tasks("default", "project")
+    populated.merge_queues("project", "merged")
+    populated.rename_queue("merged", "renamed")
+    metrics = {
+        queue["name"]: (queue["active"], queue["added"], queue["completed"]) for queue in populated.queue_metrics()
+    }
+    assert metrics == {"default": (0, 2, 1), "renamed": (2, 2, 0)}
+    # A released task is added again
+    task_id = populated.pop_first("renamed")["id"]
+    populated.release_task(task_id)
+    assert populated.queue_metrics()[1] == {
+        "name": "renamed",
+        "active": 2,
+        "oldest": populated.list_tasks("renamed")[0]["created_at"],
+        "added": 3,
+        "completed": 1,
+    }
+
+
+def test_queue_metrics_after_merge(populated):
+    populated.add_task("Task 1", "project")
+    assert populated.merge_queues("project", "default") == (1, 1)
+    metrics = {
+        queue["name"]: (queue["active"], queue["added"], queue["completed"]) for queue in populated.queue_metrics()
+    }
+    assert metrics == {"default": (3, 3, 0)}
+    # A queue created again under the merged queue's name starts from zero
+    populated.add_task("New project task", "project")
+    assert populated.queue_metrics()[1] == {
+        "name": "project",
+        "active": 1,
+        "oldest": populated.list_tasks("project")[0]["created_at"],
+        "added": 1,
+        "completed": 0,
+    }
+
+
+def test_mutations_log_events(populated):
+    task_id = populated.list_tasks("default")[0]["id"]
+    populated.pop_first("default")
+    populated.release_task(task_id)
+    populated.delete_task(task_id)
+    populated.merge_queues("project", "default")
+    populated.rename_queue("default", "renamed")
+    populated.delete_queue("renamed")
+
+    events = populated.list_events()
+    assert [event["seq"] for event in events] == list(range(1, len(events) + 1))
+    assert [(event["kind"], event["queue_name"], event["task_text"]) for event in events] == [
+        ("add", "default", "Task 1"),
+        ("add", "default", "Task 2"),
+        ("add", "project", "Project task"),
+        ("complete", "default", "Task 1"),
+        ("add", "default", "Task 1"),
+        ("delete", "default", "Task 1"),
+        ("move", "default", "Project task"),
+        ("rename", "default", "renamed"),
+        ("delete", "renamed", "Task 2"),
+        ("delete", "renamed", "Project task"),
+    ]
+    assert events[3]["task_id"] == task_id
+    # A rename is one event for the queue, however many tasks it has
+    assert events[7]["task_id"] == 0
+
+
+def test_list_events_filters_and_pages(populated):
+    assert [event["seq"] for event in populated.list_events(from_seq=2)] == [2, 3]
+    assert [event["seq"] for event in populated.list_events(queue_name="project")] == [3]
+    assert [event["seq"] for event in populated.list_events(limit=2)] == [1, 2]
+    assert [event["seq"] for event in populated.list_events(limit=2, newest=True)] == [2, 3]
+
+
+def test_prune_events(clock, backend):
+    backend.add_task("Task 1", "default")
+    backend.add_task("Task 2", "default")
+    clock[0] += 100
+    backend.pop_first("default")
+    assert backend.prune_events(int(clock[0])) == 2
+    (event,) = backend.list_events()
+    # Sequence numbers are not reused after pruning
+    assert (event["seq"], event["kind"]) == (3, "complete")
+    backend.add_task("Task 3", "default")
+    assert backend.list_events()[-1]["seq"] == 4
+
+
+def test_list_filters_by_age(backend, clock):
+    for i in range(4):
+        backend.add_task(f"Task {i}", "default")
+        clock[0] += 60
+    start = 1_700_000_000
+    assert backend.count_tasks("default", created_after=start + 60) == 3
+    assert backend.count_tasks("default", created_before=start + 60) == 1
+    tasks = backend.list_tasks("default", created_after=start + 60, created_before=start + 180)
+    assert [task["task_text"] for task in tasks] == ["Task 1", "Task 2"]
+    assert [task["task_text"] for task in backend.list_tasks("default", limit=1, offset=1, created_after=start)] == [
+        "Task 1"
+    ]
+
+
+@pytest.mark.parametrize(
+    "match, expected",
+    [("milk", ["Buy milk", "Oat milk"]), ("Buy*", ["Buy milk", "Buy bread"]), ("*[0-9]", ["Call 911"]), ("x", [])],
+)
+def test_list_filters_by_match(backend, match, expected):
+    for text in ["Buy milk", "Oat milk", "Buy bread", "Call 911"]:
+        backend.add_task(text, "default")
+    assert [task["task_text"] for task in backend.list_tasks("default", match=match)] == expected
+    assert backend.count_tasks("default", match=match) == len(expected)
+
+
+LARGE_TEXT = '{"payload": "' + "x" * 2000 + '"}'
+
+
+def test_large_texts_are_listed_as_preview(backend):
+    backend.add_task(LARGE_TEXT, "default")
+    (task,) = backend.list_tasks("default")
+    assert task["task_text"] == preview_text(LARGE_TEXT)
+    assert len(task["task_text"]) == PREVIEW_LENGTH
+    assert backend.get_task(task["id"])["task_text"] == LARGE_TEXT
+    assert backend.pop_first("default")["task_text"] == LARGE_TEXT
+    assert backend.get_task(task["id"])["completed_at"] is not None
+
+
+def test_duplicate_check_covers_large_texts(backend):
+    backend.add_task(LARGE_TEXT, "default")
+    with pytest.raises(TaskAlreadyExistsError):
+        backend.add_task(LARGE_TEXT, "default")
+    # Same preview, different payload
+    backend.add_task(LARGE_TEXT + " ", "default")
+    assert [task["task_text"] for task in backend.claim_tasks("default", 5)] == [LARGE_TEXT, LARGE_TEXT + " "]
+
+
+def test_get_task_not_found(backend):
+    with pytest.raises(TaskNotFoundError):
+        backend.get_task(42)
+
+
+def test_ids_are_not_reused(populated):
+    last = populated.pop_last("default")
+    populated.add_task("Task 3", "default")
+    assert populated.list_tasks("default")[-1]["id"] > last["id"]
+
+
+def test_data_version_moves_on_change(backend):
+    # SQLite only reports changes made by other connections
+    writer = SQLiteBackend(backend.path) if isinstance(backend, SQLiteBackend) else backend
+    with backend.session():
+        version = backend.data_version()
+        assert backend.list_tasks("default") == []
+        assert backend.data_version() == version
+        writer.add_task("Task 1", "default")
+        assert backend.data_version() != version
+        assert [task["task_text"] for task in backend.list_tasks("default")] == ["Task 1"]
+
+
+def test_session_reuses_rows_across_calls(populated):
+    with populated.session():
+        assert populated.list_tasks("default")[0]["task_text"] == "Task 1"
+        assert [tuple(row) for row in populated.list_queues()] == [("default", 2), ("project", 1)]
+
+
+def test_memory_db_path_keeps_data_between_calls(monkeypatch):
+    monkeypatch.setenv("TQU_DB_PATH", db.MEMORY_DB_PATH)
+    monkeypatch.setattr(db, "_memory_backend", None)
+    db.init_db()
+    db.add_task("Kept in memory")
+    assert isinstance(db.get_backend(), MemoryBackend)
+    assert [task["task_text"] for task in db.list_tasks()] == ["Kept in memory"]
+
+
+def test_set_backend_overrides_path(tmp_path, monkeypatch):
+    monkeypatch.setenv("TQU_DB_PATH", str(tmp_path / "unused.sqlite"))
+    backend = MemoryBackend()
+    db.set_backend(backend)
+    try:
+        db.add_task("Embedded")
+        assert backend.list_tasks("default")[0]["task_text"] == "Embedded"
+    finally:
+        db.set_backend(None)
+    assert not (tmp_path / "unused.sqlite").exists()
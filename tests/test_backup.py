@@ -0,0 +1,120 @@
+import gzip
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from tqu import backup, db
+from tqu.backends import MemoryBackend, SQLiteBackend
+from tqu.backends.sqlite import SCHEMA_VERSION
+from tqu.exceptions import DatabaseError
+
+
+@pytest.fixture
+def temp_db(tmp_path, monkeypatch):
+    path = tmp_path / "live.sqlite"
+    monkeypatch.setenv("TQU_DB_PATH", str(path))
+    db.init_db()
+    for i in range(200):
+        db.add_task(f"Task {i} " + "x" * 100, "work")
+    return path
+
+
+def test_backup_copies_database(temp_db, tmp_path):
+    steps = []
+    result = backup.backup(str(tmp_path / "copy.sqlite"), progress=lambda done, total: steps.append((done, total)))
+    # One step, so there is nothing for a writer to restart
+    assert steps == [(result.pages, result.pages)]
+    with sqlite3.connect(result.path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM tasks").fetchone()[0] == 200
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+
+
+def test_backup_reads_the_database_read_only(temp_db, tmp_path, monkeypatch):
+    copy = backup._copy
+
+    def check_read_only(source, target, *args):
+        with pytest.raises(sqlite3.OperationalError, match="readonly"):
+            source.execute("CREATE TABLE probe (x)")
+        return copy(source, target, *args)
+
+    monkeypatch.setattr(backup, "_copy", check_read_only)
+    result = backup.backup(str(tmp_path / "copy.sqlite"))
+    with sqlite3.connect(result.path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM tasks").fetchone()[0] == 200
+
+
+def test_backup_finishes_while_another_connection_writes(temp_db, tmp_path):
+    for i in range(2000):
+        db.add_task(f"Filler {i} " + "y" * 500, "filler")
+    writer = SQLiteBackend(str(temp_db))
+    stop = threading.Event()
+    written = []
+
+    def write_until_stopped():
+        while not stop.is_set():
+            written.append(writer.add_task(f"Written during backup {len(written)}", "work"))
+
+    thread = threading.Thread(target=write_until_stopped)
+    thread.start()
+    try:
+        while not written:
+            time.sleep(0.001)
+        result = backup.backup(str(tmp_path / "copy.sqlite"))
+        during = len(written)
+    finally:
+        stop.set()
+        thread.join()
+
+    # The copy is a consistent snapshot taken while the writer kept committing
+    assert during > 1
+    with sqlite3.connect(result.path) as conn:
+        assert conn.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+        copied = conn.execute("SELECT COUNT(*) FROM tasks WHERE queue_id = 1").fetchone()[0]
+    assert 200 < copied <= 200 + len(written)
+
+
+def test_compressed_backup_and_restore(temp_db, tmp_path):
+    path = tmp_path / "copy.sqlite.gz"
+    backup.backup(str(path), compress=True)
+    assert path.read_bytes()[:2] == backup.GZIP_MAGIC
+    assert gzip.decompress(path.read_bytes())[:16] == b"SQLite format 3\x00"
+
+    db.delete_queue("work")
+    db.add_task("After backup", "other")
+    backup.restore(str(path))
+    assert db.count_tasks("work") == 200
+    assert db.list_tasks("other") == []
+
+
+def test_restore_rejects_newer_schema(temp_db, tmp_path):
+    path = tmp_path / "copy.sqlite"
+    backup.backup(str(path))
+    with sqlite3.connect(path) as conn:
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION + 1}")
+    with pytest.raises(DatabaseError, match="newer than the supported version"):
+        backup.restore(str(path))
+    assert db.count_tasks("work") == 200
+
+
+def test_restore_rejects_other_files(temp_db, tmp_path):
+    not_tqu = tmp_path / "other.sqlite"
+    with sqlite3.connect(not_tqu) as conn:
+        conn.execute("CREATE TABLE notes (text TEXT)")
+    with pytest.raises(DatabaseError, match="is not a tqu database"):
+        backup.restore(str(not_tqu))
+
+    garbage = tmp_path / "garbage.sqlite"
+    garbage.write_bytes(b"not a database at all" * 100)
+    with pytest.raises(DatabaseError, match="Failed to restore database"):
+        backup.restore(str(garbage))
+
+
+def test_backup_needs_sqlite():
+    db.set_backend(MemoryBackend())
+    try:
+        with pytest.raises(DatabaseError, match="need a SQLite database"):
+            backup.backup("unused.sqlite")
+    finally:
+        db.set_backend(None)
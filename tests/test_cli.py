@@ -1,6 +1,9 @@
+import json
 import os
 import sqlite3
+import sys
 import tempfile
+import time
 from pathlib import Path
 from unittest import mock
 
@@ -9,12 +12,18 @@ from click.testing import CliRunner
 from rich.console import Console
 
 from tqu import cli, db
+from tqu.backends import SQLiteBackend
+from tqu.backends.sqlite import MaintenanceReport
 from tqu.exceptions import (
+    EXIT_PERMANENT_ERROR,
+    EXIT_QUEUE_FULL,
+    EXIT_TRANSIENT_ERROR,
     DatabaseError,
     EmptyQueueError,
     TaskAlreadyExistsError,
     TaskError,
     TaskNotFoundError,
+    TransientDatabaseError,
 )
 
 
@@ -122,6 +131,65 @@ def test_add_duplicate_task(runner, mock_db, mock_console):
         assert "already exists" in result.output
 
 
+def test_add_task_with_key(runner, mock_db, mock_console):
+    """Test that a retried add with the same key reports the first task's ID and adds nothing."""
+    result = runner.invoke(cli.cli, ["add", "Test task", "--key", "job-7"])
+    assert result.exit_code == 0
+    assert "Added task 1 to 'default' queue" in result.output
+    db.pop_first()
+
+    result = runner.invoke(cli.cli, ["add", "Test task", "--key", "job-7"])
+    assert result.exit_code == 0
+    assert "Task 1 already added with key 'job-7'" in result.output
+    assert "Added" not in result.output
+    assert db.count_tasks() == 0
+
+
+def test_limit_command(runner, mock_db, mock_console):
+    """Test that a limited queue refuses adds with exit code 73 once full."""
+    result = runner.invoke(cli.cli, ["limit", "jobs", "1"])
+    assert result.exit_code == 0
+    assert "holds 0 of at most 1 tasks" in result.output
+    assert runner.invoke(cli.cli, ["add", "Job 1", "jobs"]).exit_code == 0
+
+    result = runner.invoke(cli.cli, ["add", "Job 2", "jobs"])
+    assert result.exit_code == EXIT_QUEUE_FULL
+    assert "Queue 'jobs' is full" in result.output
+
+    result = runner.invoke(cli.cli, ["limit", "jobs", "--clear"])
+    assert "has no limit and holds 1 tasks" in result.output
+    assert runner.invoke(cli.cli, ["add", "Job 2", "jobs"]).exit_code == 0
+
+
+def test_maintain_command(runner, mock_db, mock_console):
+    """Test that maintenance reports what it reclaimed and fails on integrity problems."""
+    result = runner.invoke(cli.cli, ["maintain"])
+    assert result.exit_code == 0
+    assert "Maintained the database in" in result.output
+    assert "integrity ok" in result.output
+
+    report = MaintenanceReport(0.5, 8192, 4096, 1, 3, False, "row 3 missing from index idx_tasks_active")
+    with mock.patch("tqu.db.maintain", return_value=report):
+        result = runner.invoke(cli.cli, ["maintain"])
+    assert result.exit_code == EXIT_PERMANENT_ERROR
+    assert "reclaimed 4,096 bytes (8,192 → 4,096)" in result.output
+    assert "3 unused pages remain" in result.output
+    assert "The WAL is still in use" in result.output
+    assert "Integrity check failed: row 3 missing" in result.output
+
+
+def test_unreadable_database_without_profile(tmp_path, mock_console):
+    """Test that a file that is not a database fails as a permanent error when no profile is set."""
+    garbage = tmp_path / "garbage.sqlite"
+    garbage.write_bytes(b"not a database at all" * 100)
+    with mock.patch.dict(os.environ, {"TQU_DB_PATH": str(garbage)}), mock.patch.dict(db._stored_profiles, clear=True):
+        os.environ.pop("TQU_PROFILE", None)
+        for args in [[], ["add", "Task"]]:
+            with mock.patch("sys.argv", ["tqu", *args]), pytest.raises(SystemExit) as exc:
+                cli.main()
+            assert exc.value.code == EXIT_PERMANENT_ERROR
+
+
 def test_add_task_with_task_error(runner, mock_db, mock_console):
     """Test adding a task with an invalid queue name."""
     with mock.patch("tqu.db.add_task", side_effect=TaskError("Invalid queue name")):
@@ -131,6 +199,50 @@ def test_add_task_with_task_error(runner, mock_db, mock_console):
         assert "Invalid queue name" in result.output
 
 
+def test_add_delayed_task(runner, mock_db, mock_console):
+    """Test that a delayed task is listed as scheduled and cannot be popped yet."""
+    result = runner.invoke(cli.cli, ["add", "Later", "--delay", "1h30m"])
+    assert result.exit_code == 0
+    assert "due" in result.output
+    assert db.list_tasks() == []
+    visible_at = db.list_tasks(scheduled=True)[0]["visible_at"]
+    assert abs(visible_at - (time.time() + 5400)) < 5
+
+    result = runner.invoke(cli.cli, ["list"])
+    assert "No tasks in 'default' queue" in result.output
+    assert "1 scheduled task not yet due" in result.output
+
+    result = runner.invoke(cli.cli, ["list", "--scheduled"])
+    assert "Later" in result.output and "Due" in result.output
+
+    result = runner.invoke(cli.cli, ["pop"])
+    assert "No tasks in 'default' queue" in result.output
+
+
+def test_add_task_at_timestamp(runner, mock_db, mock_console):
+    """Test that --at accepts Unix timestamps and ISO 8601 times."""
+    assert runner.invoke(cli.cli, ["add", "Past", "--at", "1000"]).exit_code == 0
+    assert runner.invoke(cli.cli, ["add", "Future", "--at", "2999-01-01T00:00:00Z"]).exit_code == 0
+    assert [task["task_text"] for task in db.list_tasks()] == ["Past"]
+    assert db.list_tasks(scheduled=True)[0]["visible_at"] == 32472144000
+
+
+@pytest.mark.parametrize(
+    "args, message",
+    [
+        (["--delay", "10x"], "is not a duration"),
+        (["--at", "tomorrow"], "is not a Unix timestamp"),
+        (["--delay", "10m", "--at", "1000"], "cannot be used together"),
+    ],
+)
+def test_add_schedule_errors(runner, mock_db, mock_console, args, message):
+    """Test that invalid schedules are rejected before anything is added."""
+    result = runner.invoke(cli.cli, ["add", "Task", *args])
+    assert result.exit_code == 2
+    assert message in result.output
+    assert db.count_tasks() == 0
+
+
 def test_list_empty_queue(runner, mock_db, mock_console):
     """Test listing tasks from an empty queue."""
     with mock.patch("tqu.db.list_tasks", return_value=[]):
@@ -159,6 +271,112 @@ def test_list_tasks(runner, mock_db, mock_console):
     assert "Task" in result.output
 
 
+def test_list_long_queue_shows_window(runner, mock_db, mock_console):
+    """Test that a long queue renders only its first and last tasks."""
+    for i in range(cli.WINDOW_SIZE * 2 + 10):
+        db.add_task(f"Task {i:03d}")
+
+    result = runner.invoke(cli.cli, ["list"])
+    assert result.exit_code == 0
+    assert "Task 000" in result.output and "Task 019" in result.output
+    assert "Task 020" not in result.output and "Task 029" not in result.output
+    assert "Task 030" in result.output and "Task 049" in result.output
+    assert "10 more tasks" in result.output
+    assert "Showing 40 of 50 tasks" in result.output
+
+    result = runner.invoke(cli.cli, ["list", "--all"])
+    assert "Task 025" in result.output and "more tasks" not in result.output
+
+
+def test_list_pager_fetches_pages_on_demand(runner, mock_db, mock_console):
+    """Test that --page fetches the next page only after a key press."""
+    for i in range(5):
+        db.add_task(f"Task {i}")
+
+    with mock.patch("tqu.db.list_tasks", wraps=db.list_tasks) as list_tasks:
+        result = runner.invoke(cli.cli, ["list", "--page", "2"], input=" q")
+    assert result.exit_code == 0
+    assert "Task 0" in result.output and "Task 3" in result.output
+    assert "Task 4" not in result.output
+    assert "Tasks 3-4 of 5" in result.output
+    assert list_tasks.call_count == 2
+
+
+def test_list_filters(runner, mock_db, mock_console):
+    """Test narrowing a list by age and text, and counting the matches."""
+    now = time.time()
+    with mock.patch("time.time", return_value=now - 3 * 86400):
+        db.add_task("Old invoice")
+    db.add_task("New invoice")
+    db.add_task("Groceries")
+
+    result = runner.invoke(cli.cli, ["list", "--match", "invoice", "--count"])
+    assert (result.exit_code, result.output) == (0, "2\n")
+    result = runner.invoke(cli.cli, ["list", "--older-than", "2d"])
+    assert "Old invoice" in result.output and "New invoice" not in result.output
+    result = runner.invoke(cli.cli, ["list", "--newer-than", "1h", "--match", "Gro*"])
+    assert "Groceries" in result.output and "invoice" not in result.output
+    # --newer-than was called --since; the old name still works, but is not shown in the help
+    result = runner.invoke(cli.cli, ["list", "--since", "1h", "--match", "Gro*"])
+    assert "Groceries" in result.output and "invoice" not in result.output
+    assert "--since" not in runner.invoke(cli.cli, ["list", "--help"]).output
+    result = runner.invoke(cli.cli, ["list", "--since", "1h", "--newer-than", "1h"])
+    assert result.exit_code == 2 and "only one of them" in result.output
+    result = runner.invoke(cli.cli, ["list", "--match", "Bills*"])
+    assert "match the filters" in result.output
+
+
+def test_read_commands_run_while_writer_holds_lock(runner, mock_db, mock_console):
+    """Test that listing never waits for the write lock held by another process."""
+    db.add_task("Task 1")
+    writer = sqlite3.connect(db.get_db_path(), isolation_level=None)
+    writer.execute("BEGIN EXCLUSIVE")
+    try:
+        with mock.patch.dict(os.environ, {"TQU_BUSY_TIMEOUT": "0", "TQU_MAX_RETRIES": "0"}):
+            assert "Task 1" in runner.invoke(cli.cli, ["list"]).output
+            assert "default" in runner.invoke(cli.cli, []).output
+            assert runner.invoke(cli.cli, ["add", "Task 2"]).exit_code == 75
+    finally:
+        writer.execute("ROLLBACK")
+        writer.close()
+
+
+def test_several_databases(runner, mock_db, mock_console, tmp_path):
+    """Test the overview and listing of queues from several databases."""
+    db.add_task("Local task", "inbox")
+    other = SQLiteBackend(str(tmp_path / "other.sqlite"))
+    other.init()
+    other.add_task("Other task", "inbox")
+    options = ["--db", db.get_db_path(), "--db", other.path]
+    local = Path(db.get_db_path()).stem
+
+    result = runner.invoke(cli.cli, options)
+    assert result.exit_code == 0
+    assert f"{local}:inbox" in result.output and "other:inbox" in result.output
+    result = runner.invoke(cli.cli, [*options, "list", "other:inbox"])
+    assert "Other task" in result.output and "Local task" not in result.output
+    result = runner.invoke(
+        cli.cli, ["list", "other:inbox", "--count"], env={"TQU_DB_PATHS": os.pathsep.join(options[1::2])}
+    )
+    assert result.output == "1\n"
+    result = runner.invoke(cli.cli, [*options, "add", "Task"])
+    assert result.exit_code == 2
+    assert "single database" in result.output
+
+
+def test_profile_command(runner, mock_db, mock_console):
+    """Test storing and showing a database's tuning profile."""
+    result = runner.invoke(cli.cli, ["profile"])
+    assert "Profile durable (from default)" in result.output
+    result = runner.invoke(cli.cli, ["profile", "balanced"])
+    assert "Profile balanced (from database)" in result.output
+    result = runner.invoke(cli.cli, ["profile"], env={"TQU_PROFILE": "throughput"})
+    assert "Profile throughput (from TQU_PROFILE)" in result.output
+    assert runner.invoke(cli.cli, ["profile", "fast"]).exit_code == 2
+    result = runner.invoke(cli.cli, ["profile", "--clear"])
+    assert "Profile durable (from default)" in result.output
+
+
 def test_list_tasks_database_error(runner, mock_db, mock_console):
     """Test listing tasks when a database error occurs."""
     with mock.patch("tqu.db.list_tasks", side_effect=DatabaseError("Test DB error")):
@@ -168,6 +386,70 @@ def test_list_tasks_database_error(runner, mock_db, mock_console):
         assert "Test DB error" in result.output
 
 
+def test_list_tasks_transient_error_exit_code(runner, mock_db, mock_console):
+    """Test that a transient database error exits with the temporary failure code."""
+    with mock.patch("tqu.db.list_tasks", side_effect=TransientDatabaseError("database is locked")):
+        result = runner.invoke(cli.cli, ["list"])
+        assert result.exit_code == EXIT_TRANSIENT_ERROR
+        assert "database is locked" in result.output
+
+
+def test_stats_option(runner, mock_db, mock_console, monkeypatch):
+    """Test that --stats prints instrumentation counters."""
+    monkeypatch.setattr("tqu.cli.error_console", mock_console)
+    monkeypatch.setattr("tqu.instrumentation.get_counters", lambda: {"db.retries": 3})
+    result = runner.invoke(cli.cli, ["--stats", "list"])
+    assert result.exit_code == 0
+    assert "db.retries 3" in result.output
+
+
+def test_list_watch_updates_only_on_change(runner, mock_db, mock_console):
+    """Test that list --watch re-queries only when the data version moves."""
+    db.add_task("Task 1")
+    writer = SQLiteBackend(db.get_db_path())
+    ticks = iter([None, lambda: writer.add_task("Task 2", "default"), KeyboardInterrupt()])
+
+    def fake_sleep(_):
+        tick = next(ticks)
+        if isinstance(tick, BaseException):
+            raise tick
+        if tick:
+            tick()
+
+    with mock.patch("tqu.cli.time.sleep", side_effect=fake_sleep):
+        with mock.patch("tqu.db.list_tasks", wraps=db.list_tasks) as list_tasks:
+            result = runner.invoke(cli.cli, ["list", "--watch", "--interval", "0.1"])
+    assert result.exit_code == 0
+    assert list_tasks.call_count == 2
+    assert "Task 2" in result.output
+
+
+def test_watch_overview(runner, mock_db, mock_console):
+    """Test that --watch without a command shows the queue overview until interrupted."""
+    db.add_task("Task 1", "queue1")
+    with mock.patch("tqu.cli.time.sleep", side_effect=KeyboardInterrupt()):
+        result = runner.invoke(cli.cli, ["--watch"])
+    assert result.exit_code == 0
+    assert "queue1" in result.output
+
+
+def test_watch_with_subcommand_is_rejected(runner, mock_db, mock_console):
+    """Test that the group-level --watch is not combined with a subcommand."""
+    result = runner.invoke(cli.cli, ["--watch", "list"])
+    assert result.exit_code == 2
+    assert "tqu list --watch" in result.output
+
+
+@pytest.mark.parametrize("option", [["--count"], ["--page", "5"]])
+def test_list_watch_rejects_count_and_page(runner, mock_db, mock_console, option):
+    """Test that list --watch is not combined with options it would ignore."""
+    with mock.patch("tqu.cli.watch_view") as watch_view:
+        result = runner.invoke(cli.cli, ["list", "--watch", *option])
+    assert result.exit_code == 2
+    assert "cannot be combined" in result.output
+    watch_view.assert_not_called()
+
+
 def test_pop_empty_queue(runner, mock_db, mock_console):
     """Test popping from an empty queue."""
     with mock.patch("tqu.db.pop_last", side_effect=EmptyQueueError("default")):
@@ -251,6 +533,173 @@ def test_delete_queue(runner, mock_db, mock_console):
             raise EmptyQueueError("test_queue")
 
 
+def test_delete_long_queue_shows_window(runner, mock_db, mock_console):
+    """Test that deleting a long queue reports every task but renders only a window."""
+    for i in range(cli.WINDOW_SIZE * 2 + 5):
+        db.add_task(f"Task {i:03d}", "big")
+
+    result = runner.invoke(cli.cli, ["delete", "big"])
+    assert result.exit_code == 0
+    assert "with 45 tasks" in result.output
+    assert "5 more tasks" in result.output
+    assert "Task 022" not in result.output
+    assert db.list_tasks("big") == []
+
+
+def test_rename_queue(runner, mock_db, mock_console):
+    """Test renaming a queue."""
+    db.add_task("Task 1", "old")
+    result = runner.invoke(cli.cli, ["rename", "old", "new"])
+    assert result.exit_code == 0
+    assert "Renamed queue 'old' to 'new'" in result.output
+    assert db.list_tasks("new")[0]["task_text"] == "Task 1"
+
+
+def test_rename_unknown_queue(runner, mock_db, mock_console):
+    """Test renaming a queue that does not exist."""
+    result = runner.invoke(cli.cli, ["rename", "missing", "new"])
+    assert result.exit_code == 1
+    assert "Queue 'missing' not found" in result.output
+
+
+def test_merge_queues(runner, mock_db, mock_console):
+    """Test merging one queue into another."""
+    db.add_task("Task 1", "a")
+    db.add_task("Task 2", "a")
+    db.add_task("Task 2", "b")
+    result = runner.invoke(cli.cli, ["merge", "a", "b"])
+    assert result.exit_code == 0
+    assert "Moved 1 tasks from 'a' to 'b'" in result.output
+    assert "1 already in 'b' were dropped" in result.output
+    assert db.list_queues() == [("b", 2)]
+
+
+def test_pop_random_command(runner, mock_db, mock_console):
+    """Test removing random tasks."""
+    for i in range(3):
+        db.add_task(f"Task {i}")
+    result = runner.invoke(cli.cli, ["poprandom", "-n", "2"])
+    assert result.exit_code == 0
+    assert result.output.count("Removed from 'default' queue") == 2
+    assert db.count_tasks() == 1
+    runner.invoke(cli.cli, ["poprandom"])
+    result = runner.invoke(cli.cli, ["poprandom"])
+    assert result.exit_code == 0
+    assert "No tasks in 'default' queue" in result.output
+
+
+def test_move_command(runner, mock_db, mock_console):
+    """Test moving tasks between pipeline queues."""
+    for i in range(4):
+        db.add_task(f"Task {i}", "inbox")
+    result = runner.invoke(cli.cli, ["move", "inbox", "processing"])
+    assert result.exit_code == 0
+    assert "Moved 1 tasks from 'inbox' to 'processing'" in result.output
+    assert runner.invoke(cli.cli, ["move", "inbox", "processing", "--last", "-n", "2"]).exit_code == 0
+    assert [task["task_text"] for task in db.list_tasks("processing")] == ["Task 0", "Task 2", "Task 3"]
+
+    task_id = db.list_tasks("processing")[0]["id"]
+    assert runner.invoke(cli.cli, ["move", "processing", "done", "--id", str(task_id)]).exit_code == 0
+    assert db.list_tasks("done")[0]["id"] == task_id
+    assert runner.invoke(cli.cli, ["move", "processing", "done", "--all"]).exit_code == 0
+    assert db.list_queues() == [("done", 3), ("inbox", 1)]
+
+    result = runner.invoke(cli.cli, ["move", "processing", "done"])
+    assert result.exit_code == 1
+    assert "No tasks in 'processing' queue" in result.output
+    result = runner.invoke(cli.cli, ["move", "inbox", "done", "--id", "1", "-n", "2"])
+    assert result.exit_code == 2
+
+
+def test_work_command(runner, mock_db, mock_console, tmp_path):
+    """Test running the tasks of a queue as commands."""
+    marker = tmp_path / "marker"
+    db.add_task(str(marker), "jobs")
+    command = [sys.executable, "-c", "import sys; open(sys.argv[1], 'w').close()"]
+
+    result = runner.invoke(cli.cli, ["work", "jobs", "-c", "2", "--", *command])
+    assert result.exit_code == 0
+    assert "Processed 1 tasks" in result.output
+    assert "1 succeeded, 0 failed" in result.output
+    assert marker.exists()
+
+
+def test_work_command_failure_exit_code(runner, mock_db, mock_console):
+    """Test that work exits non-zero when a command fails."""
+    db.add_task("task", "jobs")
+    result = runner.invoke(cli.cli, ["work", "jobs", "--", sys.executable, "-c", "raise SystemExit(3)"])
+    assert result.exit_code == 1
+    assert "exit 3" in result.output
+    assert "0 succeeded, 1 failed" in result.output
+
+
+def test_work_empty_queue(runner, mock_db, mock_console):
+    """Test running work on an empty queue."""
+    result = runner.invoke(cli.cli, ["work", "jobs", "--", "true"])
+    assert result.exit_code == 0
+    assert "No tasks in 'jobs' queue" in result.output
+
+
+def test_metrics_command(runner, mock_db, mock_console, tmp_path):
+    """Test exporting metrics to stdout and to a textfile."""
+    db.add_task("Task 1", "jobs")
+    result = runner.invoke(cli.cli, ["metrics"])
+    assert result.exit_code == 0
+    assert 'tqu_queue_active_tasks{queue="jobs"} 1' in result.output
+
+    output = tmp_path / "tqu.prom"
+    result = runner.invoke(cli.cli, ["metrics", "--output", str(output)])
+    assert result.exit_code == 0
+    assert 'tqu_queue_tasks_added_total{queue="jobs"} 1' in output.read_text()
+
+
+def test_backup_and_restore_commands(runner, mock_db, mock_console, tmp_path):
+    """Test backing up and restoring the database from the CLI."""
+    db.add_task("Task 1", "jobs")
+    destination = tmp_path / "backup.sqlite.gz"
+    result = runner.invoke(cli.cli, ["backup", str(destination)])
+    assert result.exit_code == 0
+    assert "integrity ok" in result.output
+
+    db.pop_first("jobs")
+    result = runner.invoke(cli.cli, ["restore", str(destination)], input="n\n")
+    assert result.exit_code == 0
+    assert db.list_tasks("jobs") == []
+
+    result = runner.invoke(cli.cli, ["restore", str(destination), "--yes"])
+    assert result.exit_code == 0
+    assert "Restored" in result.output
+    assert db.list_tasks("jobs")[0]["task_text"] == "Task 1"
+
+
+def test_restore_prompt_names_db_option(runner, mock_db, mock_console, tmp_path):
+    """Test that restore asks about the database given with --db, not TQU_DB_PATH."""
+    db.add_task("Task 1", "jobs")
+    destination = tmp_path / "backup.sqlite"
+    assert runner.invoke(cli.cli, ["backup", str(destination)]).exit_code == 0
+
+    other = tmp_path / "other.sqlite"
+    result = runner.invoke(cli.cli, ["--db", str(other), "restore", str(destination)], input="n\n")
+    assert result.exit_code == 0
+    assert f"Replace all tasks in {other}" in result.output
+    assert db.get_db_path() not in result.output
+
+
+def test_sync_command(runner, mock_db, mock_console, tmp_path):
+    """Test syncing with another database from the CLI."""
+    other = SQLiteBackend(str(tmp_path / "other.sqlite"))
+    other.init()
+    other.add_task("From other", "jobs")
+    result = runner.invoke(cli.cli, ["sync", other.path])
+    assert result.exit_code == 0
+    assert "pulled" in result.output
+    assert db.list_tasks("jobs")[0]["task_text"] == "From other"
+
+    result = runner.invoke(cli.cli, ["sync", db.get_db_path()])
+    assert result.exit_code == 1
+    assert "with itself" in result.output
+
+
 def test_delete_empty_queue(runner, mock_db, mock_console):
     """Test deleting an empty queue."""
     with mock.patch("tqu.db.delete_queue", side_effect=EmptyQueueError("empty_queue")):
@@ -312,3 +761,48 @@ def test_tqu_error_handling(runner, mock_console):
         with mock.patch("sys.exit") as mock_exit:
             cli.main()
             mock_exit.assert_called_once_with(42)
+
+
+def test_tail_command(runner, mock_db, mock_console):
+    """Test printing the events log from the CLI."""
+    for i in range(12):
+        db.add_task(f"Task {i}", "jobs")
+    db.pop_first("jobs")
+
+    result = runner.invoke(cli.cli, ["tail"])
+    assert result.exit_code == 0
+    lines = result.output.splitlines()
+    assert len(lines) == 10
+    assert lines[-1].split("\t")[2:] == ["complete", "jobs", "1", "Task 0"]
+
+    result = runner.invoke(cli.cli, ["tail", "jobs", "--from", "13", "--json"])
+    assert json.loads(result.output)["kind"] == "complete"
+
+    result = runner.invoke(cli.cli, ["tail", "other"])
+    assert result.output == ""
+
+
+def test_prune_events_command(runner, mock_db, mock_console):
+    """Test removing old events from the CLI."""
+    db.add_task("Task 1")
+    with mock.patch("time.time", return_value=time.time() + 3 * 86400):
+        result = runner.invoke(cli.cli, ["prune-events", "--older-than", "2d"])
+    assert result.exit_code == 0
+    assert "Removed 1 events" in result.output
+    assert db.list_events() == []
+
+
+def test_show_command(runner, mock_db, mock_console):
+    """Test printing the full text of a large task that lists as a preview."""
+    text = "payload " * 500
+    db.add_task(text)
+    task_id = db.list_tasks()[0]["id"]
+    assert text not in runner.invoke(cli.cli, ["list"]).output
+
+    result = runner.invoke(cli.cli, ["show", str(task_id)])
+    assert result.exit_code == 0
+    assert result.output == text + "\n"
+
+    result = runner.invoke(cli.cli, ["show", "999"])
+    assert result.exit_code == 1
+    assert "not found" in result.output
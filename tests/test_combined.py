@@ -0,0 +1,86 @@
+import pytest
+
+from tqu import db
+from tqu.backends import CombinedBackend, SQLiteBackend
+from tqu.backends.combined import attach_limit, source_names
+from tqu.exceptions import DatabaseError, QueueError
+
+
+@pytest.fixture
+def team_paths(tmp_path):
+    paths = []
+    for team, texts in [("team-a", ["A1", "A2"]), ("team-b", ["B1"])]:
+        backend = SQLiteBackend(str(tmp_path / f"{team}.sqlite"))
+        backend.init()
+        for text in texts:
+            backend.add_task(text, "inbox")
+        paths.append(backend.path)
+    return paths
+
+
+def test_source_names():
+    assert source_names(["/a/team.sqlite", "/b/team.sqlite", "/c/other.db"]) == ["team", "team-2", "other"]
+
+
+def test_overview_and_metrics_qualify_queues(team_paths):
+    backend = CombinedBackend(team_paths)
+    backend.init()
+    assert backend.list_queues() == [("team-a:inbox", 2), ("team-b:inbox", 1)]
+    assert [(queue["name"], queue["active"], queue["added"]) for queue in backend.queue_metrics()] == [
+        ("team-a:inbox", 2, 2),
+        ("team-b:inbox", 1, 1),
+    ]
+
+
+def test_list_qualified_queue(team_paths):
+    backend = CombinedBackend(team_paths)
+    assert [task["task_text"] for task in backend.list_tasks("team-a:inbox", match="*2")] == ["A2"]
+    assert backend.count_tasks("team-b:inbox") == 1
+    assert backend.list_tasks("team-c:inbox") == []
+    with pytest.raises(QueueError, match="team-a:inbox"):
+        backend.list_tasks("inbox")
+
+
+def test_one_connection_sees_every_database(team_paths):
+    backend = CombinedBackend(team_paths)
+    with backend.session():
+        version = backend.data_version()
+        SQLiteBackend(team_paths[1]).add_task("B2", "inbox")
+        assert backend.data_version() != version
+        assert backend.list_queues() == [("team-a:inbox", 2), ("team-b:inbox", 2)]
+
+
+def test_combined_backend_is_read_only(team_paths, tmp_path):
+    backend = CombinedBackend(team_paths)
+    with pytest.raises(DatabaseError, match="single --db"):
+        backend.add_task("A3", "team-a:inbox")
+    with pytest.raises(DatabaseError, match="does not exist"):
+        CombinedBackend([*team_paths, str(tmp_path / "missing.sqlite")]).init()
+
+
+@pytest.mark.parametrize("names", [["main", "other"], ["temp", "main"]])
+def test_sources_named_like_sqlite_schemas(tmp_path, names):
+    paths = []
+    for name in names:
+        backend = SQLiteBackend(str(tmp_path / f"{name}.sqlite"))
+        backend.init()
+        backend.add_task(f"Task in {name}", "inbox")
+        paths.append(backend.path)
+    backend = CombinedBackend(paths)
+    backend.init()
+    assert backend.list_queues() == sorted((f"{name}:inbox", 1) for name in names)
+    assert [task["task_text"] for task in backend.list_tasks(f"{names[0]}:inbox")] == [f"Task in {names[0]}"]
+
+
+def test_too_many_databases_are_rejected_before_attaching(team_paths):
+    backend = CombinedBackend(team_paths * attach_limit())
+    with pytest.raises(DatabaseError, match=f"at most {attach_limit()}"):
+        backend.init()
+
+
+def test_databases_routes_db_calls(team_paths):
+    with db.databases(team_paths):
+        assert db.list_queues() == [("team-a:inbox", 2), ("team-b:inbox", 1)]
+    with db.databases(team_paths[:1]):
+        db.add_task("A3", "inbox")
+        assert db.list_queues() == [("inbox", 3)]
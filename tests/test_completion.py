@@ -0,0 +1,119 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import click
+import pytest
+from click.shell_completion import ShellComplete
+
+from tqu import cli, completion, db
+from tqu.backends import SQLiteBackend
+
+
+@pytest.fixture
+def completion_db(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    backend = SQLiteBackend(str(tmp_path / "tasks.sqlite"))
+    backend.init()
+    for text, queue in [("Buy milk", "errands"), ("Call bank", "errands"), ("Fix bug", "work")]:
+        backend.add_task(text, queue)
+    monkeypatch.setenv("TQU_DB_PATH", backend.path)
+    return backend
+
+
+def test_tables_match_the_cli():
+    for name, kinds in completion.COMPLETED_ARGUMENTS.items():
+        command = cli.cli.commands[name]
+        arguments = [param for param in command.params if isinstance(param, click.Argument)]
+        assert [kind or argument.name for kind, argument in zip(kinds, arguments)] == [a.name for a in arguments]
+        value_options = {
+            opt
+            for param in command.params
+            if isinstance(param, click.Option) and not param.is_flag
+            for opt in param.opts
+        }
+        assert value_options == set(completion.VALUE_OPTIONS.get(name, ()))
+    assert {opt for param in cli.cli.params if not param.is_flag for opt in param.opts} == (
+        completion.GROUP_VALUE_OPTIONS
+    )
+
+
+@pytest.mark.parametrize(
+    "args, incomplete, kind",
+    [
+        ([], "po", None),
+        (["pop"], "", "queue"),
+        (["--db", "x.sqlite", "--stats", "popfirst"], "er", "queue"),
+        (["add"], "", None),
+        (["add", "Buy milk"], "", "queue"),
+        (["add", "--delay", "10m", "Buy milk"], "e", "queue"),
+        (["add", "Buy milk", "--key"], "", None),
+        (["add", "Buy milk", "errands"], "", None),
+        (["list"], "--", None),
+        (["list", "--since", "1h"], "", "queue"),
+        (["delete"], "1", "id_or_queue"),
+        (["rename"], "", None),
+    ],
+)
+def test_argument_kind(args, incomplete, kind):
+    assert completion.argument_kind(args, incomplete)[0] == kind
+
+
+def test_cache_is_rebuilt_when_the_database_changes(completion_db):
+    candidates = completion.load_candidates(completion_db.path)
+    assert candidates["queues"] == [["errands", 2], ["work", 1]]
+    cache = completion.cache_path(completion_db.path)
+    assert json.loads(cache.read_text())["version"] == candidates["version"]
+
+    # While the database is unchanged, the cache is used as it is
+    cache.write_text(json.dumps({**candidates, "queues": [["cached", 1]]}))
+    assert completion.load_candidates(completion_db.path)["queues"] == [["cached", 1]]
+
+    completion_db.pop_first("work")
+    assert completion.load_candidates(completion_db.path)["queues"] == [["errands", 2]]
+
+
+def test_completion_items(completion_db):
+    items = completion.completion_items("queue", completion_db.path, "er")
+    assert [(item.value, item.help) for item in items] == [("errands", "2 tasks")]
+    items = completion.completion_items("id_or_queue", completion_db.path, "3")
+    assert [(item.value, item.help) for item in items] == [("3", "work: Fix bug")]
+    assert completion.completion_items("queue", str(Path(completion_db.path).parent / "missing.sqlite"), "") == []
+
+
+def run_completion(shell, words, cword):
+    # fish passes the incomplete word itself rather than its index
+    code = "import sys; from tqu.__main__ import main; main(); print('rich' in sys.modules, file=sys.stderr)"
+    env = {
+        **os.environ,
+        completion.COMPLETE_VAR: f"{shell}_complete",
+        "COMP_WORDS": words,
+        "COMP_CWORD": str(cword),
+        "PYTHONPATH": str(Path(__file__).resolve().parent.parent),
+    }
+    return subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True, check=True)
+
+
+@pytest.mark.parametrize(
+    "shell, expected",
+    [("bash", "plain,errands"), ("zsh", "plain\nerrands\n2 tasks"), ("fish", "plain,errands\t2 tasks")],
+)
+def test_queue_completion_skips_the_cli(completion_db, shell, expected):
+    result = run_completion(shell, "tqu pop" if shell == "fish" else "tqu pop e", "e" if shell == "fish" else 2)
+    assert result.stdout.strip() == expected
+    assert result.stderr.strip() == "False"
+
+
+def test_other_completions_fall_back_to_click(completion_db):
+    # click exits once it has answered, so only its output is checked
+    assert run_completion("bash", "tqu popr", 1).stdout.strip() == "plain,poprandom"
+
+
+def test_click_completes_queues_through_the_cli(completion_db, monkeypatch):
+    monkeypatch.setenv("TQU_DB_PATHS", completion_db.path)
+    comp = ShellComplete(cli.cli, {}, completion.PROG_NAME, completion.COMPLETE_VAR)
+    assert [item.value for item in comp.get_completions(["delete"], "w")] == ["work"]
+    with db.databases([completion_db.path, completion_db.path]):
+        assert [item.value for item in comp.get_completions(["--db", "a", "--db", "b", "pop"], "")] == []
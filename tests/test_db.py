@@ -1,21 +1,43 @@
 import os
+import random
 import shutil
 import sqlite3
 import tempfile
+import threading
 import time
+from collections import Counter
 from pathlib import Path
 from unittest.mock import patch
 
 import pytest
 
-from tqu import db
+from tqu import db, instrumentation
+from tqu.backends import SQLiteBackend
+from tqu.backends.sqlite import (
+    MIGRATIONS,
+    SCHEMA_VERSION,
+    _add_filter_indexes,
+    _add_positions,
+    _add_queue_limits,
+    _task_filters,
+    advance_clock,
+    due_positions,
+    next_position,
+)
 from tqu.exceptions import (
+    EXIT_PERMANENT_ERROR,
+    EXIT_QUEUE_FULL,
+    EXIT_TRANSIENT_ERROR,
     ConfigError,
     DatabaseError,
     EmptyQueueError,
+    PermanentDatabaseError,
+    QueueError,
+    QueueFullError,
     TaskAlreadyExistsError,
     TaskError,
     TaskNotFoundError,
+    TransientDatabaseError,
 )
 
 
@@ -64,6 +86,47 @@ def test_init_db(temp_db):
         assert cursor.fetchone() is not None
 
 
+def test_init_db_migrates_legacy_schema(temp_db):
+    legacy_path = temp_db.parent / "legacy.sqlite"
+    with sqlite3.connect(legacy_path) as conn:
+        conn.execute(
+            "CREATE TABLE tasks (id INTEGER PRIMARY KEY AUTOINCREMENT, queue_name TEXT NOT NULL, "
+            "task_text TEXT NOT NULL, created_at INTEGER NOT NULL, updated_at INTEGER NOT NULL, completed_at INTEGER)"
+        )
+        conn.execute("CREATE INDEX idx_queue_completed ON tasks(queue_name, completed_at)")
+        conn.executemany(
+            "INSERT INTO tasks (queue_name, task_text, created_at, updated_at, completed_at) VALUES (?, ?, 1, 1, ?)",
+            [("work", "Done", 2), ("work", "Active", None), ("home", "Chores", None), ("work", "Removed", 3)],
+        )
+        conn.execute("DELETE FROM tasks WHERE task_text = 'Removed'")
+
+    with patch.dict(os.environ, {"TQU_DB_PATH": str(legacy_path)}):
+        db.init_db()
+        assert db.list_queues() == [("home", 1), ("work", 1)]
+        assert [task["id"] for task in db.list_tasks("work")] == [2]
+        db.add_task("New", "work")
+        # IDs of deleted rows are not handed out again
+        assert db.list_tasks("work")[-1]["id"] == 5
+
+    with sqlite3.connect(legacy_path) as conn:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(tasks)")]
+        assert "queue_id" in columns and "queue_name" not in columns
+        assert "visible_at" in columns and "uid" in columns
+
+
+def test_init_db_rejects_newer_schema(temp_db):
+    with sqlite3.connect(temp_db) as conn:
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION + 1}")
+    with pytest.raises(DatabaseError, match="newer than the supported version"):
+        db.init_db()
+
+
+def test_rename_to_numeric_queue(populated_db):
+    with pytest.raises(QueueError, match="cannot be numeric only"):
+        db.rename_queue("default", "42")
+
+
 def test_init_db_error():
     with patch("sqlite3.connect", side_effect=sqlite3.Error("Connection failed")):
         with pytest.raises(DatabaseError, match="Failed to initialize database"):
@@ -74,7 +137,7 @@ def test_add_task(temp_db):
     assert db.add_task("Test task")
     with sqlite3.connect(temp_db) as conn:
         cursor = conn.cursor()
-        cursor.execute("SELECT task_text FROM tasks WHERE queue_name = 'default'")
+        cursor.execute("SELECT t.task_text FROM tasks t JOIN queues q ON q.id = t.queue_id WHERE q.name = 'default'")
         result = cursor.fetchone()
     assert result and result[0] == "Test task"
 
@@ -83,7 +146,7 @@ def test_add_task_to_custom_queue(temp_db):
     assert db.add_task("Custom queue task", "custom")
     with sqlite3.connect(temp_db) as conn:
         cursor = conn.cursor()
-        cursor.execute("SELECT task_text FROM tasks WHERE queue_name = 'custom'")
+        cursor.execute("SELECT t.task_text FROM tasks t JOIN queues q ON q.id = t.queue_id WHERE q.name = 'custom'")
         result = cursor.fetchone()
     assert result and result[0] == "Custom queue task"
 
@@ -327,3 +390,562 @@ def test_concurrent_operations(temp_db):
 
     assert popped == 50
     assert len(db.list_tasks()) == 50
+
+
+@pytest.fixture
+def counters():
+    instrumentation.reset()
+    yield instrumentation.get_counters
+    instrumentation.reset()
+
+
+def test_transient_error_is_retried(temp_db, counters):
+    real_connect = sqlite3.connect
+    side_effect = [sqlite3.OperationalError("database is locked"), real_connect(str(temp_db))]
+    with patch("sqlite3.connect", side_effect=side_effect), patch("time.sleep") as sleep:
+        assert db.add_task("Retried task")
+    assert sleep.call_count == 1
+    assert counters() == {"db.retries": 1}
+    assert db.list_tasks()[0]["task_text"] == "Retried task"
+
+
+def test_transient_error_retries_are_bounded(temp_db, counters):
+    with patch.dict(os.environ, {"TQU_MAX_RETRIES": "2"}):
+        with patch("sqlite3.connect", side_effect=sqlite3.OperationalError("database is locked")):
+            with patch("time.sleep"):
+                with pytest.raises(TransientDatabaseError, match="Failed to add task: database is locked") as exc:
+                    db.add_task("Never added")
+    assert exc.value.exit_code == EXIT_TRANSIENT_ERROR
+    assert counters() == {"db.retries": 2, "db.retries_exhausted": 1}
+
+
+def test_permanent_error_is_not_retried(temp_db, counters):
+    with patch("sqlite3.connect", side_effect=sqlite3.DatabaseError("file is not a database")):
+        with pytest.raises(PermanentDatabaseError) as exc:
+            db.list_tasks()
+    assert isinstance(exc.value, DatabaseError)
+    assert exc.value.exit_code == EXIT_PERMANENT_ERROR
+    assert counters() == {}
+
+
+def test_busy_timeout_from_env(temp_db):
+    with patch.dict(os.environ, {"TQU_BUSY_TIMEOUT": "0.5", "TQU_MAX_RETRIES": "0"}):
+        backend = db.get_backend()
+    assert isinstance(backend, SQLiteBackend)
+    assert backend.busy_timeout == 0.5 and backend.max_retries == 0
+
+
+@pytest.mark.parametrize(
+    "profile, synchronous, busy_timeout", [(None, 2, 5.0), ("balanced", 1, 5.0), ("throughput", 0, 10.0)]
+)
+def test_profile_sets_connection_pragmas(temp_db, profile, synchronous, busy_timeout):
+    with patch.dict(os.environ, {"TQU_PROFILE": profile} if profile else {}):
+        backend = db.get_backend()
+    assert backend.busy_timeout == busy_timeout
+    conn = backend._connect()
+    assert conn.execute("PRAGMA synchronous").fetchone()[0] == synchronous
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    conn.close()
+
+
+def test_profile_stored_in_database(temp_db, monkeypatch):
+    db.set_profile("throughput")
+    monkeypatch.setattr(db, "_stored_profiles", {})
+    assert db.get_profile() == ("throughput", "database")
+    assert db.get_backend().profile.synchronous == "OFF"
+    with patch.dict(os.environ, {"TQU_PROFILE": "balanced"}):
+        assert db.get_profile() == ("balanced", "TQU_PROFILE")
+    with patch.dict(os.environ, {"TQU_PROFILE": "fast"}), pytest.raises(ConfigError, match="TQU_PROFILE"):
+        db.get_backend()
+    db.set_profile(None)
+    assert db.get_profile() == ("durable", "default")
+
+
+@pytest.mark.parametrize("value", ["soon", "-1"])
+def test_invalid_retry_config(temp_db, value):
+    with patch.dict(os.environ, {"TQU_MAX_RETRIES": value}):
+        with pytest.raises(ConfigError, match="TQU_MAX_RETRIES"):
+            db.get_backend()
+
+
+def test_init_db_enables_wal(temp_db):
+    with sqlite3.connect(temp_db) as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+
+def test_read_only_reads_while_writer_holds_lock(populated_db):
+    writer = sqlite3.connect(populated_db, isolation_level=None)
+    writer.execute("BEGIN EXCLUSIVE")
+    writer.execute("UPDATE tasks SET completed_at = 1")
+    try:
+        with patch.dict(os.environ, {"TQU_BUSY_TIMEOUT": "0", "TQU_MAX_RETRIES": "0"}), db.read_only():
+            db.init_db()
+            assert [task["task_text"] for task in db.list_tasks()] == ["Task 1", "Task 2"]
+            assert db.find_by_id_or_name("1") == (True, 1)
+    finally:
+        writer.execute("ROLLBACK")
+        writer.close()
+
+    with db.read_only(), pytest.raises(DatabaseError, match="readonly"):
+        db.add_task("Task 3")
+    assert db.add_task("Task 3")
+
+
+def test_retried_keyed_add_skips_the_write_lock(temp_db):
+    task_id = db.add_task("Task 1", key="producer-1").task_id
+    writer = sqlite3.connect(temp_db, isolation_level=None)
+    writer.execute("BEGIN EXCLUSIVE")
+    try:
+        with patch.dict(os.environ, {"TQU_BUSY_TIMEOUT": "0", "TQU_MAX_RETRIES": "0"}):
+            assert db.add_task("Task 1", key="producer-1") == (task_id, True)
+            with pytest.raises(TransientDatabaseError):
+                db.add_task("Task 2", key="producer-2")
+    finally:
+        writer.execute("ROLLBACK")
+        writer.close()
+    with sqlite3.connect(temp_db) as conn:
+        plan = conn.execute("EXPLAIN QUERY PLAN SELECT task_id FROM task_keys WHERE key = ?", ("k",)).fetchall()
+    assert "PRIMARY KEY" in plan[0][3]
+
+
+def test_key_retention_from_env(temp_db, monkeypatch):
+    now = [1_700_000_000.0]
+    monkeypatch.setattr("time.time", lambda: now[0])
+    with patch.dict(os.environ, {"TQU_KEY_RETENTION": "0"}):
+        task_id = db.add_task("Task 1", key="producer-1").task_id
+        db.pop_first()
+        assert db.add_task("Task 1", key="producer-1") == (task_id, True)
+        now[0] += 1
+        assert db.add_task("Task 1", key="producer-1").task_id > task_id
+    with pytest.raises(TaskError, match="empty"):
+        db.add_task("Task 2", key="")
+
+
+@pytest.mark.parametrize(
+    "mutation",
+    [lambda: db.pop_first(), lambda: db.pop_last(), lambda: db.claim_tasks(limit=2), lambda: db.delete_task(1)],
+)
+def test_mutations_find_and_complete_in_one_statement(populated_db, mutation):
+    statements = []
+    with db.session() as backend:
+        backend._pinned.set_trace_callback(statements.append)
+        mutation()
+    # The UPDATE ... RETURNING, then one insert per logged event; triggers are traced as "-- TRIGGER name"
+    kinds = [statement.split()[0] for statement in statements if not statement.startswith(("BEGIN", "COMMIT"))]
+    kinds = [kind for kind in kinds if kind != "--"]
+    assert kinds[0] == "UPDATE" and set(kinds[1:]) == {"INSERT"}
+
+
+def test_add_waits_for_room_in_full_queue(temp_db):
+    db.set_queue_limit("jobs", 1)
+    db.add_task("Job 1", "jobs")
+    with pytest.raises(QueueFullError) as exc:
+        db.add_task("Job 2", "jobs", wait=0.2)
+    assert exc.value.exit_code == EXIT_QUEUE_FULL
+
+    consumer = threading.Timer(0.3, lambda: SQLiteBackend(str(temp_db)).pop_first("jobs"))
+    consumer.start()
+    start = time.monotonic()
+    assert db.add_task("Job 2", "jobs", wait=10)
+    assert 0.2 < time.monotonic() - start < 5
+    consumer.join()
+    assert db.queue_limit("jobs") == (1, 1)
+
+
+def old_database(path, migrations, tasks):
+    # An older schema with queues "default" and "project" and tasks as (queue_id, text, created_at, completed_at)
+    with sqlite3.connect(path) as conn:
+        for migration in MIGRATIONS[:migrations]:
+            migration(conn)
+        conn.execute(f"PRAGMA user_version = {migrations}")
+        conn.executemany("INSERT INTO queues (id, name) VALUES (?, ?)", [(1, "default"), (2, "project")])
+        conn.executemany(
+            """
+            INSERT INTO tasks (queue_id, task_text, created_at, updated_at, completed_at, uid)
+            VALUES (?, ?, ?, ?, ?, lower(hex(randomblob(16))))
+        """,
+            [
+                (queue_id, text, created_at, created_at, completed_at)
+                for queue_id, text, created_at, completed_at in tasks
+            ],
+        )
+
+
+def test_migration_counts_active_tasks(temp_db):
+    # Before queue limits
+    tasks = [(1, "Task 1", 1, 2), (1, "Task 2", 1, None), (2, "Project task", 1, None), (2, "Another", 1, None)]
+    old_database(temp_db.parent / "old.sqlite", MIGRATIONS.index(_add_queue_limits), tasks)
+    with patch.dict(os.environ, {"TQU_DB_PATH": str(temp_db.parent / "old.sqlite")}):
+        db.init_db()
+        assert db.list_queues() == [("default", 1), ("project", 2)]
+        assert db.queue_limit("project") == (None, 2)
+        assert [(queue["added"], queue["completed"]) for queue in db.queue_metrics()] == [(2, 1), (2, 0)]
+
+
+def test_read_only_init_creates_missing_database(temp_db):
+    path = temp_db.parent / "new.sqlite"
+    with patch.dict(os.environ, {"TQU_DB_PATH": str(path)}), db.read_only():
+        db.init_db()
+        assert db.list_queues() == []
+    with sqlite3.connect(path) as conn:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+
+
+def test_iter_events_resumes_from_offset(populated_db):
+    events = list(db.iter_events())
+    assert [event["kind"] for event in events] == ["add"] * 4
+    db.pop_first("project")
+    (event,) = db.iter_events(events[-1]["seq"] + 1)
+    assert (event["kind"], event["task_text"]) == ("complete", "Project task")
+
+
+def test_iter_events_pages_through_large_logs(temp_db, monkeypatch):
+    monkeypatch.setattr(db, "EVENT_BATCH_SIZE", 3)
+    for i in range(7):
+        db.add_task(f"Task {i}")
+    assert [event["task_text"] for event in db.iter_events(queue_name="default")] == [f"Task {i}" for i in range(7)]
+
+
+def test_iter_events_follow_waits_for_other_writers(temp_db):
+    writer = SQLiteBackend(str(temp_db))
+    ticks = iter([None, lambda: writer.add_task("From another process", "default")])
+
+    def fake_sleep(_):
+        tick = next(ticks)
+        if tick:
+            tick()
+
+    with patch("tqu.db.time.sleep", side_effect=fake_sleep):
+        events = db.iter_events(follow=True)
+        assert next(events)["task_text"] == "From another process"
+        events.close()
+
+
+def test_iter_tasks_pages_through_filtered_queue(temp_db, monkeypatch):
+    monkeypatch.setattr(db, "TASK_BATCH_SIZE", 3)
+    for i in range(8):
+        db.add_task(f"Task {i}" if i % 2 else f"Other {i}")
+    assert [task["task_text"] for task in db.iter_tasks(match="Task*")] == ["Task 1", "Task 3", "Task 5", "Task 7"]
+
+
+@pytest.mark.parametrize(
+    "filters",
+    [{"created_after": 1}, {"created_before": 1}, {"created_after": 1, "created_before": 2}, {"match": "Task*"}, {}],
+)
+def test_filtered_counts_use_covering_index(temp_db, filters):
+    filters = {"created_after": None, "created_before": None, "match": None, **filters}
+    db.init_db()
+    where, params = _task_filters("default", False, **filters)
+    with sqlite3.connect(temp_db) as conn:
+        plan = conn.execute(f"EXPLAIN QUERY PLAN SELECT COUNT(*) FROM tasks WHERE {where}", params).fetchall()
+    assert any("COVERING INDEX" in row[-1] for row in plan)
+
+
+def test_text_index_holds_prefixes_and_hashes(temp_db):
+    stem = "Process file /data/incoming/"
+    for i in range(3):
+        db.add_task(f"{stem}{i}.csv")
+    db.add_task("Überweisung prüfen")
+    with pytest.raises(TaskAlreadyExistsError):
+        db.add_task(f"{stem}1.csv")
+    assert [task["task_text"] for task in db.list_tasks(match=f"{stem}1*")] == [f"{stem}1.csv"]
+    assert db.count_tasks(match="Process*") == 3
+    assert db.count_tasks(match="Üb*") == 1
+
+    where, params = _task_filters("default", False, None, None, "Process*")
+    with sqlite3.connect(temp_db) as conn:
+        plan = conn.execute(f"EXPLAIN QUERY PLAN SELECT COUNT(*) FROM tasks WHERE {where}", params).fetchall()
+        assert "USING INDEX idx_queue_text" in plan[0][-1]
+        # The index keeps 16 characters of each text, not the whole text
+        (sql,) = conn.execute("SELECT sql FROM sqlite_master WHERE name = 'idx_queue_text'").fetchone()
+        assert "substr(task_text, 1, 16), text_key" in sql
+
+
+def test_migration_adds_text_keys(temp_db):
+    path = temp_db.parent / "old.sqlite"
+    old_database(path, MIGRATIONS.index(_add_filter_indexes), [(1, "Task 1", 1, None), (1, "Task 2", 1, 2)])
+    with patch.dict(os.environ, {"TQU_DB_PATH": str(path)}):
+        db.init_db()
+        with pytest.raises(TaskAlreadyExistsError):
+            db.add_task("Task 1")
+        assert db.release_task(2)
+        assert db.list_tasks(match="Task*")[1]["task_text"] == "Task 2"
+
+
+def test_random_probes_seek_the_active_id_index(temp_db):
+    with sqlite3.connect(temp_db) as conn:
+        plan = conn.execute(
+            "EXPLAIN QUERY PLAN SELECT id, visible_at FROM tasks "
+            "WHERE queue_id = ? AND completed_at IS NULL AND id >= ? ORDER BY id ASC LIMIT 1",
+            (1, 1),
+        ).fetchall()
+    assert [row[-1] for row in plan] == [
+        "SEARCH tasks USING COVERING INDEX idx_queue_active_id (queue_id=? AND completed_at=? AND id>?)"
+    ]
+
+
+def test_random_picks_are_uniform_when_ids_are_sparse(temp_db):
+    # Another queue's tasks leave a long gap before the second task, and scheduled tasks one before the third
+    db.add_task("First", "picks")
+    for i in range(200):
+        db.add_task(f"Other {i}", "other")
+    db.add_task("Second", "picks")
+    for i in range(50):
+        db.add_task(f"Later {i}", "picks", visible_at=int(time.time()) + 3600)
+    db.add_task("Third", "picks")
+    now = int(time.time())
+    random.seed(7)
+    with sqlite3.connect(temp_db) as conn:
+        queue_id = conn.execute("SELECT id FROM queues WHERE name = 'picks'").fetchone()[0]
+        picks = Counter(SQLiteBackend._random_task_id(conn.cursor(), queue_id, now) for _ in range(3000))
+    assert sorted(picks) == [1, 202, 253]
+    assert all(800 < count < 1200 for count in picks.values())
+
+
+@pytest.mark.parametrize("order", ["position ASC, id ASC", "position DESC, id DESC"])
+def test_pops_seek_the_end_of_due_tasks_in_the_position_index(temp_db, order):
+    with sqlite3.connect(temp_db) as conn:
+        plan = conn.execute(
+            "EXPLAIN QUERY PLAN SELECT id FROM tasks "
+            f"WHERE queue_id = ? AND completed_at IS NULL AND visible_at <= ? AND {due_positions()} "
+            f"ORDER BY {order} LIMIT 1",
+            (1, 1, 1),
+        ).fetchall()
+    assert plan[0][-1] == (
+        "SEARCH tasks USING COVERING INDEX idx_queue_position (queue_id=? AND completed_at=? AND position<?)"
+    )
+
+
+@pytest.mark.parametrize("pop", ["pop_first", "pop_last"])
+def test_pops_do_not_step_over_scheduled_tasks(temp_db, pop):
+    backend = db.get_backend()
+    now = int(time.time())
+    for i in range(1000):
+        backend.add_task(f"Scheduled {i}", "busy", visible_at=now + 60 + i)
+    for queue in ("idle", "busy"):
+        backend.add_task("Due 1", queue)
+        backend.add_task("Due 2", queue)
+    steps = []
+
+    def count_step():
+        steps[-1] += 1
+        return 0
+
+    with backend.session():
+        backend._pinned.set_progress_handler(count_step, 1)
+        for queue in ("idle", "busy"):
+            steps.append(0)
+            getattr(backend, pop)(queue)
+    # SQLite runs as many instructions with a thousand scheduled tasks in the queue as with none
+    assert steps[1] <= steps[0] + 10
+
+
+@pytest.mark.parametrize(
+    "call",
+    [
+        lambda backend, queue, first: backend.list_tasks(queue, limit=20, after_id=first, newest=True),
+        lambda backend, queue, first: backend.list_tasks(queue, limit=20, after_id=first),
+        lambda backend, queue, first: backend.count_tasks(queue),
+    ],
+    ids=["tail", "next-page", "count"],
+)
+def test_list_views_do_not_step_over_the_queue(temp_db, call):
+    backend = db.get_backend()
+    first = {}
+    for queue, length in (("short", 25), ("long", 500)):
+        first[queue] = backend.add_task("Task 0", queue).task_id
+        for i in range(1, length):
+            backend.add_task(f"Task {i}", queue)
+    steps = []
+
+    def count_step():
+        steps[-1] += 1
+        return 0
+
+    with backend.session():
+        backend._pinned.set_progress_handler(count_step, 1)
+        for queue in ("short", "long"):
+            steps.append(0)
+            call(backend, queue, first[queue])
+    # Tails, pages after a task and unfiltered counts cost the same in a queue twenty times longer
+    assert steps[1] <= steps[0] + 10
+
+
+def test_pop_writes_one_page_per_active_task_index(temp_db):
+    for i in range(500):
+        db.add_task(f"Task {i}")
+    with db.session(), sqlite3.connect(temp_db) as checkpointer:
+        checkpointer.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        db.pop_first()
+        _, pages, _ = checkpointer.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+    # The task, two in idx_queue_completed and idx_updated_at each, one in each active-only index,
+    # the event and its two index entries, the queue's counters and the event sequence
+    assert pages <= 14
+
+
+def test_created_at_stays_wall_clock_time(temp_db, monkeypatch):
+    monkeypatch.setattr("time.time", lambda: 1_700_000_000.0)
+    db.add_task("Task 1")
+    # After a sync with a peer whose clock runs an hour fast, positions run ahead of the wall clock
+    with sqlite3.connect(temp_db) as conn:
+        advance_clock(conn.cursor(), 1_700_003_600_000_000)
+    db.add_task("Task 2")
+    monkeypatch.setattr("time.time", lambda: 1_700_000_060.0)
+    assert [task["created_at"] for task in db.list_tasks()] == [1_700_000_000, 1_700_000_000]
+    assert db.count_tasks(created_before=1_700_000_030) == 2
+    assert db.count_tasks(created_after=1_700_000_030) == 0
+    assert db.queue_metrics()[0]["oldest"] == 1_700_000_000
+
+
+def test_large_texts_are_stored_compressed(temp_db):
+    text = "line of a large payload\n" * 200
+    db.add_task(text, "bulk")
+    with sqlite3.connect(temp_db) as conn:
+        stored, text_hash = conn.execute("SELECT task_text, text_hash FROM tasks").fetchone()
+        (size,) = conn.execute("SELECT length(data) FROM payloads").fetchone()
+    assert stored.endswith("…") and len(text_hash) == 32
+    assert size < len(text) / 10
+    assert db.list_events()[0]["task_text"] == stored
+    assert db.delete_queue("bulk")[0]["task_text"] == stored
+
+
+def test_only_tasks_handed_out_read_their_payload(temp_db):
+    for i in range(4):
+        db.add_task(f"Task {i} " + "z" * 2000, "bulk")
+    backend = db.get_backend()
+    tables = []
+
+    def record_reads(action, table, *args):
+        if action == sqlite3.SQLITE_READ:
+            tables.append(table)
+        return sqlite3.SQLITE_OK
+
+    with backend.session():
+        backend._pinned.set_authorizer(record_reads)
+        backend.delete_task(1)
+        assert "payloads" not in tables
+        assert backend.pop_first("bulk")["task_text"].startswith("Task 1 zzz")
+        assert "payloads" in tables
+        tables.clear()
+        assert len(backend.delete_queue("bulk")) == 2
+        assert "payloads" not in tables
+
+
+def test_migration_compresses_existing_large_texts(temp_db):
+    text = "y" * 5000
+    old_path = temp_db.parent / "v5.sqlite"
+    with sqlite3.connect(old_path) as conn:
+        for migration in MIGRATIONS[:5]:
+            migration(conn)
+        conn.execute("PRAGMA user_version = 5")
+        conn.execute("INSERT INTO queues (id, name) VALUES (1, 'default')")
+        conn.execute(
+            "INSERT INTO tasks (queue_id, task_text, created_at, updated_at, uid) VALUES (1, ?, 1, 1, 'a')", (text,)
+        )
+
+    with patch.dict(os.environ, {"TQU_DB_PATH": str(old_path)}):
+        db.init_db()
+        assert db.list_tasks()[0]["task_text"] == "y" * 79 + "…"
+        with pytest.raises(TaskAlreadyExistsError):
+            db.add_task(text)
+        assert db.pop_first()["task_text"] == text
+
+
+def fill_and_prune(count):
+    for i in range(count):
+        db.add_task(f"Task {i} " + "x" * 900)
+    db.pop_random(limit=count)
+    # Completed tasks stay in the table, so free pages come from the pruned events log
+    assert db.prune_events(-1) == 2 * count
+
+
+def test_maintain_reclaims_free_pages_and_truncates_wal(temp_db):
+    fill_and_prune(200)
+    report = db.maintain()
+    assert report.vacuumed_pages > 0 and report.free_pages == 0
+    assert report.checkpointed and report.integrity == "ok"
+    assert report.reclaimed == report.size_before - report.size_after > 0
+    # Nothing is left in the WAL, if it still exists at all
+    assert report.size_after == temp_db.stat().st_size
+    with sqlite3.connect(temp_db) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM sqlite_stat1").fetchone()[0] > 0
+
+
+def test_maintain_vacuum_converts_older_databases(temp_db):
+    with sqlite3.connect(temp_db, isolation_level=None) as conn:
+        # As created by tqu versions before maintenance, without auto_vacuum
+        conn.execute("PRAGMA auto_vacuum = NONE")
+        conn.execute("VACUUM")
+    fill_and_prune(200)
+    report = db.maintain()
+    assert report.vacuumed_pages == 0 and report.free_pages > 0
+    report = db.maintain(vacuum=True)
+    assert report.vacuumed_pages > 0 and report.free_pages == 0
+    with sqlite3.connect(temp_db) as conn:
+        assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+
+
+def test_maintenance_every_n_changes(temp_db, counters, monkeypatch):
+    monkeypatch.setenv("TQU_MAINTAIN_EVERY", "3")
+    db.add_task("Task 1")
+    db.add_task("Task 2")
+    assert counters() == {}
+    db.pop_first()
+    assert counters() == {"db.maintenance_runs": 1}
+    assert db.get_backend().changes_since_maintenance() == 0
+
+    with patch.object(SQLiteBackend, "maintain", side_effect=TransientDatabaseError("database is locked")):
+        db.add_task("Task 3")
+        db.add_task("Task 4")
+        # The write committed even though maintenance after it failed
+        assert db.add_task("Task 5")
+    assert counters()["db.maintenance_failures"] == 1
+    assert db.count_tasks() == 4
+
+
+def test_maintain_needs_sqlite():
+    with db.databases([db.MEMORY_DB_PATH]), pytest.raises(ConfigError, match="Maintenance applies"):
+        db.maintain()
+
+
+def test_migration_orders_existing_tasks_by_creation(temp_db):
+    # Before positions: Task 2 was added in the same second as Task 1, the project tasks a second earlier
+    path = temp_db.parent / "old.sqlite"
+    tasks = [(1, "Task 1", 1000, None), (1, "Task 2", 1000, None), (2, "Project task", 999, None)]
+    old_database(path, MIGRATIONS.index(_add_positions), [*tasks, (2, "Another project task", 999, None)])
+    with patch.dict(os.environ, {"TQU_DB_PATH": str(path)}):
+        db.init_db()
+        with sqlite3.connect(path) as conn:
+            rows = conn.execute("SELECT task_text, position FROM tasks ORDER BY position").fetchall()
+            assert rows == [
+                ("Project task", 999_000_000),
+                ("Another project task", 999_000_001),
+                ("Task 1", 1_000_000_000),
+                ("Task 2", 1_000_000_001),
+            ]
+            assert conn.execute("SELECT value FROM meta WHERE key = 'clock'").fetchone()[0] == "1000000001"
+        assert db.pop_first()["task_text"] == "Task 1"
+        db.add_task("Task 3")
+        assert db.pop_last()["task_text"] == "Task 3"
+
+
+def test_migration_places_scheduled_tasks_at_their_due_time(temp_db):
+    path = temp_db.parent / "old.sqlite"
+    old_database(path, MIGRATIONS.index(_add_positions), [(1, "Scheduled", 1000, None), (1, "Task", 1000, None)])
+    with sqlite3.connect(path) as conn:
+        conn.execute("UPDATE tasks SET visible_at = 2000 WHERE task_text = 'Scheduled'")
+    with patch.dict(os.environ, {"TQU_DB_PATH": str(path)}):
+        db.init_db()
+        with sqlite3.connect(path) as conn:
+            rows = conn.execute("SELECT task_text, position FROM tasks ORDER BY position").fetchall()
+            assert rows == [("Task", 1_000_000_001), ("Scheduled", 2_000_000_000)]
+            assert conn.execute("SELECT value FROM meta WHERE key = 'clock'").fetchone()[0] == "1000000001"
+
+
+def test_positions_increase_when_the_clock_steps_back(temp_db):
+    with sqlite3.connect(temp_db) as conn:
+        with patch("time.time", return_value=1_700_000_000.5):
+            first = next_position(conn.cursor())
+        with patch("time.time", return_value=1_699_999_999.0):
+            second = next_position(conn.cursor())
+    assert (first, second) == (1_700_000_000_500_000, 1_700_000_000_500_001)
@@ -0,0 +1,79 @@
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+from tqu import db, instrumentation, metrics
+from tqu.backends import MemoryBackend
+
+
+@pytest.fixture
+def backend():
+    instance = MemoryBackend()
+    db.set_backend(instance)
+    instrumentation.reset()
+    yield instance
+    db.set_backend(None)
+    instrumentation.reset()
+
+
+@pytest.fixture
+def populated(backend):
+    db.add_task("Task 1", "default")
+    db.add_task("Task 2", "default")
+    db.add_task('Say "hi"', 'quote"d')
+    db.pop_first("default")
+    return backend
+
+
+def test_render_queue_metrics(populated):
+    oldest = db.list_tasks("default")[0]["created_at"]
+    text = metrics.render_metrics(now=oldest + 30)
+    assert "# TYPE tqu_queue_active_tasks gauge" in text
+    assert 'tqu_queue_active_tasks{queue="default"} 1' in text
+    assert 'tqu_queue_oldest_task_age_seconds{queue="default"} 30' in text
+    assert "# TYPE tqu_queue_tasks_added_total counter" in text
+    assert 'tqu_queue_tasks_added_total{queue="default"} 2' in text
+    assert 'tqu_queue_tasks_completed_total{queue="default"} 1' in text
+    assert 'tqu_queue_active_tasks{queue="quote\\"d"} 1' in text
+
+
+def test_render_operation_histograms(populated):
+    text = metrics.render_metrics()
+    assert "# TYPE tqu_operation_duration_seconds histogram" in text
+    assert 'tqu_operation_duration_seconds_count{operation="db.add_task"} 3' in text
+    assert 'tqu_operation_duration_seconds_bucket{operation="db.add_task",le="+Inf"} 3' in text
+
+
+def test_histogram_buckets_are_cumulative(backend):
+    instrumentation.observe("op", 0.0001)
+    instrumentation.observe("op", 0.2)
+    instrumentation.observe("op", 10)
+    histogram = instrumentation.get_histograms()["op"]
+    buckets = dict(histogram["buckets"])
+    assert buckets[0.0005] == 1 and buckets[0.25] == 2 and buckets[float("inf")] == 3
+    assert histogram["count"] == 3 and histogram["sum"] == pytest.approx(10.2001)
+
+
+def test_write_textfile(populated, tmp_path):
+    path = tmp_path / "tqu.prom"
+    metrics.write_textfile(str(path))
+    assert 'tqu_queue_active_tasks{queue="default"} 1' in path.read_text()
+    assert [p.name for p in tmp_path.iterdir()] == ["tqu.prom"]
+
+
+def test_http_endpoint(populated):
+    server = metrics.make_server("127.0.0.1", 0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+        with urllib.request.urlopen(f"{url}/metrics") as response:
+            assert response.headers["Content-Type"] == metrics.CONTENT_TYPE
+            assert 'tqu_queue_active_tasks{queue="default"} 1' in response.read().decode()
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(f"{url}/other")
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,10 @@
+from stress import run_stress
+
+
+def test_concurrent_producers_and_consumers_deliver_exactly_once(tmp_path):
+    report = run_stress(str(tmp_path / "stress.sqlite"), producers=3, consumers=3, duration=2.0)
+    assert report["added"] > 0
+    assert report["consumed"] > 0
+    assert report["duplicated"] == []
+    assert report["lost"] == []
+    assert report["unexpected"] == []
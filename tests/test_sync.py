@@ -0,0 +1,268 @@
+import shutil
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from tqu import db, sync
+from tqu.backends import MemoryBackend, SQLiteBackend
+from tqu.exceptions import EXIT_TRANSIENT_ERROR, DatabaseError, TaskAlreadyExistsError, TransientDatabaseError
+
+
+@pytest.fixture
+def local(tmp_path, monkeypatch):
+    path = tmp_path / "laptop.sqlite"
+    monkeypatch.setenv("TQU_DB_PATH", str(path))
+    db.init_db()
+    return path
+
+
+@pytest.fixture
+def other(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / "workstation.sqlite"))
+    backend.init()
+    return backend
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_700_000_000.0]
+    monkeypatch.setattr("time.time", lambda: now[0])
+    return now
+
+
+def texts(backend, queue="default"):
+    return [task["task_text"] for task in backend.list_tasks(queue)]
+
+
+def test_sync_exchanges_tasks_with_colliding_ids(local, other):
+    db.add_task("Laptop task")
+    other.add_task("Workstation task", "default")
+    assert db.list_tasks()[0]["id"] == other.list_tasks("default")[0]["id"]
+
+    result = sync.sync(other.path)
+    assert (result.pulled, result.pushed, result.duplicates) == (1, 1, 0)
+    assert sorted(texts(db.get_backend())) == ["Laptop task", "Workstation task"]
+    assert sorted(texts(other)) == ["Laptop task", "Workstation task"]
+    assert db.queue_limit("default") == other.queue_limit("default") == (None, 2)
+    assert [(event["kind"], event["task_text"]) for event in db.list_events()][-1] == ("add", "Workstation task")
+
+
+def test_sync_only_reads_changes_since_last_sync(local, other, clock):
+    for i in range(50):
+        db.add_task(f"Task {i}")
+    sync.sync(other.path)
+
+    clock[0] += 10
+    db.pop_first()
+    other.add_task("New on workstation", "default")
+    result = sync.sync(other.path)
+    assert (result.pulled, result.pushed) == (1, 1)
+    assert texts(other)[0] == "Task 1"
+    assert texts(db.get_backend())[-1] == "New on workstation"
+
+    # The other database recorded the sync too, so syncing from its side is incremental as well
+    clock[0] += 10
+    result = sync.sync(other.path)
+    assert (result.pulled, result.pushed) == (0, 0)
+
+
+@pytest.mark.parametrize("write", [lambda: db.add_task("Late"), lambda: db.pop_first()])
+def test_writer_waiting_for_the_lock_during_a_sync_is_synced_later(local, other, clock, write):
+    db.add_task("Early")
+    db.add_task("Queued")
+    sync.sync(other.path)
+
+    # A sync holds the write lock while a writer waits for it across a second boundary
+    conn = sqlite3.connect(local, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute(f"ATTACH DATABASE ? AS {sync.PEER}", (other.path,))
+    conn.execute("BEGIN IMMEDIATE")
+    clock[0] += 1
+    writer = threading.Thread(target=write)
+    writer.start()
+    time.sleep(0.3)
+    clock[0] += 1
+    conn.execute("UPDATE tasks SET updated_at = ? WHERE task_text = 'Early'", (int(clock[0]),))
+    exchange = sync._exchange(conn)
+    conn.execute("COMMIT")
+    sync._record_watermarks(conn, exchange)
+    conn.close()
+    writer.join()
+
+    sync.sync(other.path)
+    assert texts(other) == texts(db.get_backend())
+
+
+def test_sync_that_lost_one_side_of_the_exchange_is_repaired_by_the_next(local, other, clock, monkeypatch):
+    db.add_task("Laptop task")
+    other.add_task("Workstation task", "default")
+    snapshot = sqlite3.connect(":memory:")
+    with sqlite3.connect(other.path) as conn:
+        conn.backup(snapshot)
+
+    # A crash after the exchange committed on the laptop but before the workstation's half reached its disk
+    def crash(conn, exchange):
+        raise sqlite3.OperationalError("disk I/O error")
+
+    record_watermarks = sync._record_watermarks
+    monkeypatch.setattr(sync, "_record_watermarks", crash)
+    with pytest.raises(DatabaseError):
+        sync.sync(other.path)
+    with sqlite3.connect(other.path) as conn:
+        snapshot.backup(conn)
+    assert texts(other) == ["Workstation task"]
+
+    # Neither watermark moved, so the laptop's task is pushed again
+    monkeypatch.setattr(sync, "_record_watermarks", record_watermarks)
+    clock[0] += 10
+    sync.sync(other.path)
+    assert sorted(texts(other)) == sorted(texts(db.get_backend())) == ["Laptop task", "Workstation task"]
+    clock[0] += 10
+    result = sync.sync(other.path)
+    assert (result.pulled, result.pushed) == (0, 0)
+
+
+def test_sync_with_a_locked_peer_is_a_transient_error(local, other, monkeypatch):
+    monkeypatch.setenv("TQU_BUSY_TIMEOUT", "0.05")
+    monkeypatch.setenv("TQU_MAX_RETRIES", "1")
+    db.add_task("Laptop task")
+    writer = sqlite3.connect(other.path, isolation_level=None)
+    writer.execute("BEGIN IMMEDIATE")
+    try:
+        with pytest.raises(TransientDatabaseError) as error:
+            sync.sync(other.path)
+    finally:
+        writer.execute("ROLLBACK")
+        writer.close()
+    assert error.value.exit_code == EXIT_TRANSIENT_ERROR
+    assert texts(other) == []
+
+
+def test_pulled_tasks_take_their_place_in_the_queue(local, other, clock):
+    db.add_task("Laptop 1")
+    clock[0] += 0.25
+    other.add_task("Workstation 1", "default")
+    clock[0] += 0.25
+    db.add_task("Laptop 2")
+    sync.sync(other.path)
+    assert texts(db.get_backend()) == texts(other) == ["Laptop 1", "Workstation 1", "Laptop 2"]
+
+    # Positions handed out after a sync follow the pulled ones, even if the clock is behind them
+    clock[0] -= 10
+    other.add_task("Workstation 2", "default")
+    assert other.pop_last("default")["task_text"] == "Workstation 2"
+
+
+def test_pulled_scheduled_tasks_leave_the_clock_alone(local, other, clock):
+    other.add_task("Next week", "default", visible_at=int(clock[0]) + 7 * 86400)
+    sync.sync(other.path)
+    db.add_task("Now")
+    clock[0] += 8 * 86400
+    assert texts(db.get_backend()) == ["Now", "Next week"]
+
+
+def test_completion_wins_over_later_changes(local, other, clock):
+    db.add_task("Shared", "errands")
+    sync.sync(other.path)
+
+    clock[0] += 10
+    other.pop_first("errands")
+    clock[0] += 10
+    db.rename_queue("errands", "chores")
+    sync.sync(other.path)
+    assert db.list_queues() == []
+    assert other.list_queues() == []
+    assert db.list_events()[-1]["kind"] == "complete"
+
+
+def test_latest_update_wins(local, other, clock):
+    db.add_task("Shared", "errands")
+    sync.sync(other.path)
+
+    clock[0] += 10
+    other.rename_queue("errands", "chores")
+    clock[0] += 10
+    db.rename_queue("errands", "home")
+    sync.sync(other.path)
+    assert db.list_queues() == [("home", 1)]
+    assert other.list_queues() == [("home", 1)]
+
+
+def test_rename_syncs_without_rewriting_tasks(local, other, clock):
+    for i in range(3):
+        db.add_task(f"Task {i}", "errands")
+    sync.sync(other.path)
+
+    clock[0] += 10
+    db.rename_queue("errands", "chores")
+    with sqlite3.connect(local) as conn:
+        assert conn.execute("SELECT MAX(updated_at) FROM tasks").fetchone()[0] == 1_700_000_000
+    result = sync.sync(other.path)
+    assert (result.pulled, result.pushed) == (0, 3)
+    assert other.list_queues() == [("chores", 3)]
+
+    clock[0] += 10
+    result = sync.sync(other.path)
+    assert (result.pulled, result.pushed) == (0, 0)
+
+
+def test_duplicates_keep_the_same_task_on_both_sides(local, other, clock):
+    other.add_task("Buy milk", "default")
+    clock[0] += 10
+    db.add_task("Buy milk")
+
+    result = sync.sync(other.path)
+    assert result.duplicates == 2
+    with sqlite3.connect(local) as conn:
+        (local_uid,) = conn.execute("SELECT uid FROM tasks WHERE completed_at IS NULL").fetchall()
+    with sqlite3.connect(other.path) as conn:
+        (other_uid,) = conn.execute("SELECT uid FROM tasks WHERE completed_at IS NULL").fetchall()
+    assert local_uid == other_uid
+    assert db.list_tasks()[0]["created_at"] == 1_700_000_000
+
+
+def test_sync_with_a_copied_database(local, tmp_path):
+    db.add_task("Before copy")
+    copy_path = tmp_path / "copy.sqlite"
+    shutil.copy(local, copy_path)
+    SQLiteBackend(str(copy_path)).add_task("Only in copy", "default")
+
+    result = sync.sync(str(copy_path))
+    assert result.pulled >= 1
+    assert texts(db.get_backend()) == ["Before copy", "Only in copy"]
+    with sqlite3.connect(local) as conn, sqlite3.connect(copy_path) as copy:
+        query = "SELECT value FROM meta WHERE key = 'uid'"
+        assert conn.execute(query).fetchone() != copy.execute(query).fetchone()
+
+
+def test_sync_rejects_bad_targets(local, tmp_path):
+    with pytest.raises(DatabaseError, match="with itself"):
+        sync.sync(str(local))
+    with pytest.raises(DatabaseError, match="does not exist"):
+        sync.sync(str(tmp_path / "missing.sqlite"))
+
+    not_tqu = tmp_path / "other.sqlite"
+    with sqlite3.connect(not_tqu) as conn:
+        conn.execute("CREATE TABLE notes (body TEXT)")
+    with pytest.raises(DatabaseError, match="not a tqu database"):
+        sync.sync(str(not_tqu))
+
+
+def test_sync_needs_sqlite():
+    db.set_backend(MemoryBackend())
+    try:
+        with pytest.raises(DatabaseError, match="SQLite database"):
+            sync.sync("other.sqlite")
+    finally:
+        db.set_backend(None)
+
+
+def test_sync_carries_compressed_payloads(local, other):
+    text = "z" * 4000
+    other.add_task(text, "default")
+    sync.sync(other.path)
+    assert db.pop_first()["task_text"] == text
+    with pytest.raises(TaskAlreadyExistsError):
+        other.add_task(text, "default")
@@ -0,0 +1,82 @@
+import sys
+import threading
+
+import pytest
+
+from tqu import db, worker
+from tqu.backends import MemoryBackend
+
+PYTHON = sys.executable
+
+
+@pytest.fixture
+def backend():
+    instance = MemoryBackend()
+    db.set_backend(instance)
+    yield instance
+    db.set_backend(None)
+
+
+def run(queue, command, concurrency=2, batch_size=2, retries=0, stop=None):
+    results = []
+    summary = worker.work(queue, command, concurrency, batch_size, retries, results.append, stop or threading.Event())
+    return summary, results
+
+
+def test_build_command_substitutes_placeholder():
+    assert worker.build_command(["echo", "task={}", "{}"], "x") == ["echo", "task=x", "x"]
+
+
+def test_build_command_appends_without_placeholder():
+    assert worker.build_command(["echo", "-n"], "x") == ["echo", "-n", "x"]
+
+
+def test_work_runs_every_task(backend, tmp_path):
+    for i in range(5):
+        db.add_task(str(tmp_path / f"out{i}"), "jobs")
+
+    summary, results = run("jobs", [PYTHON, "-c", "import sys; open(sys.argv[1], 'w').close()"])
+    assert (summary.succeeded, summary.failed, summary.processed) == (5, 0, 5)
+    assert sorted(result.task["task_text"] for result in results) == sorted(str(tmp_path / f"out{i}") for i in range(5))
+    assert all((tmp_path / f"out{i}").exists() for i in range(5))
+    assert db.list_tasks("jobs") == []
+    assert summary.throughput > 0
+
+
+def test_work_requeues_failures_up_to_retries(backend):
+    db.add_task("fail", "jobs")
+    db.add_task("ok", "jobs")
+
+    summary, results = run("jobs", [PYTHON, "-c", "import sys; sys.exit(sys.argv[1] == 'fail')"], retries=2)
+    assert (summary.succeeded, summary.failed, summary.requeued) == (1, 1, 2)
+    assert [result.requeued for result in results if result.task["task_text"] == "fail"] == [True, True, False]
+    assert db.list_tasks("jobs") == []
+
+
+def test_work_missing_command(backend):
+    db.add_task("task", "jobs")
+    summary, results = run("jobs", ["tqu-no-such-command-{}"])
+    assert summary.failed == 1
+    assert results[0].returncode == worker.COMMAND_NOT_FOUND
+
+
+def test_work_releases_unstarted_tasks_on_stop(backend):
+    for i in range(6):
+        db.add_task(f"task {i}", "jobs")
+
+    stop = threading.Event()
+    results = []
+
+    def on_result(result):
+        results.append(result)
+        stop.set()
+
+    summary = worker.work("jobs", [PYTHON, "-c", "pass"], 1, 3, 0, on_result, stop)
+    assert summary.succeeded == 1
+    assert summary.released == 2
+    assert [task["task_text"] for task in db.list_tasks("jobs")] == [f"task {i}" for i in range(1, 6)]
+
+
+def test_work_empty_queue(backend):
+    summary, results = run("jobs", ["true"])
+    assert summary.processed == 0 and results == []
@@ -1,4 +1,15 @@
-from tqu.cli import main
+from tqu.completion import complete_fast
+
+
+def main() -> None:
+    """Entry point of the tqu command: answer shell completion early, or run the CLI."""
+    if complete_fast():
+        return
+    # Imported only now, so that completing queue names and task IDs never loads rich
+    from tqu.cli import main as cli_main
+
+    cli_main()
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,6 @@
+from tqu.backends.base import Backend
+from tqu.backends.combined import CombinedBackend
+from tqu.backends.memory import MemoryBackend
+from tqu.backends.sqlite import SQLiteBackend
+
+__all__ = ["Backend", "CombinedBackend", "MemoryBackend", "SQLiteBackend"]
@@ -0,0 +1,224 @@
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+# Kinds of events in the events log
+EVENT_ADD = "add"
+EVENT_COMPLETE = "complete"
+EVENT_DELETE = "delete"
+EVENT_MOVE = "move"
+# Logged once per renamed queue, with task ID 0, the old queue name and the new name as its text
+EVENT_RENAME = "rename"
+
+# Task texts longer than this many UTF-8 bytes are stored compressed and listed by a preview
+COMPRESS_THRESHOLD = 1024
+PREVIEW_LENGTH = 80
+
+# Seconds for which an idempotency key given to add_task keeps returning its task
+DEFAULT_KEY_RETENTION = 86400
+
+
+class AddedTask(NamedTuple):
+    task_id: int
+    replayed: bool  # The idempotency key was already known, so nothing was added
+
+
+def is_large(task_text: str) -> bool:
+    return len(task_text.encode("utf-8")) > COMPRESS_THRESHOLD
+
+
+def preview_text(task_text: str) -> str:
+    """Return the text that listings show for a task: the text itself, or the start of a large one."""
+    return task_text[: PREVIEW_LENGTH - 1] + "…" if is_large(task_text) else task_text
+
+
+def glob_pattern(match: str) -> str:
+    """Turn a --match argument into a case-sensitive glob: patterns are kept, plain text matches anywhere."""
+    return match if any(char in match for char in "*?[") else f"*{match}*"
+
+
+class Backend(ABC):
+    """Storage interface that every tqu backend implements.
+
+    Backends receive already validated arguments from `tqu.db` and raise the
+    exceptions from `tqu.exceptions` on failure.
+    """
+
+    name = "base"
+
+    @abstractmethod
+    def init(self) -> None:
+        """Prepare the storage for use. Must be safe to call repeatedly."""
+
+    @abstractmethod
+    def add_task(
+        self,
+        task_text: str,
+        queue_name: str,
+        visible_at: Optional[int] = None,
+        key: Optional[str] = None,
+        key_retention: int = DEFAULT_KEY_RETENTION,
+    ) -> AddedTask:
+        """Add an active task and return its ID, raising TaskAlreadyExistsError for duplicates.
+
+        Raises QueueFullError if the queue already holds as many active tasks as its limit.
+        A task with visible_at in the future is scheduled: it counts as active, but cannot be
+        popped or claimed until that Unix timestamp.
+
+        A task added with an idempotency key is remembered for key_retention seconds. Adding
+        with the same key in that time changes nothing and returns the first task's ID, marked
+        as replayed, even if that task has been completed since.
+        """
+
+    @abstractmethod
+    def get_task(self, task_id: int) -> Dict[str, Any]:
+        """Return a task, active or completed, with its full text, or raise TaskNotFoundError."""
+
+    @abstractmethod
+    def list_tasks(
+        self,
+        queue_name: str,
+        limit: Optional[int] = None,
+        offset: int = 0,
+        scheduled: bool = False,
+        created_after: Optional[int] = None,
+        created_before: Optional[int] = None,
+        match: Optional[str] = None,
+        after_id: Optional[int] = None,
+        newest: bool = False,
+    ) -> List[Dict[str, Any]]:
+        """Return the due tasks of a queue, oldest first, optionally one page at a time.
+
+        With scheduled, return the tasks that are not yet due instead, soonest first.
+        Large task texts are returned as a preview; pops, claims and get_task return them in full.
+
+        The filters keep tasks created at or after created_after, created before
+        created_before, and whose (preview) text matches `match` as in glob_pattern().
+        With after_id, only tasks that come after that task in the list are kept, so
+        pages can follow on from the last task seen instead of an offset. With newest,
+        the page is taken from the end of the list, still in list order.
+        """
+
+    @abstractmethod
+    def count_tasks(
+        self,
+        queue_name: str,
+        scheduled: bool = False,
+        created_after: Optional[int] = None,
+        created_before: Optional[int] = None,
+        match: Optional[str] = None,
+    ) -> int:
+        """Return the number of tasks that list_tasks would return without a limit."""
+
+    @abstractmethod
+    def pop_last(self, queue_name: str) -> Dict[str, Any]:
+        """Complete and return the most recently added task of a queue."""
+
+    @abstractmethod
+    def pop_first(self, queue_name: str) -> Dict[str, Any]:
+        """Complete and return the least recently added task of a queue."""
+
+    @abstractmethod
+    def claim_tasks(self, queue_name: str, limit: int) -> List[Dict[str, Any]]:
+        """Atomically complete and return up to `limit` of the oldest tasks of a queue."""
+
+    @abstractmethod
+    def pop_random(self, queue_name: str, limit: int) -> List[Dict[str, Any]]:
+        """Atomically complete and return up to `limit` due tasks of a queue, chosen at random."""
+
+    @abstractmethod
+    def release_task(self, task_id: int) -> bool:
+        """Make a claimed task active again in its original position.
+
+        Returns False if the task is unknown, still active, or its text was added
+        to the queue again in the meantime.
+        """
+
+    @abstractmethod
+    def delete_task(self, task_id: int) -> Tuple[str, str]:
+        """Complete an active task by ID and return its queue name and text."""
+
+    @abstractmethod
+    def delete_queue(self, queue_name: str) -> List[Dict[str, Any]]:
+        """Complete every active task of a queue and return them, oldest first."""
+
+    @abstractmethod
+    def rename_queue(self, queue_name: str, new_name: str) -> None:
+        """Rename a queue, raising QueueAlreadyExistsError if the new name has active tasks."""
+
+    @abstractmethod
+    def merge_queues(self, source: str, target: str) -> Tuple[int, int]:
+        """Move all active tasks from source into target and remove source.
+
+        Tasks whose text is already active in target are completed instead of moved.
+        Returns the number of moved tasks and the number of such duplicates.
+        """
+
+    @abstractmethod
+    def move_tasks(
+        self, source: str, target: str, limit: Optional[int] = 1, last: bool = False, task_id: Optional[int] = None
+    ) -> Tuple[int, int]:
+        """Move the first (or with last, the last) `limit` due tasks of source into target, or all with None.
+
+        With task_id, move that task instead, raising TaskNotFoundError unless it is
+        active in source. Moved tasks keep their ID and created_at. Tasks whose text
+        is already active in target are completed instead of moved. Raises
+        EmptyQueueError if source has no due tasks. Returns the number of moved
+        tasks and the number of such duplicates.
+        """
+
+    @abstractmethod
+    def set_queue_limit(self, queue_name: str, max_length: Optional[int]) -> None:
+        """Limit a queue to max_length active tasks, or remove its limit with None.
+
+        Adding to a queue at its limit raises QueueFullError. Tasks already in the
+        queue are kept, and moves, merges and releases are never refused.
+        """
+
+    @abstractmethod
+    def queue_limit(self, queue_name: str) -> Tuple[Optional[int], int]:
+        """Return the limit of a queue, or None, and its number of active tasks."""
+
+    @abstractmethod
+    def list_queues(self) -> List[Tuple[str, int]]:
+        """Return (queue name, active task count) pairs sorted by name."""
+
+    @abstractmethod
+    def queue_metrics(self) -> List[Dict[str, Any]]:
+        """Return per-queue metrics sorted by queue name.
+
+        Each entry has the queue `name`, its `active` task count, the `created_at` of
+        its `oldest` active task (or None), and the number of tasks ever `added` to
+        and `completed` in it.
+        """
+
+    @abstractmethod
+    def task_exists(self, task_id: int) -> bool:
+        """Return whether an active task with the given ID exists."""
+
+    @abstractmethod
+    def list_events(
+        self, from_seq: int = 0, queue_name: Optional[str] = None, limit: Optional[int] = None, newest: bool = False
+    ) -> List[Dict[str, Any]]:
+        """Return events with a sequence number of at least from_seq, in sequence order.
+
+        Every mutation logs an event per affected task (add, complete, delete or move)
+        in the same transaction. With newest, return the last `limit` events instead
+        of the first.
+        """
+
+    @abstractmethod
+    def prune_events(self, before: int) -> int:
+        """Remove events logged before the given Unix timestamp and return how many."""
+
+    @abstractmethod
+    def data_version(self) -> int:
+        """Return a counter that moves whenever another writer changes the data.
+
+        Values are only comparable between calls made inside the same `session()`.
+        """
+
+    @contextmanager
+    def session(self) -> Iterator[None]:
+        """Serve every call made inside the block from one open connection."""
+        yield
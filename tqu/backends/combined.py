@@ -0,0 +1,254 @@
+import sqlite3
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from tqu.backends.base import DEFAULT_KEY_RETENTION, AddedTask, Backend
+from tqu.backends.sqlite import (
+    DEFAULT_BUSY_TIMEOUT,
+    DEFAULT_MAX_RETRIES,
+    QUEUE_COUNTS,
+    QUEUE_METRICS,
+    SQLiteBackend,
+    count_task_rows,
+    list_task_page,
+    retrying,
+)
+from tqu.exceptions import DatabaseError, QueueError
+
+# Separates the source database from the queue name, as in "team-a:inbox"
+SOURCE_SEPARATOR = ":"
+
+# SQLite's default limit on databases attached to one connection, for Python versions that cannot read it
+DEFAULT_ATTACH_LIMIT = 10
+
+
+def source_names(paths: Sequence[str]) -> List[str]:
+    """Name each database after its file, numbering files that share a name."""
+    names: List[str] = []
+    for path in paths:
+        stem = Path(path).stem
+        name, n = stem, 1
+        while name in names:
+            n += 1
+            name = f"{stem}-{n}"
+        names.append(name)
+    return names
+
+
+def attach_limit() -> int:
+    """Return how many databases SQLite attaches to one connection at most."""
+    conn = sqlite3.connect(":memory:")
+    try:
+        # Connection.getlimit is new in Python 3.11
+        if not hasattr(conn, "getlimit"):
+            return DEFAULT_ATTACH_LIMIT
+        return conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+    finally:
+        conn.close()
+
+
+class CombinedBackend(Backend):
+    """Read-only view of several SQLite databases at once.
+
+    All databases are attached read-only to one connection, so the overview and
+    metrics come from a single UNION ALL query. Queue names are qualified by the
+    database they come from, as "source:queue", and can be listed by that name.
+    Databases are attached as src0, src1, ..., so that no source name can clash
+    with a schema name of SQLite's own, such as main or temp.
+    """
+
+    name = "combined"
+
+    def __init__(
+        self, paths: Sequence[str], busy_timeout: float = DEFAULT_BUSY_TIMEOUT, max_retries: int = DEFAULT_MAX_RETRIES
+    ) -> None:
+        self.paths = list(paths)
+        self.sources = dict(zip(source_names(self.paths), self.paths))
+        # Schema name on the connection of each source
+        self.schemas = {name: f"src{i}" for i, name in enumerate(self.sources)}
+        self.busy_timeout = busy_timeout
+        self.max_retries = max_retries
+        self._pinned: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._pinned is not None:
+            self._pinned.row_factory = None
+            return self._pinned
+        conn = sqlite3.connect(":memory:", uri=True, timeout=self.busy_timeout)
+        for name, path in self.sources.items():
+            conn.execute(f"ATTACH DATABASE ? AS {self.schemas[name]}", (f"{Path(path).resolve().as_uri()}?mode=ro",))
+        return conn
+
+    @contextmanager
+    def session(self) -> Iterator[None]:
+        if self._pinned is not None:
+            yield
+            return
+        self._pinned = self._connect()
+        try:
+            yield
+        finally:
+            conn, self._pinned = self._pinned, None
+            conn.close()
+
+    def _split(self, queue_name: str) -> Tuple[Optional[str], str]:
+        # Returns the schema holding a qualified queue, or None for an unknown source
+        source, separator, queue = queue_name.partition(SOURCE_SEPARATOR)
+        if not separator:
+            raise QueueError(
+                f"Queue '{queue_name}' needs its database, as in '{next(iter(self.sources))}{SOURCE_SEPARATOR}"
+                f"{queue_name}', when several databases are open."
+            )
+        return self.schemas.get(source), queue
+
+    def _unsupported(self, action: str) -> DatabaseError:
+        return DatabaseError(f"Cannot {action} with several databases open; pass a single --db.")
+
+    def init(self) -> None:
+        limit = attach_limit()
+        if len(self.paths) > limit:
+            raise DatabaseError(f"Cannot open {len(self.paths)} databases at once; SQLite attaches at most {limit}.")
+        for path in self.paths:
+            if not Path(path).is_file():
+                raise DatabaseError(f"'{path}' does not exist.")
+            # Migrates databases of older tqu versions once, like any read-only command
+            SQLiteBackend(path, self.busy_timeout, self.max_retries, read_only=True).init()
+
+    @retrying("Failed to read data version")
+    def data_version(self) -> int:
+        with self._connect() as conn:
+            # Each version only moves forward, so their sum changes whenever any database does
+            return sum(conn.execute(f"PRAGMA {schema}.data_version").fetchone()[0] for schema in self.schemas.values())
+
+    @retrying("Failed to list tasks")
+    def list_tasks(
+        self,
+        queue_name: str,
+        limit: Optional[int] = None,
+        offset: int = 0,
+        scheduled: bool = False,
+        created_after: Optional[int] = None,
+        created_before: Optional[int] = None,
+        match: Optional[str] = None,
+        after_id: Optional[int] = None,
+        newest: bool = False,
+    ) -> List[Dict[str, Any]]:
+        schema, queue = self._split(queue_name)
+        if schema is None:
+            return []
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            return list_task_page(
+                conn.cursor(),
+                queue,
+                limit,
+                offset,
+                scheduled,
+                created_after,
+                created_before,
+                match,
+                after_id,
+                newest,
+                schema,
+            )
+
+    @retrying("Failed to count tasks")
+    def count_tasks(
+        self,
+        queue_name: str,
+        scheduled: bool = False,
+        created_after: Optional[int] = None,
+        created_before: Optional[int] = None,
+        match: Optional[str] = None,
+    ) -> int:
+        schema, queue = self._split(queue_name)
+        if schema is None:
+            return 0
+        with self._connect() as conn:
+            return count_task_rows(conn.cursor(), queue, scheduled, created_after, created_before, match, schema)
+
+    def _union(self, query: str) -> str:
+        parts = [
+            f"SELECT ? || '{SOURCE_SEPARATOR}' || name AS qualified, * FROM ({query.format(schema=schema)})"
+            for schema in self.schemas.values()
+        ]
+        return " UNION ALL ".join(parts) + " ORDER BY qualified"
+
+    @retrying("Failed to list queues")
+    def list_queues(self) -> List[Tuple[str, int]]:
+        with self._connect() as conn:
+            cursor = conn.execute(self._union(QUEUE_COUNTS), list(self.sources))
+            return [(qualified, count) for qualified, _, count in cursor.fetchall()]
+
+    @retrying("Failed to collect queue metrics")
+    def queue_metrics(self) -> List[Dict[str, Any]]:
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.execute(self._union(QUEUE_METRICS), list(self.sources))
+            metrics = [dict(row) for row in cursor.fetchall()]
+            for queue in metrics:
+                queue["name"] = queue.pop("qualified")
+            return metrics
+
+    def add_task(
+        self,
+        task_text: str,
+        queue_name: str,
+        visible_at: Optional[int] = None,
+        key: Optional[str] = None,
+        key_retention: int = DEFAULT_KEY_RETENTION,
+    ) -> AddedTask:
+        raise self._unsupported("add tasks")
+
+    def get_task(self, task_id: int) -> Dict[str, Any]:
+        raise self._unsupported("look up tasks by ID")
+
+    def pop_last(self, queue_name: str) -> Dict[str, Any]:
+        raise self._unsupported("pop tasks")
+
+    def pop_first(self, queue_name: str) -> Dict[str, Any]:
+        raise self._unsupported("pop tasks")
+
+    def claim_tasks(self, queue_name: str, limit: int) -> List[Dict[str, Any]]:
+        raise self._unsupported("claim tasks")
+
+    def pop_random(self, queue_name: str, limit: int) -> List[Dict[str, Any]]:
+        raise self._unsupported("pop tasks")
+
+    def release_task(self, task_id: int) -> bool:
+        raise self._unsupported("release tasks")
+
+    def delete_task(self, task_id: int) -> Tuple[str, str]:
+        raise self._unsupported("delete tasks")
+
+    def delete_queue(self, queue_name: str) -> List[Dict[str, Any]]:
+        raise self._unsupported("delete queues")
+
+    def rename_queue(self, queue_name: str, new_name: str) -> None:
+        raise self._unsupported("rename queues")
+
+    def merge_queues(self, source: str, target: str) -> Tuple[int, int]:
+        raise self._unsupported("merge queues")
+
+    def move_tasks(
+        self, source: str, target: str, limit: Optional[int] = 1, last: bool = False, task_id: Optional[int] = None
+    ) -> Tuple[int, int]:
+        raise self._unsupported("move tasks")
+
+    def set_queue_limit(self, queue_name: str, max_length: Optional[int]) -> None:
+        raise self._unsupported("limit queues")
+
+    def queue_limit(self, queue_name: str) -> Tuple[Optional[int], int]:
+        raise self._unsupported("read queue limits")
+
+    def task_exists(self, task_id: int) -> bool:
+        raise self._unsupported("look up tasks by ID")
+
+    def list_events(
+        self, from_seq: int = 0, queue_name: Optional[str] = None, limit: Optional[int] = None, newest: bool = False
+    ) -> List[Dict[str, Any]]:
+        raise self._unsupported("read events")
+
+    def prune_events(self, before: int) -> int:
+        raise self._unsupported("prune events")
@@ -0,0 +1,518 @@
+import fnmatch
+import heapq
+import itertools
+import random
+import threading
+import time
+from collections import Counter, deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from tqu.backends.base import (
+    DEFAULT_KEY_RETENTION,
+    EVENT_ADD,
+    EVENT_COMPLETE,
+    EVENT_DELETE,
+    EVENT_MOVE,
+    EVENT_RENAME,
+    AddedTask,
+    Backend,
+    glob_pattern,
+    preview_text,
+)
+from tqu.exceptions import (
+    EmptyQueueError,
+    QueueAlreadyExistsError,
+    QueueError,
+    QueueFullError,
+    QueueNotFoundError,
+    TaskAlreadyExistsError,
+    TaskNotFoundError,
+)
+
+
+class MemoryBackend(Backend):
+    """Backend keeping tasks in process memory.
+
+    Each queue is a deque of due task IDs in position order, so both pops are
+    O(1), plus a heap of (visible_at, ID) for tasks scheduled for later that is
+    drained into the deque as they become due. Positions follow the SQLite
+    backend's: the time a task was added in microseconds, or the second it becomes
+    due if it was scheduled for later. Active tasks are indexed by
+    (queue, text) for the duplicate check. Like the SQLite backend, completed
+    tasks are kept rather than removed. Nothing is persisted.
+    """
+
+    name = "memory"
+
+    _LIST_KEYS = ("id", "task_text", "created_at", "visible_at")
+
+    def __init__(self) -> None:
+        self._lock = threading.RLock()
+        self._tasks: Dict[int, Dict[str, Any]] = {}
+        self._queues: Dict[str, Deque[int]] = {}
+        self._scheduled: Dict[str, List[Tuple[int, int]]] = {}
+        self._texts: Dict[Tuple[str, str], int] = {}
+        self._limits: Dict[str, int] = {}
+        # Tasks ever added to and completed in each queue; moving tasks in adds them to the target
+        self._added: Counter[str] = Counter()
+        self._completed: Counter[str] = Counter()
+        # Idempotency key -> (task ID, time it was added), oldest first
+        self._keys: Dict[str, Tuple[int, int]] = {}
+        self._events: List[Dict[str, Any]] = []
+        self._next_id = 1
+        self._next_seq = 1
+        # The last position handed out to a task added now
+        self._clock = 0
+        self._version = 0
+
+    def init(self) -> None:
+        pass
+
+    def add_task(
+        self,
+        task_text: str,
+        queue_name: str,
+        visible_at: Optional[int] = None,
+        key: Optional[str] = None,
+        key_retention: int = DEFAULT_KEY_RETENTION,
+    ) -> AddedTask:
+        with self._lock:
+            ts = int(time.time())
+            if key is not None:
+                # Keys are kept in the order they were added, so expired ones are all at the front
+                while self._keys and next(iter(self._keys.values()))[1] < ts - key_retention:
+                    del self._keys[next(iter(self._keys))]
+                if key in self._keys:
+                    return AddedTask(self._keys[key][0], True)
+            if (queue_name, task_text) in self._texts:
+                raise TaskAlreadyExistsError(task_text, queue_name)
+            max_length = self._limits.get(queue_name)
+            if max_length is not None and self._active_count(queue_name) >= max_length:
+                raise QueueFullError(queue_name, max_length)
+
+            task_id = self._next_id
+            self._next_id += 1
+            self._clock = max(self._clock + 1, int(time.time() * 1_000_000))
+            self._tasks[task_id] = {
+                "id": task_id,
+                "queue_name": queue_name,
+                "task_text": task_text,
+                "created_at": ts,
+                "updated_at": ts,
+                "completed_at": None,
+                "visible_at": ts if visible_at is None else visible_at,
+                "position": self._clock if visible_at is None else max(self._clock, visible_at * 1_000_000),
+            }
+            self._texts[(queue_name, task_text)] = task_id
+            queue = self._queues.setdefault(queue_name, deque())
+            if visible_at is not None and visible_at > ts:
+                heapq.heappush(self._scheduled.setdefault(queue_name, []), (visible_at, task_id))
+            else:
+                queue.append(task_id)
+            if key is not None:
+                self._keys[key] = (task_id, ts)
+            self._added[queue_name] += 1
+            self._log(EVENT_ADD, task_id)
+            self._version += 1
+            return AddedTask(task_id, False)
+
+    def get_task(self, task_id: int) -> Dict[str, Any]:
+        with self._lock:
+            if task_id not in self._tasks:
+                raise TaskNotFoundError(task_id)
+            return self._row(task_id, "id", "queue_name", "task_text", "created_at", "completed_at", "visible_at")
+
+    def list_tasks(
+        self,
+        queue_name: str,
+        limit: Optional[int] = None,
+        offset: int = 0,
+        scheduled: bool = False,
+        created_after: Optional[int] = None,
+        created_before: Optional[int] = None,
+        match: Optional[str] = None,
+        after_id: Optional[int] = None,
+        newest: bool = False,
+    ) -> List[Dict[str, Any]]:
+        with self._lock:
+            queue = self._promote(queue_name)
+            if after_id is not None and after_id not in self._tasks:
+                # Nothing is known to come after a task that never existed
+                return []
+            if scheduled or created_after is not None or created_before is not None or match is not None:
+                task_ids = self._filtered(queue_name, scheduled, created_after, created_before, match)
+                if after_id is not None:
+                    after = self._list_key(after_id, scheduled)
+                    task_ids = [task_id for task_id in task_ids if self._list_key(task_id, scheduled) > after]
+                start, stop = self._page(0, len(task_ids), limit, offset, newest)
+                return [self._listed(task_id, *self._LIST_KEYS) for task_id in task_ids[start:stop]]
+            first = 0 if after_id is None else self._bisect(queue, self._list_key(after_id, False))
+            start, stop = self._page(first, len(queue), limit, offset, newest)
+            if start >= stop:
+                return []
+            if start > len(queue) // 2:
+                # Walk pages near the tail from the right end of the deque
+                task_ids = reversed([*itertools.islice(reversed(queue), len(queue) - stop, len(queue) - start)])
+            else:
+                task_ids = itertools.islice(queue, start, stop)
+            return [self._listed(task_id, *self._LIST_KEYS) for task_id in task_ids]
+
+    @staticmethod
+    def _page(first: int, end: int, limit: Optional[int], offset: int, newest: bool) -> Tuple[int, int]:
+        # The [start, stop) slice of a page of the tasks in [first, end), counted from the end with newest
+        if newest:
+            stop = max(first, end - offset)
+            return first if limit is None else max(first, stop - limit), stop
+        start = min(end, first + offset)
+        return start, end if limit is None else min(end, start + limit)
+
+    def count_tasks(
+        self,
+        queue_name: str,
+        scheduled: bool = False,
+        created_after: Optional[int] = None,
+        created_before: Optional[int] = None,
+        match: Optional[str] = None,
+    ) -> int:
+        with self._lock:
+            queue = self._promote(queue_name)
+            if created_after is not None or created_before is not None or match is not None:
+                return len(self._filtered(queue_name, scheduled, created_after, created_before, match))
+            return len(self._scheduled.get(queue_name, ())) if scheduled else len(queue)
+
+    def pop_last(self, queue_name: str) -> Dict[str, Any]:
+        with self._lock:
+            queue = self._promote(queue_name)
+            if not queue:
+                raise EmptyQueueError(queue_name)
+            task_id = queue.pop()
+            self._complete(task_id)
+            return self._row(task_id, "id", "task_text")
+
+    def pop_first(self, queue_name: str) -> Dict[str, Any]:
+        with self._lock:
+            queue = self._promote(queue_name)
+            if not queue:
+                raise EmptyQueueError(queue_name)
+            task_id = queue.popleft()
+            self._complete(task_id)
+            return self._row(task_id, "id", "task_text")
+
+    def claim_tasks(self, queue_name: str, limit: int) -> List[Dict[str, Any]]:
+        with self._lock:
+            queue = self._promote(queue_name)
+            task_ids = [queue.popleft() for _ in range(min(limit, len(queue)))]
+            for task_id in task_ids:
+                self._complete(task_id)
+            return [self._row(task_id, "id", "task_text") for task_id in task_ids]
+
+    def pop_random(self, queue_name: str, limit: int) -> List[Dict[str, Any]]:
+        with self._lock:
+            queue = self._promote(queue_name)
+            task_ids = []
+            for _ in range(min(limit, len(queue))):
+                index = random.randrange(len(queue))
+                task_ids.append(queue[index])
+                del queue[index]
+            for task_id in task_ids:
+                self._complete(task_id)
+            return [self._row(task_id, "id", "task_text") for task_id in task_ids]
+
+    def release_task(self, task_id: int) -> bool:
+        with self._lock:
+            task = self._tasks.get(task_id)
+            if task is None or task["completed_at"] is None:
+                return False
+            key = (task["queue_name"], task["task_text"])
+            if key in self._texts:
+                return False
+            task["completed_at"] = None
+            task["updated_at"] = int(time.time())
+            self._texts[key] = task_id
+            self._enqueue(task_id)
+            self._added[task["queue_name"]] += 1
+            self._log(EVENT_ADD, task_id)
+            self._version += 1
+            return True
+
+    def delete_task(self, task_id: int) -> Tuple[str, str]:
+        with self._lock:
+            if not self.task_exists(task_id):
+                raise TaskNotFoundError(task_id)
+            task = self._tasks[task_id]
+            self._dequeue(task_id)
+            self._complete(task_id, EVENT_DELETE)
+            return task["queue_name"], preview_text(task["task_text"])
+
+    def delete_queue(self, queue_name: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            task_ids = sorted(
+                [*self._promote(queue_name), *(task_id for _, task_id in self._scheduled.get(queue_name, ()))]
+            )
+            if not task_ids:
+                raise EmptyQueueError(queue_name)
+            for task_id in task_ids:
+                self._complete(task_id, EVENT_DELETE)
+            self._queues[queue_name].clear()
+            self._scheduled.pop(queue_name, None)
+            return [self._listed(task_id, "id", "task_text") for task_id in task_ids]
+
+    def rename_queue(self, queue_name: str, new_name: str) -> None:
+        with self._lock:
+            if queue_name not in self._queues:
+                raise QueueNotFoundError(queue_name)
+            if new_name == queue_name:
+                return
+            if self._queues.get(new_name) or self._scheduled.get(new_name):
+                raise QueueAlreadyExistsError(new_name)
+            # The limit belongs to the queue and moves with it, replacing any of the new name
+            self._limits.pop(new_name, None)
+            if queue_name in self._limits:
+                self._limits[new_name] = self._limits.pop(queue_name)
+            for counts in (self._added, self._completed):
+                counts[new_name] += counts.pop(queue_name, 0)
+            queue = self._queues[new_name] = self._queues.pop(queue_name)
+            scheduled = self._scheduled[new_name] = self._scheduled.pop(queue_name, [])
+            for task_id in [*queue, *(task_id for _, task_id in scheduled)]:
+                self._rehome(task_id, new_name, log=False)
+            self._append_event(int(time.time()), EVENT_RENAME, 0, queue_name, new_name)
+            self._version += 1
+
+    def merge_queues(self, source: str, target: str) -> Tuple[int, int]:
+        if source == target:
+            raise QueueError(f"Cannot merge queue '{source}' into itself.")
+        with self._lock:
+            if source not in self._queues:
+                raise QueueNotFoundError(source)
+            moved = []
+            duplicates = 0
+            scheduled = self._scheduled.pop(source, [])
+            self._limits.pop(source, None)
+            for task_id in [*self._queues.pop(source), *(task_id for _, task_id in scheduled)]:
+                if (target, self._tasks[task_id]["task_text"]) in self._texts:
+                    self._complete(task_id, EVENT_DELETE)
+                    duplicates += 1
+                else:
+                    self._rehome(task_id, target)
+                    self._added[target] += 1
+                    moved.append(task_id)
+            # Only now, as completing the duplicates counted them for the source queue
+            self._added.pop(source, None)
+            self._completed.pop(source, None)
+            self._queues.setdefault(target, deque())
+            for task_id in moved:
+                self._enqueue(task_id)
+            self._version += 1
+            return len(moved), duplicates
+
+    def move_tasks(
+        self, source: str, target: str, limit: Optional[int] = 1, last: bool = False, task_id: Optional[int] = None
+    ) -> Tuple[int, int]:
+        if source == target:
+            raise QueueError(f"Cannot move tasks from queue '{source}' into itself.")
+        with self._lock:
+            if task_id is not None:
+                task = self._tasks.get(task_id)
+                if task is None or task["completed_at"] is not None or task["queue_name"] != source:
+                    raise TaskNotFoundError(task_id)
+                self._dequeue(task_id)
+                task_ids = [task_id]
+            else:
+                queue = self._promote(source)
+                if not queue:
+                    raise EmptyQueueError(source)
+                count = len(queue) if limit is None else min(limit, len(queue))
+                task_ids = [queue.pop() if last else queue.popleft() for _ in range(count)]
+            moved = duplicates = 0
+            for task_id in task_ids:
+                if (target, self._tasks[task_id]["task_text"]) in self._texts:
+                    self._complete(task_id, EVENT_DELETE)
+                    duplicates += 1
+                else:
+                    self._rehome(task_id, target)
+                    self._enqueue(task_id)
+                    self._added[target] += 1
+                    moved += 1
+            self._version += 1
+            return moved, duplicates
+
+    def set_queue_limit(self, queue_name: str, max_length: Optional[int]) -> None:
+        with self._lock:
+            self._queues.setdefault(queue_name, deque())
+            if max_length is None:
+                self._limits.pop(queue_name, None)
+            else:
+                self._limits[queue_name] = max_length
+
+    def queue_limit(self, queue_name: str) -> Tuple[Optional[int], int]:
+        with self._lock:
+            return self._limits.get(queue_name), self._active_count(queue_name)
+
+    def list_queues(self) -> List[Tuple[str, int]]:
+        with self._lock:
+            counts = {name: self._active_count(name) for name in self._queues}
+            return sorted((name, count) for name, count in counts.items() if count)
+
+    def queue_metrics(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            metrics = []
+            for name in sorted(name for name, added in self._added.items() if added):
+                active = [*self._queues.get(name, ()), *(task_id for _, task_id in self._scheduled.get(name, ()))]
+                metrics.append(
+                    {
+                        "name": name,
+                        "active": len(active),
+                        "oldest": min((self._tasks[task_id]["created_at"] for task_id in active), default=None),
+                        "added": self._added[name],
+                        "completed": self._completed[name],
+                    }
+                )
+            return metrics
+
+    def task_exists(self, task_id: int) -> bool:
+        with self._lock:
+            task = self._tasks.get(task_id)
+            return task is not None and task["completed_at"] is None
+
+    def list_events(
+        self, from_seq: int = 0, queue_name: Optional[str] = None, limit: Optional[int] = None, newest: bool = False
+    ) -> List[Dict[str, Any]]:
+        with self._lock:
+            events = [
+                dict(event)
+                for event in self._events
+                if event["seq"] >= from_seq and (queue_name is None or event["queue_name"] == queue_name)
+            ]
+            if limit is None:
+                return events
+            return events[-limit:] if newest and limit else events[:limit]
+
+    def prune_events(self, before: int) -> int:
+        with self._lock:
+            kept = [event for event in self._events if event["created_at"] >= before]
+            pruned = len(self._events) - len(kept)
+            self._events = kept
+            return pruned
+
+    def data_version(self) -> int:
+        with self._lock:
+            return self._version
+
+    def _promote(self, queue_name: str) -> Deque[int]:
+        """Move scheduled tasks that have become due into the queue deque, and return it."""
+        queue = self._queues.setdefault(queue_name, deque())
+        scheduled = self._scheduled.get(queue_name)
+        now = int(time.time())
+        while scheduled and scheduled[0][0] <= now:
+            _, task_id = heapq.heappop(scheduled)
+            self._insort(queue, task_id)
+        return queue
+
+    def _insort(self, queue: Deque[int], task_id: int) -> None:
+        # Insert a task into a queue deque ordered by (position, ID)
+        queue.insert(self._bisect(queue, self._list_key(task_id, False)), task_id)
+
+    def _bisect(self, queue: Deque[int], key: Tuple[int, int]) -> int:
+        # The index of the first task in a queue deque whose (position, ID) comes after key
+        low, high = 0, len(queue)
+        while low < high:
+            middle = (low + high) // 2
+            if self._list_key(queue[middle], False) <= key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _list_key(self, task_id: int, scheduled: bool) -> Tuple[int, int]:
+        # Where a task sorts in its list, like the SQLite backend's ORDER BY
+        return (self._tasks[task_id]["visible_at" if scheduled else "position"], task_id)
+
+    def _filtered(
+        self,
+        queue_name: str,
+        scheduled: bool,
+        created_after: Optional[int],
+        created_before: Optional[int],
+        match: Optional[str],
+    ) -> List[int]:
+        # A linear scan in list order; call _promote first
+        if scheduled:
+            task_ids = [task_id for _, task_id in sorted(self._scheduled.get(queue_name, ()))]
+        else:
+            task_ids = list(self._queues.get(queue_name, ()))
+        pattern = None if match is None else glob_pattern(match)
+        return [
+            task_id
+            for task_id in task_ids
+            if (created_after is None or self._tasks[task_id]["created_at"] >= created_after)
+            and (created_before is None or self._tasks[task_id]["created_at"] < created_before)
+            and (pattern is None or fnmatch.fnmatchcase(preview_text(self._tasks[task_id]["task_text"]), pattern))
+        ]
+
+    def _active_count(self, queue_name: str) -> int:
+        return len(self._queues.get(queue_name, ())) + len(self._scheduled.get(queue_name, ()))
+
+    def _dequeue(self, task_id: int) -> None:
+        # Take an active task out of its queue deque or, if it is not due yet, its schedule
+        task = self._tasks[task_id]
+        queue = self._promote(task["queue_name"])
+        if task_id in queue:
+            queue.remove(task_id)
+        else:
+            scheduled = self._scheduled[task["queue_name"]]
+            scheduled.remove((task["visible_at"], task_id))
+            heapq.heapify(scheduled)
+
+    def _enqueue(self, task_id: int) -> None:
+        task = self._tasks[task_id]
+        if task["visible_at"] > int(time.time()):
+            heapq.heappush(self._scheduled.setdefault(task["queue_name"], []), (task["visible_at"], task_id))
+        else:
+            self._insort(self._queues.setdefault(task["queue_name"], deque()), task_id)
+
+    def _row(self, task_id: int, *keys: str) -> Dict[str, Any]:
+        task = self._tasks[task_id]
+        return {key: task[key] for key in keys}
+
+    def _listed(self, task_id: int, *keys: str) -> Dict[str, Any]:
+        # Listings show large texts as a preview, like the SQLite backend
+        row = self._row(task_id, *keys)
+        row["task_text"] = preview_text(row["task_text"])
+        return row
+
+    def _rehome(self, task_id: int, queue_name: str, log: bool = True) -> None:
+        task = self._tasks[task_id]
+        del self._texts[(task["queue_name"], task["task_text"])]
+        task["queue_name"] = queue_name
+        self._texts[(queue_name, task["task_text"])] = task_id
+        if log:
+            task["updated_at"] = int(time.time())
+            self._log(EVENT_MOVE, task_id)
+
+    def _log(self, kind: str, task_id: int) -> None:
+        task = self._tasks[task_id]
+        self._append_event(task["updated_at"], kind, task_id, task["queue_name"], preview_text(task["task_text"]))
+
+    def _append_event(self, created_at: int, kind: str, task_id: int, queue_name: str, task_text: str) -> None:
+        self._events.append(
+            {
+                "seq": self._next_seq,
+                "created_at": created_at,
+                "kind": kind,
+                "task_id": task_id,
+                "queue_name": queue_name,
+                "task_text": task_text,
+            }
+        )
+        self._next_seq += 1
+
+    def _complete(self, task_id: int, kind: str = EVENT_COMPLETE) -> None:
+        # Callers take the ID out of its queue deque themselves
+        ts = int(time.time())
+        task = self._tasks[task_id]
+        task["completed_at"] = ts
+        task["updated_at"] = ts
+        del self._texts[(task["queue_name"], task["task_text"])]
+        self._completed[task["queue_name"]] += 1
+        self._log(kind, task_id)
+        self._version += 1
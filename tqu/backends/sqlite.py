@@ -0,0 +1,1425 @@
+import functools
+import hashlib
+import random
+import sqlite3
+import time
+import zlib
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple, TypeVar
+
+from tqu import instrumentation
+from tqu.backends.base import (
+    COMPRESS_THRESHOLD,
+    DEFAULT_KEY_RETENTION,
+    EVENT_ADD,
+    EVENT_COMPLETE,
+    EVENT_DELETE,
+    EVENT_MOVE,
+    EVENT_RENAME,
+    AddedTask,
+    Backend,
+    glob_pattern,
+    is_large,
+    preview_text,
+)
+from tqu.exceptions import (
+    DatabaseError,
+    EmptyQueueError,
+    PermanentDatabaseError,
+    QueueAlreadyExistsError,
+    QueueError,
+    QueueFullError,
+    QueueNotFoundError,
+    TaskAlreadyExistsError,
+    TaskNotFoundError,
+    TransientDatabaseError,
+)
+
+# Random probes per task in pop_random before it reads a task at a random rank instead
+RANDOM_PROBES = 16
+
+DEFAULT_BUSY_TIMEOUT = 5.0
+DEFAULT_MAX_RETRIES = 5
+
+
+class Profile(NamedTuple):
+    """Connection settings trading durability and memory for speed; WAL is kept in every profile."""
+
+    synchronous: str
+    cache_size: int  # Negative values are KiB
+    mmap_size: int
+    temp_store: str
+    busy_timeout: float
+
+    def pragmas(self) -> List[str]:
+        return [
+            f"PRAGMA synchronous = {self.synchronous}",
+            f"PRAGMA cache_size = {self.cache_size}",
+            f"PRAGMA mmap_size = {self.mmap_size}",
+            f"PRAGMA temp_store = {self.temp_store}",
+        ]
+
+
+PROFILES = {
+    # SQLite's defaults: every commit is synced to disk before it returns
+    "durable": Profile("FULL", -2000, 0, "DEFAULT", DEFAULT_BUSY_TIMEOUT),
+    # A power loss or OS crash can undo the last commits, but never corrupts the database
+    "balanced": Profile("NORMAL", -16000, 64 * 2**20, "MEMORY", DEFAULT_BUSY_TIMEOUT),
+    # Nothing is synced: a power loss or OS crash can corrupt the database
+    "throughput": Profile("OFF", -64000, 256 * 2**20, "MEMORY", 10.0),
+}
+DEFAULT_PROFILE = "durable"
+
+# Characters at the start of task texts kept in idx_queue_text, for glob prefixes and the duplicate check
+TEXT_PREFIX_LENGTH = 16
+
+# Rows per index that ANALYZE samples during quick maintenance, instead of reading every index whole
+QUICK_ANALYSIS_LIMIT = 400
+RETRY_BASE_DELAY = 0.05
+RETRY_MAX_DELAY = 2.0
+
+# SQL expression for a random 128-bit identifier
+NEW_UID = "lower(hex(randomblob(16)))"
+
+# Indexes that only serve active tasks leave completed ones out, so completing a task only removes its entries; they
+# keep the completed_at column, or SQLite would read the table to check it. idx_queue_completed keeps every task, for
+# the due check and for moving a queue's completed tasks along with it.
+ACTIVE_ONLY = "WHERE completed_at IS NULL"
+
+# UPDATE ... RETURNING needs SQLite 3.35; older builds select the tasks first
+HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+# Primary result codes of SQLITE_BUSY and SQLITE_LOCKED
+_TRANSIENT_ERROR_CODES = {5, 6}
+
+T = TypeVar("T")
+
+
+def _create_tasks_table(conn: sqlite3.Connection) -> None:
+    # The original schema; a no-op for databases created before schema versioning
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS tasks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            queue_name TEXT NOT NULL,
+            task_text TEXT NOT NULL,
+            created_at INTEGER NOT NULL,
+            updated_at INTEGER NOT NULL,
+            completed_at INTEGER
+        )
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_queue_completed
+        ON tasks(queue_name, completed_at)
+    """)
+
+
+def _normalize_queue_names(conn: sqlite3.Connection) -> None:
+    # Move queue names into their own table and key tasks by integer queue ID
+    conn.execute("""
+        CREATE TABLE queues (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE
+        )
+    """)
+    conn.execute("INSERT INTO queues (name) SELECT DISTINCT queue_name FROM tasks ORDER BY queue_name")
+    conn.execute("""
+        CREATE TABLE tasks_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            queue_id INTEGER NOT NULL REFERENCES queues(id),
+            task_text TEXT NOT NULL,
+            created_at INTEGER NOT NULL,
+            updated_at INTEGER NOT NULL,
+            completed_at INTEGER
+        )
+    """)
+    conn.execute("""
+        INSERT INTO tasks_new (id, queue_id, task_text, created_at, updated_at, completed_at)
+        SELECT t.id, q.id, t.task_text, t.created_at, t.updated_at, t.completed_at
+        FROM tasks t JOIN queues q ON q.name = t.queue_name
+    """)
+    # Carry the AUTOINCREMENT counter over so IDs of removed rows are never reused
+    row = conn.execute("SELECT MAX(seq) FROM sqlite_sequence WHERE name IN ('tasks', 'tasks_new')").fetchone()
+    conn.execute("DROP TABLE tasks")
+    conn.execute("ALTER TABLE tasks_new RENAME TO tasks")
+    conn.execute("DELETE FROM sqlite_sequence WHERE name = 'tasks'")
+    if row[0] is not None:
+        conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('tasks', ?)", (row[0],))
+    conn.execute("CREATE INDEX idx_queue_completed ON tasks(queue_id, completed_at)")
+
+
+def _add_visible_at(conn: sqlite3.Connection) -> None:
+    # Tasks only become poppable once visible_at has passed; existing tasks are due already
+    conn.execute("ALTER TABLE tasks ADD COLUMN visible_at INTEGER NOT NULL DEFAULT 0")
+    conn.execute("DROP INDEX idx_queue_completed")
+    conn.execute("CREATE INDEX idx_queue_completed ON tasks(queue_id, completed_at, visible_at)")
+
+
+def _add_sync_metadata(conn: sqlite3.Connection) -> None:
+    # A task's ID is local to one database; its uid identifies it across synced copies
+    conn.execute("ALTER TABLE tasks ADD COLUMN uid TEXT")
+    conn.execute(f"UPDATE tasks SET uid = {NEW_UID}")
+    conn.execute("CREATE UNIQUE INDEX idx_uid ON tasks(uid)")
+    conn.execute("CREATE INDEX idx_updated_at ON tasks(updated_at)")
+    conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+    conn.execute(f"INSERT INTO meta (key, value) VALUES ('uid', {NEW_UID})")
+    # Per peer database: the updated_at up to which changes have been pulled from and pushed to it
+    conn.execute("""
+        CREATE TABLE sync_peers (
+            peer TEXT PRIMARY KEY,
+            pulled INTEGER NOT NULL,
+            pushed INTEGER NOT NULL
+        )
+    """)
+    # When a queue was last renamed; sync treats its active tasks as changed then, without rewriting them
+    conn.execute("ALTER TABLE queues ADD COLUMN updated_at INTEGER NOT NULL DEFAULT 0")
+
+
+def _add_events(conn: sqlite3.Connection) -> None:
+    # Append-only log of task changes; seq never goes back, even after old events are pruned
+    conn.execute("""
+        CREATE TABLE events (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_at INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            task_id INTEGER NOT NULL,
+            queue_name TEXT NOT NULL,
+            task_text TEXT NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX idx_events_queue ON events(queue_name, seq)")
+    conn.execute("CREATE INDEX idx_events_created ON events(created_at)")
+
+
+def _compress_large_texts(conn: sqlite3.Connection) -> None:
+    # Large texts move to a compressed payload; tasks keeps a preview, and a hash for the duplicate check
+    conn.execute("ALTER TABLE tasks ADD COLUMN text_hash BLOB")
+    conn.execute("""
+        CREATE TABLE payloads (
+            task_id INTEGER PRIMARY KEY REFERENCES tasks(id),
+            data BLOB NOT NULL
+        )
+    """)
+    rows = conn.execute(
+        "SELECT id, task_text FROM tasks WHERE length(CAST(task_text AS BLOB)) > ?", (COMPRESS_THRESHOLD,)
+    ).fetchall()
+    for task_id, task_text in rows:
+        stored_text, text_hash, payload = encode_text(task_text)
+        conn.execute("UPDATE tasks SET task_text = ?, text_hash = ? WHERE id = ?", (stored_text, text_hash, task_id))
+        conn.execute("INSERT INTO payloads (task_id, data) VALUES (?, ?)", (task_id, payload))
+
+
+def _add_filter_indexes(conn: sqlite3.Connection) -> None:
+    # Index-only scans for list filters and counts. idx_queue_text also serves the duplicate check; it holds the start
+    # of each text and a 64-bit hash of the whole text, rather than a copy of every text
+    conn.execute("ALTER TABLE tasks ADD COLUMN text_key INTEGER NOT NULL DEFAULT 0")
+    conn.create_function("tqu_text_key", 2, text_key, deterministic=True)
+    conn.execute("UPDATE tasks SET text_key = tqu_text_key(task_text, text_hash)")
+    conn.execute(
+        f"CREATE INDEX idx_queue_created ON tasks(queue_id, completed_at, created_at, visible_at) {ACTIVE_ONLY}"
+    )
+    conn.execute(
+        f"CREATE INDEX idx_queue_text ON tasks(queue_id, completed_at, {text_prefix('task_text')}, text_key) "
+        f"{ACTIVE_ONLY}"
+    )
+
+
+def _add_active_id_index(conn: sqlite3.Connection) -> None:
+    # Active tasks of a queue in ID order: index seeks for random probes and for the newest task
+    conn.execute(f"CREATE INDEX idx_queue_active_id ON tasks(queue_id, completed_at, id, visible_at) {ACTIVE_ONLY}")
+
+
+def _add_task_keys(conn: sqlite3.Connection) -> None:
+    # Idempotency keys of added tasks, looked up by key and pruned by age
+    conn.execute("""
+        CREATE TABLE task_keys (
+            key TEXT PRIMARY KEY,
+            task_id INTEGER NOT NULL REFERENCES tasks(id),
+            created_at INTEGER NOT NULL
+        ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX idx_task_keys_created ON task_keys(created_at)")
+
+
+def _add_queue_limits(conn: sqlite3.Connection) -> None:
+    # Optional length limits, checked against active counts that triggers keep current on every change; the
+    # triggers also count the tasks ever added to and completed in each queue, so those counts never go back
+    conn.execute("ALTER TABLE queues ADD COLUMN max_length INTEGER")
+    conn.execute("ALTER TABLE queues ADD COLUMN active_count INTEGER NOT NULL DEFAULT 0")
+    conn.execute("ALTER TABLE queues ADD COLUMN added_count INTEGER NOT NULL DEFAULT 0")
+    conn.execute("ALTER TABLE queues ADD COLUMN completed_count INTEGER NOT NULL DEFAULT 0")
+    conn.execute("""
+        UPDATE queues
+        SET active_count = (SELECT COUNT(*) FROM tasks WHERE queue_id = queues.id AND completed_at IS NULL),
+            added_count = (SELECT COUNT(*) FROM tasks WHERE queue_id = queues.id),
+            completed_count = (SELECT COUNT(completed_at) FROM tasks WHERE queue_id = queues.id)
+    """)
+    conn.execute("""
+        CREATE TRIGGER tasks_count_insert AFTER INSERT ON tasks WHEN NEW.completed_at IS NULL
+        BEGIN
+            UPDATE queues SET active_count = active_count + 1, added_count = added_count + 1 WHERE id = NEW.queue_id;
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER tasks_count_delete AFTER DELETE ON tasks WHEN OLD.completed_at IS NULL
+        BEGIN
+            UPDATE queues SET active_count = active_count - 1 WHERE id = OLD.queue_id;
+        END
+    """)
+    # A task leaves the count of its old queue and joins that of its new one, which may be the same. Moving to
+    # another queue is not a completion, and releasing or moving a task in adds it again
+    conn.execute("""
+        CREATE TRIGGER tasks_count_leave AFTER UPDATE OF queue_id, completed_at ON tasks WHEN OLD.completed_at IS NULL
+        BEGIN
+            UPDATE queues
+            SET active_count = active_count - 1, completed_count = completed_count + (NEW.completed_at IS NOT NULL)
+            WHERE id = OLD.queue_id;
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER tasks_count_join AFTER UPDATE OF queue_id, completed_at ON tasks WHEN NEW.completed_at IS NULL
+        BEGIN
+            UPDATE queues
+            SET active_count = active_count + 1,
+                added_count = added_count + (OLD.completed_at IS NOT NULL OR OLD.queue_id != NEW.queue_id)
+            WHERE id = NEW.queue_id;
+        END
+    """)
+
+
+def _add_positions(conn: sqlite3.Connection) -> None:
+    # One ordering key for FIFO and LIFO: per-database sequence numbers that are microsecond timestamps
+    conn.execute("ALTER TABLE tasks ADD COLUMN position INTEGER NOT NULL DEFAULT 0")
+    positions = []
+    clock = 0
+    # Tasks of the same second keep the order of their IDs, as before; tasks scheduled for later take the position
+    # of the second they become due, as next_position gives them
+    rows = conn.execute("SELECT id, created_at, visible_at FROM tasks ORDER BY created_at, id").fetchall()
+    for task_id, created_at, visible_at in rows:
+        clock = max(created_at * 1_000_000, clock + 1)
+        positions.append((max(clock, visible_at * 1_000_000), task_id))
+    conn.executemany("UPDATE tasks SET position = ? WHERE id = ?", positions)
+    conn.execute("INSERT INTO meta (key, value) VALUES ('clock', ?)", (clock,))
+    # Pops walk idx_queue_position and skip scheduled tasks by visible_at in the index, without reading the table;
+    # id is spelled out so that (position, id) stays index-ordered with a column after it
+    conn.execute(
+        f"CREATE INDEX idx_queue_position ON tasks(queue_id, completed_at, position, id, visible_at) {ACTIVE_ONLY}"
+    )
+
+
+# Schema migrations in order; PRAGMA user_version records how many have been applied
+MIGRATIONS: List[Callable[[sqlite3.Connection], None]] = [
+    _create_tasks_table,
+    _normalize_queue_names,
+    _add_visible_at,
+    _add_sync_metadata,
+    _add_events,
+    _compress_large_texts,
+    _add_filter_indexes,
+    _add_active_id_index,
+    _add_task_keys,
+    _add_queue_limits,
+    _add_positions,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def encode_text(task_text: str) -> Tuple[str, Optional[bytes], Optional[bytes]]:
+    """Split a task text into the text stored in tasks, its hash and its compressed payload.
+
+    Only large texts get a hash and a payload; the others are stored as they are.
+    """
+    if not is_large(task_text):
+        return task_text, None, None
+    data = task_text.encode("utf-8")
+    return preview_text(task_text), hashlib.sha256(data).digest(), zlib.compress(data)
+
+
+def text_key(stored_text: str, text_hash: Optional[bytes]) -> int:
+    """Return a 64-bit hash of a task's full text, from the text and hash stored for it."""
+    digest = hashlib.sha256(stored_text.encode("utf-8")).digest() if text_hash is None else text_hash
+    return int.from_bytes(digest[:8], "big", signed=True)
+
+
+def text_prefix(column: str) -> str:
+    """Return the SQL expression indexed by idx_queue_text for a task_text column.
+
+    Queries that also compare task_text with a value use IS rather than =: with =,
+    SQLite substitutes the value into this expression, which then no longer
+    matches the index.
+    """
+    return f"substr({column}, 1, {TEXT_PREFIX_LENGTH})"
+
+
+def same_text(task: str, other: str = "other") -> str:
+    """Return a condition that task `other` has the text of task `task`, seeking idx_queue_text."""
+    return f"""
+        {text_prefix(f"{other}.task_text")} = {text_prefix(f"{task}.task_text")} AND {other}.text_key = {task}.text_key
+        AND {other}.task_text = {task}.task_text AND {other}.text_hash IS {task}.text_hash
+    """
+
+
+def _prefix_range(pattern: str) -> Optional[Tuple[str, Optional[str]]]:
+    # The range of indexed text prefixes that texts matching a glob pattern can have, if it has a fixed start
+    wildcards = [index for index in (pattern.find(char) for char in "*?[") if index >= 0]
+    prefix = pattern[: min(wildcards, default=len(pattern))][:TEXT_PREFIX_LENGTH]
+    if not prefix:
+        return None
+    following = ord(prefix[-1]) + 1
+    if 0xD800 <= following <= 0xDFFF:
+        following = 0xE000
+    return prefix, prefix[:-1] + chr(following) if following <= 0x10FFFF else None
+
+
+def decode_text(task_text: str, payload: Optional[bytes]) -> str:
+    return task_text if payload is None else zlib.decompress(payload).decode("utf-8")
+
+
+def _full_text(row: sqlite3.Row) -> Dict[str, Any]:
+    # Replace the stored preview with the full text, from a row that also selected the payload
+    task = dict(row)
+    task["task_text"] = decode_text(task["task_text"], task.pop("payload"))
+    return task
+
+
+def _task_filters(
+    queue_name: str,
+    scheduled: bool,
+    created_after: Optional[int],
+    created_before: Optional[int],
+    match: Optional[str],
+    schema: str = "main",
+    after_id: Optional[int] = None,
+) -> Tuple[str, List[Any]]:
+    """Build the WHERE clause selecting the due (or scheduled) tasks of a queue that pass the filters.
+
+    Age windows are ranges on idx_queue_created, which also covers visible_at, so
+    their counts never read the table. Glob patterns with a fixed start are ranges on
+    the text prefixes in idx_queue_text; only tasks in that range are read to check
+    the whole pattern. With after_id, only tasks after that task in list order are
+    selected, a range on the index the list is ordered by.
+    """
+    now = int(time.time())
+    conditions = [
+        f"queue_id = (SELECT id FROM {schema}.queues WHERE name = ?)",
+        "completed_at IS NULL",
+        f"visible_at {'>' if scheduled else '<='} ?",
+    ]
+    params: List[Any] = [queue_name, now]
+    if not scheduled:
+        conditions.append(due_positions(schema=schema))
+        params.append(now)
+    if created_after is not None:
+        conditions.append("created_at >= ?")
+        params.append(created_after)
+    if created_before is not None:
+        conditions.append("created_at < ?")
+        params.append(created_before)
+    if match is not None:
+        pattern = glob_pattern(match)
+        prefix_range = _prefix_range(pattern)
+        if prefix_range is not None:
+            low, high = prefix_range
+            conditions.append(f"{text_prefix('task_text')} >= ?")
+            params.append(low)
+            if high is not None:
+                conditions.append(f"{text_prefix('task_text')} < ?")
+                params.append(high)
+        conditions.append("task_text GLOB ?")
+        params.append(pattern)
+    if after_id is not None:
+        keys = ", ".join(_list_keys(scheduled))
+        conditions.append(f"({keys}) > (SELECT {keys} FROM {schema}.tasks WHERE id = ?)")
+        params.append(after_id)
+    return " AND ".join(conditions), params
+
+
+def _list_keys(scheduled: bool) -> Tuple[str, str]:
+    # Due tasks are listed in position order, scheduled ones in the order they become due
+    return ("visible_at", "id") if scheduled else ("position", "id")
+
+
+def list_task_page(
+    cursor: sqlite3.Cursor,
+    queue_name: str,
+    limit: Optional[int],
+    offset: int,
+    scheduled: bool,
+    created_after: Optional[int],
+    created_before: Optional[int],
+    match: Optional[str],
+    after_id: Optional[int],
+    newest: bool,
+    schema: str = "main",
+) -> List[Dict[str, Any]]:
+    """Return a page of the tasks selected by _task_filters, as Backend.list_tasks does.
+
+    With newest the index is walked from its end, so the last page costs the same
+    as the first one.
+    """
+    conditions, params = _task_filters(queue_name, scheduled, created_after, created_before, match, schema, after_id)
+    order = ", ".join(f"{key} {'DESC' if newest else 'ASC'}" for key in _list_keys(scheduled))
+    cursor.execute(
+        f"""
+        SELECT id, task_text, created_at, visible_at
+        FROM {schema}.tasks
+        WHERE {conditions}
+        ORDER BY {order}
+        LIMIT ? OFFSET ?
+    """,
+        (*params, -1 if limit is None else limit, offset),
+    )
+    tasks = [dict(row) for row in cursor.fetchall()]
+    return tasks[::-1] if newest else tasks
+
+
+def count_task_rows(
+    cursor: sqlite3.Cursor,
+    queue_name: str,
+    scheduled: bool,
+    created_after: Optional[int],
+    created_before: Optional[int],
+    match: Optional[str],
+    schema: str = "main",
+) -> int:
+    """Return the number of tasks selected by _task_filters, as Backend.count_tasks does.
+
+    The due tasks of an unfiltered list are the queue's active_count, kept by
+    triggers, less its scheduled tasks, so only the scheduled tasks are counted.
+    """
+    if scheduled or created_after is not None or created_before is not None or match is not None:
+        conditions, params = _task_filters(queue_name, scheduled, created_after, created_before, match, schema)
+        cursor.execute(f"SELECT COUNT(*) FROM {schema}.tasks WHERE {conditions}", params)
+        return cursor.fetchone()[0]
+    cursor.execute(f"{DUE_COUNT.format(schema=schema)} WHERE name = ?", (int(time.time()), queue_name))
+    row = cursor.fetchone()
+    return 0 if row is None else row[0]
+
+
+# Due tasks of a queue: its active_count, kept by triggers, less its scheduled tasks
+DUE_COUNT = """
+    SELECT active_count - (
+        SELECT COUNT(*) FROM {schema}.tasks WHERE queue_id = q.id AND completed_at IS NULL AND visible_at > ?
+    )
+    FROM {schema}.queues q
+"""
+
+# Active task count per queue of a database, as (name, task_count) rows, from the counts kept by triggers
+QUEUE_COUNTS = """
+    SELECT name, active_count AS task_count
+    FROM {schema}.queues
+    WHERE active_count > 0
+"""
+
+# Counts are kept in queues by triggers; the oldest active task is the first entry of
+# the queue's active range in idx_queue_created
+QUEUE_METRICS = """
+    SELECT
+        name,
+        active_count AS active,
+        (SELECT MIN(created_at) FROM {schema}.tasks WHERE queue_id = q.id AND completed_at IS NULL) AS oldest,
+        added_count AS added,
+        completed_count AS completed
+    FROM {schema}.queues q
+    WHERE added_count > 0
+"""
+
+# Selects the compressed payload of task t, if it has one
+PAYLOAD_COLUMN = "(SELECT data FROM payloads WHERE task_id = t.id) AS payload"
+
+
+def record_events(
+    cursor: sqlite3.Cursor,
+    kind: str,
+    ts: int,
+    where: str,
+    params: Sequence[Any],
+    queue_name: Optional[str] = None,
+    schema: str = "main",
+) -> None:
+    """Log an event of `kind` for every task matched by `where`, in the caller's transaction.
+
+    Events name the task's current queue unless `queue_name` is given.
+    """
+    cursor.execute(
+        f"""
+        INSERT INTO {schema}.events (created_at, kind, task_id, queue_name, task_text)
+        SELECT ?, ?, t.id, COALESCE(?, q.name), t.task_text
+        FROM {schema}.tasks t JOIN {schema}.queues q ON q.id = t.queue_id
+        WHERE {where}
+        ORDER BY t.position, t.id
+    """,
+        (ts, kind, queue_name, *params),
+    )
+
+
+# Columns of the tasks completed by complete_tasks, unaliased as RETURNING requires
+COMPLETED_COLUMNS = """
+    id, task_text, position,
+    (SELECT name FROM queues WHERE id = tasks.queue_id) AS queue_name
+"""
+
+# Also reads the compressed payload of each task, which only the tasks handed out need
+COMPLETED_COLUMNS_WITH_PAYLOAD = f"""
+    {COMPLETED_COLUMNS},
+    (SELECT data FROM payloads WHERE task_id = tasks.id) AS payload
+"""
+
+
+def complete_tasks(
+    cursor: sqlite3.Cursor, kind: str, ts: int, where: str, params: Sequence[Any], payload: bool = False
+) -> List[sqlite3.Row]:
+    """Complete the active tasks matched by `where`, log an event of `kind` for each and return them.
+
+    Runs right after begin_write(): the UPDATE ... RETURNING finds and completes the
+    tasks in one statement. Rows have COMPLETED_COLUMNS, or
+    COMPLETED_COLUMNS_WITH_PAYLOAD with payload, and come back in queue order; the
+    cursor's connection must use sqlite3.Row.
+    """
+    columns = COMPLETED_COLUMNS_WITH_PAYLOAD if payload else COMPLETED_COLUMNS
+    if HAS_RETURNING:
+        rows = cursor.execute(
+            f"UPDATE tasks SET completed_at = ?, updated_at = ? WHERE {where} RETURNING {columns}",
+            (ts, ts, *params),
+        ).fetchall()
+    else:
+        rows = cursor.execute(f"SELECT {columns} FROM tasks WHERE {where}", params).fetchall()
+        cursor.executemany(
+            "UPDATE tasks SET completed_at = ?, updated_at = ? WHERE id = ?", [(ts, ts, row["id"]) for row in rows]
+        )
+    rows.sort(key=lambda row: (row["position"], row["id"]))
+    cursor.executemany(
+        "INSERT INTO events (created_at, kind, task_id, queue_name, task_text) VALUES (?, ?, ?, ?, ?)",
+        [(ts, kind, row["id"], row["queue_name"], row["task_text"]) for row in rows],
+    )
+    return rows
+
+
+def begin_write(cursor: sqlite3.Cursor) -> int:
+    """Take the write lock and return the current time, to stamp the transaction's changes with.
+
+    The time is read once the lock is held, so a change that waited for the lock is
+    never stamped earlier than one committed meanwhile; sync's updated_at watermarks
+    rely on that.
+    """
+    cursor.execute("BEGIN IMMEDIATE")
+    return int(time.time())
+
+
+def next_position(cursor: sqlite3.Cursor, visible_at: int = 0) -> int:
+    """Return the position of a task added now and due at `visible_at`, in the caller's write transaction.
+
+    Positions order every queue, first to last. Each is the current time in
+    microseconds, or one more than the last position handed out if the clock has
+    not moved past it, so tasks keep the order they were added in even within a
+    microsecond or when the system clock steps back. A task scheduled for later
+    takes the position of the second it becomes due instead, without moving the
+    clock: it joins the queue behind the tasks added until then, and due tasks come
+    before it in idx_queue_position (see due_positions). Positions only order tasks;
+    a task's created_at stays the wall-clock time it was added at.
+    """
+    cursor.execute(
+        "UPDATE meta SET value = MAX(CAST(value AS INTEGER) + 1, ?) WHERE key = 'clock'",
+        (int(time.time() * 1_000_000),),
+    )
+    clock = cursor.execute("SELECT CAST(value AS INTEGER) FROM meta WHERE key = 'clock'").fetchone()[0]
+    return max(clock, visible_at * 1_000_000)
+
+
+def due_positions(column: str = "position", schema: str = "main") -> str:
+    """Return a condition that every due task's position meets, with a parameter for the current time.
+
+    Positions from the clock never pass its value, and a scheduled task's position is
+    the second it becomes due, so the condition ends each queue's range in
+    idx_queue_position before its scheduled tasks: pops and lists seek past them
+    instead of stepping over them. Only when the clock has run ahead of the wall
+    time are some scheduled tasks left in range, for the visible_at check to skip.
+    """
+    return f"{column} <= MAX((SELECT CAST(value AS INTEGER) FROM {schema}.meta WHERE key = 'clock'), ? * 1000000)"
+
+
+def advance_clock(cursor: sqlite3.Cursor, position: int, schema: str = "main") -> None:
+    """Make positions handed out later follow `position`, taken from another database.
+
+    Only pass positions that came from a clock, not the due second of a scheduled task.
+    """
+    cursor.execute(f"UPDATE {schema}.meta SET value = MAX(CAST(value AS INTEGER), ?) WHERE key = 'clock'", (position,))
+
+
+def _popped(row: sqlite3.Row) -> Dict[str, Any]:
+    return {"id": row["id"], "task_text": decode_text(row["task_text"], row["payload"])}
+
+
+class MaintenanceReport(NamedTuple):
+    elapsed: float
+    size_before: int  # Bytes of the database and its WAL file
+    size_after: int
+    vacuumed_pages: int
+    free_pages: int  # Left unused in the file, reclaimed only by a full vacuum
+    checkpointed: bool  # Whether the whole WAL was written back to the database
+    integrity: Optional[str]  # "ok", the problems found, or None if not checked
+
+    @property
+    def reclaimed(self) -> int:
+        return max(self.size_before - self.size_after, 0)
+
+
+def read_stored_profile(path: str) -> Optional[str]:
+    """Return the profile stored in a database by SQLiteBackend.store_profile, if any."""
+    if not Path(path).is_file():
+        return None
+    conn = sqlite3.connect(f"{Path(path).resolve().as_uri()}?mode=ro", uri=True)
+    try:
+        row = conn.execute("SELECT value FROM meta WHERE key = 'profile'").fetchone()
+    except sqlite3.Error:
+        # Created by a tqu version without the meta table, or not a tqu database at all; if
+        # the file cannot be read, init() fails on it and classifies the error
+        return None
+    finally:
+        conn.close()
+    return None if row is None else row[0]
+
+
+def is_transient(error: sqlite3.Error) -> bool:
+    """Return whether an error is caused by lock contention and may succeed when retried."""
+    code = getattr(error, "sqlite_errorcode", None)  # Python 3.11+
+    if code is not None:
+        return code & 0xFF in _TRANSIENT_ERROR_CODES
+    message = str(error).lower()
+    return isinstance(error, sqlite3.OperationalError) and ("locked" in message or "busy" in message)
+
+
+def retrying(message: str) -> Callable[[Callable[..., T]], Callable[..., T]]:
+    """Retry a backend method on transient SQLite errors and classify the final failure.
+
+    Each method runs in its own transaction, so a failed attempt has been rolled back
+    and is safe to repeat. Waits use exponential backoff with full jitter.
+    """
+
+    def decorator(method: Callable[..., T]) -> Callable[..., T]:
+        @functools.wraps(method)
+        def wrapper(self: "SQLiteBackend", *args: Any, **kwargs: Any) -> T:
+            attempt = 0
+            while True:
+                try:
+                    return method(self, *args, **kwargs)
+                except sqlite3.Error as e:
+                    if not is_transient(e):
+                        raise PermanentDatabaseError(f"{message}: {str(e)}", e)
+                    if attempt >= self.max_retries:
+                        instrumentation.increment("db.retries_exhausted")
+                        raise TransientDatabaseError(f"{message}: {str(e)}", e)
+                    attempt += 1
+                    instrumentation.increment("db.retries")
+                    time.sleep(random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2**attempt)))
+
+        return wrapper
+
+    return decorator
+
+
+class SQLiteBackend(Backend):
+    """Backend storing tasks in a SQLite database file.
+
+    With read_only, connections are opened with mode=ro and can never take the
+    write lock; together with WAL this lets reads run alongside a busy writer.
+    """
+
+    name = "sqlite"
+
+    def __init__(
+        self,
+        path: str,
+        busy_timeout: float = DEFAULT_BUSY_TIMEOUT,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        read_only: bool = False,
+        profile: Profile = PROFILES[DEFAULT_PROFILE],
+    ) -> None:
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self.max_retries = max_retries
+        self.read_only = read_only
+        self.profile = profile
+        self._pinned: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._pinned is not None:
+            # Undo any row factory set by a previous call on the shared connection
+            self._pinned.row_factory = None
+            return self._pinned
+        if self.read_only:
+            conn = sqlite3.connect(f"{Path(self.path).resolve().as_uri()}?mode=ro", uri=True, timeout=self.busy_timeout)
+        else:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout)
+        for pragma in self.profile.pragmas():
+            conn.execute(pragma)
+        return conn
+
+    @contextmanager
+    def session(self) -> Iterator[None]:
+        if self._pinned is not None:
+            yield
+            return
+        self._pinned = self._connect()
+        try:
+            yield
+        finally:
+            conn, self._pinned = self._pinned, None
+            conn.close()
+
+    @retrying("Failed to read data version")
+    def data_version(self) -> int:
+        with self._connect() as conn:
+            return conn.execute("PRAGMA data_version").fetchone()[0]
+
+    @retrying("Failed to initialize database")
+    def init(self) -> None:
+        """Create or migrate the schema and switch the database to WAL; no DDL runs if the schema is current."""
+        if self.read_only:
+            if Path(self.path).is_file():
+                with self._connect() as conn:
+                    if self._schema_version(conn) == SCHEMA_VERSION:
+                        return
+            # A read-only connection can neither create nor migrate the schema, so do that once over a writable one
+            SQLiteBackend(self.path, self.busy_timeout, self.max_retries).init()
+            return
+
+        with self._connect() as conn:
+            version = self._schema_version(conn)
+            if version == 0:
+                # Only takes effect before the first table is created; lets maintain() free pages incrementally
+                conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            if version < SCHEMA_VERSION:
+                self._migrate(conn)
+            # Persistent in the file; in WAL mode readers never block the writer, nor the writer readers
+            if conn.execute("PRAGMA journal_mode").fetchone()[0] != "wal":
+                conn.execute("PRAGMA journal_mode = WAL")
+
+    @staticmethod
+    def _schema_version(conn: sqlite3.Connection) -> int:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version > SCHEMA_VERSION:
+            raise DatabaseError(
+                f"Database schema version {version} is newer than the supported version {SCHEMA_VERSION}."
+            )
+        return version
+
+    def _migrate(self, conn: sqlite3.Connection) -> None:
+        isolation_level = conn.isolation_level
+        conn.isolation_level = None
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Another process may have migrated while we waited for the lock
+                version = conn.execute("PRAGMA user_version").fetchone()[0]
+                for migration in MIGRATIONS[version:]:
+                    migration(conn)
+                conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        finally:
+            conn.isolation_level = isolation_level
+
+    @retrying("Failed to store profile")
+    def store_profile(self, name: Optional[str]) -> None:
+        """Make `name` the database's own profile, used when TQU_PROFILE is not set; None removes it."""
+        with self._connect() as conn:
+            if name is None:
+                conn.execute("DELETE FROM meta WHERE key = 'profile'")
+            else:
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('profile', ?)", (name,))
+
+    def _file_size(self) -> int:
+        files = [Path(self.path), Path(f"{self.path}-wal")]
+        return sum(file.stat().st_size for file in files if file.exists())
+
+    @retrying("Failed to maintain database")
+    def maintain(self, vacuum: bool = False, quick: bool = False) -> MaintenanceReport:
+        """Refresh planner statistics, free unused pages, checkpoint the WAL and check integrity.
+
+        Free pages are released incrementally in databases created with auto_vacuum, as
+        new ones are. With vacuum, the whole file is rebuilt instead, which also switches
+        older databases to incremental auto_vacuum but locks out every other connection
+        meanwhile. With quick, statistics are sampled, the checkpoint never waits for
+        readers and integrity is not checked, so it suits running between writes.
+        """
+        start = time.monotonic()
+        size_before = self._file_size()
+        with self._connect() as conn:
+            isolation_level = conn.isolation_level
+            # VACUUM and the pragmas below cannot run inside a transaction
+            conn.isolation_level = None
+            try:
+                # Recorded first, so that writers reaching TQU_MAINTAIN_EVERY meanwhile leave this run to finish
+                conn.execute(
+                    """
+                    INSERT OR REPLACE INTO meta (key, value)
+                    VALUES ('maintained_seq', COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'events'), 0))
+                """
+                )
+                conn.execute(f"PRAGMA analysis_limit = {QUICK_ANALYSIS_LIMIT if quick else 0}")
+                conn.execute("ANALYZE")
+                conn.execute("PRAGMA analysis_limit = 0")
+
+                pages = conn.execute("PRAGMA page_count").fetchone()[0]
+                if vacuum:
+                    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                    conn.execute("VACUUM")
+                elif conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+                    # Frees one page per result row, so every row has to be fetched
+                    conn.execute("PRAGMA incremental_vacuum").fetchall()
+                vacuumed_pages = pages - conn.execute("PRAGMA page_count").fetchone()[0]
+
+                mode = "PASSIVE" if quick else "TRUNCATE"
+                busy, wal_frames, checkpointed_frames = conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone()
+                integrity = None
+                if not quick:
+                    integrity = "\n".join(row[0] for row in conn.execute("PRAGMA integrity_check"))
+                free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            finally:
+                conn.isolation_level = isolation_level
+        return MaintenanceReport(
+            elapsed=time.monotonic() - start,
+            size_before=size_before,
+            size_after=self._file_size(),
+            vacuumed_pages=vacuumed_pages,
+            free_pages=free_pages,
+            checkpointed=not busy and wal_frames == checkpointed_frames,
+            integrity=integrity,
+        )
+
+    @retrying("Failed to read maintenance state")
+    def changes_since_maintenance(self) -> int:
+        """Return how many task changes were logged since maintain() last ran, or since the database was created."""
+        with self._connect() as conn:
+            return conn.execute(
+                """
+                SELECT COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'events'), 0)
+                    - COALESCE((SELECT CAST(value AS INTEGER) FROM meta WHERE key = 'maintained_seq'), 0)
+            """
+            ).fetchone()[0]
+
+    @retrying("Failed to add task")
+    def add_task(
+        self,
+        task_text: str,
+        queue_name: str,
+        visible_at: Optional[int] = None,
+        key: Optional[str] = None,
+        key_retention: int = DEFAULT_KEY_RETENTION,
+    ) -> AddedTask:
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            if key is not None:
+                # A retried add is answered by one primary key lookup, without waiting for the write lock
+                task_id = self._find_key(cursor, key, int(time.time()) - key_retention)
+                if task_id is not None:
+                    return AddedTask(task_id, True)
+            # Take the write lock before the duplicate check, so the check and the insert are atomic
+            ts = begin_write(cursor)
+            if key is not None:
+                # Another producer may have added with the same key while we waited for the lock
+                task_id = self._find_key(cursor, key, ts - key_retention)
+                if task_id is not None:
+                    return AddedTask(task_id, True)
+            queue_id = self._ensure_queue(cursor, queue_name)
+            stored_text, text_hash, payload = encode_text(task_text)
+            key_of_text = text_key(stored_text, text_hash)
+            cursor.execute(
+                f"""
+                SELECT id FROM tasks
+                WHERE queue_id = ? AND completed_at IS NULL AND {text_prefix("task_text")} = {text_prefix("?")}
+                AND text_key = ? AND task_text IS ? AND text_hash IS ?
+            """,
+                (queue_id, stored_text, key_of_text, stored_text, text_hash),
+            )
+            if cursor.fetchone():
+                raise TaskAlreadyExistsError(task_text, queue_name)
+            max_length, active_count = cursor.execute(
+                "SELECT max_length, active_count FROM queues WHERE id = ?", (queue_id,)
+            ).fetchone()
+            if max_length is not None and active_count >= max_length:
+                raise QueueFullError(queue_name, max_length)
+
+            visible_at = ts if visible_at is None else visible_at
+            cursor.execute(
+                f"""
+                INSERT INTO tasks (
+                    queue_id, task_text, text_hash, text_key, created_at, updated_at, completed_at, visible_at, uid,
+                    position
+                )
+                VALUES (?, ?, ?, ?, ?, ?, NULL, ?, {NEW_UID}, ?)
+            """,
+                (queue_id, stored_text, text_hash, key_of_text, ts, ts, visible_at, next_position(cursor, visible_at)),
+            )
+            task_id = cursor.lastrowid
+            if payload is not None:
+                cursor.execute("INSERT INTO payloads (task_id, data) VALUES (?, ?)", (task_id, payload))
+            if key is not None:
+                # Expired keys are removed as keyed adds go by, oldest first along idx_task_keys_created
+                cursor.execute("DELETE FROM task_keys WHERE created_at < ?", (ts - key_retention,))
+                cursor.execute(
+                    "INSERT OR REPLACE INTO task_keys (key, task_id, created_at) VALUES (?, ?, ?)", (key, task_id, ts)
+                )
+            record_events(cursor, EVENT_ADD, ts, "t.id = ?", (task_id,))
+        return AddedTask(task_id, False)
+
+    @staticmethod
+    def _find_key(cursor: sqlite3.Cursor, key: str, since: int) -> Optional[int]:
+        row = cursor.execute("SELECT task_id FROM task_keys WHERE key = ? AND created_at >= ?", (key, since)).fetchone()
+        return None if row is None else row[0]
+
+    @retrying("Failed to get task")
+    def get_task(self, task_id: int) -> Dict[str, Any]:
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.cursor()
+            cursor.execute(
+                f"""
+                SELECT t.id, q.name AS queue_name, t.task_text, t.created_at, t.completed_at, t.visible_at,
+                    {PAYLOAD_COLUMN}
+                FROM tasks t JOIN queues q ON q.id = t.queue_id
+                WHERE t.id = ?
+            """,
+                (task_id,),
+            )
+            row = cursor.fetchone()
+            if row is None:
+                raise TaskNotFoundError(task_id)
+            return _full_text(row)
+
+    @retrying("Failed to list tasks")
+    def list_tasks(
+        self,
+        queue_name: str,
+        limit: Optional[int] = None,
+        offset: int = 0,
+        scheduled: bool = False,
+        created_after: Optional[int] = None,
+        created_before: Optional[int] = None,
+        match: Optional[str] = None,
+        after_id: Optional[int] = None,
+        newest: bool = False,
+    ) -> List[Dict[str, Any]]:
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            return list_task_page(
+                conn.cursor(),
+                queue_name,
+                limit,
+                offset,
+                scheduled,
+                created_after,
+                created_before,
+                match,
+                after_id,
+                newest,
+            )
+
+    @retrying("Failed to count tasks")
+    def count_tasks(
+        self,
+        queue_name: str,
+        scheduled: bool = False,
+        created_after: Optional[int] = None,
+        created_before: Optional[int] = None,
+        match: Optional[str] = None,
+    ) -> int:
+        with self._connect() as conn:
+            return count_task_rows(conn.cursor(), queue_name, scheduled, created_after, created_before, match)
+
+    @retrying("Failed to pop last task")
+    def pop_last(self, queue_name: str) -> Dict[str, Any]:
+        return self._pop_one(queue_name, "position DESC, id DESC")
+
+    @retrying("Failed to pop first task")
+    def pop_first(self, queue_name: str) -> Dict[str, Any]:
+        return self._pop_one(queue_name, "position ASC, id ASC")
+
+    def _pop_one(self, queue_name: str, order: str) -> Dict[str, Any]:
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.cursor()
+            ts = begin_write(cursor)
+            rows = complete_tasks(
+                cursor,
+                EVENT_COMPLETE,
+                ts,
+                f"""
+                id = (
+                    SELECT id FROM tasks
+                    WHERE queue_id = (SELECT id FROM queues WHERE name = ?) AND completed_at IS NULL
+                    AND visible_at <= ? AND {due_positions()}
+                    ORDER BY {order}
+                    LIMIT 1
+                )
+            """,
+                (queue_name, ts, ts),
+                payload=True,
+            )
+            if not rows:
+                raise EmptyQueueError(queue_name)
+            return _popped(rows[0])
+
+    @retrying("Failed to claim tasks")
+    def claim_tasks(self, queue_name: str, limit: int) -> List[Dict[str, Any]]:
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.cursor()
+            ts = begin_write(cursor)
+            # Selecting and completing in one write transaction, so concurrent workers never claim the same task
+            rows = complete_tasks(
+                cursor,
+                EVENT_COMPLETE,
+                ts,
+                f"""
+                id IN (
+                    SELECT id FROM tasks
+                    WHERE queue_id = (SELECT id FROM queues WHERE name = ?) AND completed_at IS NULL
+                    AND visible_at <= ? AND {due_positions()}
+                    ORDER BY position ASC, id ASC
+                    LIMIT ?
+                )
+            """,
+                (queue_name, ts, ts, limit),
+                payload=True,
+            )
+            return [_popped(row) for row in rows]
+
+    @retrying("Failed to pop random tasks")
+    def pop_random(self, queue_name: str, limit: int) -> List[Dict[str, Any]]:
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.cursor()
+            ts = begin_write(cursor)
+            queue_id = self._find_queue(cursor, queue_name)
+            task_ids = []
+            while queue_id is not None and len(task_ids) < limit:
+                task_id = self._random_task_id(cursor, queue_id, ts)
+                if task_id is None:
+                    break
+                # Completed right away, so later probes cannot pick it again
+                cursor.execute("UPDATE tasks SET completed_at = ?, updated_at = ? WHERE id = ?", (ts, ts, task_id))
+                task_ids.append(task_id)
+
+            tasks = []
+            for task_id in task_ids:
+                cursor.execute(f"SELECT t.id, t.task_text, {PAYLOAD_COLUMN} FROM tasks t WHERE t.id = ?", (task_id,))
+                tasks.append(_full_text(cursor.fetchone()))
+                record_events(cursor, EVENT_COMPLETE, ts, "t.id = ?", (task_id,))
+            return tasks
+
+    @staticmethod
+    def _random_task_id(cursor: sqlite3.Cursor, queue_id: int, now: int) -> Optional[int]:
+        """Pick a due task of a queue at random, every due task equally likely.
+
+        A probe draws an ID between the queue's lowest and highest active IDs and takes
+        the first active task from there. That task is accepted with probability
+        1 / (its ID - the previous active ID), which makes every due task equally
+        likely, with a few index seeks however long the queue. When the queue's IDs
+        are sparse, most probes are rejected; after RANDOM_PROBES a random rank below
+        the number of due tasks is drawn instead and the task at that rank read from
+        idx_queue_active_id. That walks the index up to the rank, but keeps the pick
+        uniform; there is no fallback that favours some tasks.
+        """
+        active = "queue_id = ? AND completed_at IS NULL"
+        row = cursor.execute(
+            f"""
+            SELECT (SELECT id FROM tasks WHERE {active} ORDER BY id ASC LIMIT 1),
+                   (SELECT id FROM tasks WHERE {active} ORDER BY id DESC LIMIT 1)
+        """,
+            (queue_id, queue_id),
+        ).fetchone()
+        low, high = row[0], row[1]
+        if low is None:
+            return None
+        for _ in range(RANDOM_PROBES):
+            probe = random.randint(low, high)
+            task_id, visible_at = cursor.execute(
+                f"SELECT id, visible_at FROM tasks WHERE {active} AND id >= ? ORDER BY id ASC LIMIT 1",
+                (queue_id, probe),
+            ).fetchone()
+            if visible_at > now:
+                continue
+            previous = cursor.execute(
+                f"SELECT id FROM tasks WHERE {active} AND id < ? ORDER BY id DESC LIMIT 1", (queue_id, task_id)
+            ).fetchone()
+            gap = task_id - (low - 1 if previous is None else previous[0])
+            if random.random() * gap < 1:
+                return task_id
+        (due,) = cursor.execute(f"{DUE_COUNT.format(schema='main')} WHERE id = ?", (now, queue_id)).fetchone()
+        if due <= 0:
+            return None
+        row = cursor.execute(
+            f"SELECT id FROM tasks WHERE {active} AND visible_at <= ? ORDER BY id ASC LIMIT 1 OFFSET ?",
+            (queue_id, now, random.randrange(due)),
+        ).fetchone()
+        return None if row is None else row[0]
+
+    @retrying("Failed to release task")
+    def release_task(self, task_id: int) -> bool:
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            ts = begin_write(cursor)
+            cursor.execute(
+                f"""
+                UPDATE tasks
+                SET completed_at = NULL, updated_at = ?
+                WHERE id = ? AND completed_at IS NOT NULL AND NOT EXISTS (
+                    SELECT 1 FROM tasks AS other
+                    WHERE other.queue_id = tasks.queue_id AND other.completed_at IS NULL AND {same_text("tasks")}
+                )
+            """,
+                (ts, task_id),
+            )
+            if cursor.rowcount != 1:
+                return False
+            # A released task is available again, just like a newly added one
+            record_events(cursor, EVENT_ADD, ts, "t.id = ?", (task_id,))
+            return True
+
+    @retrying("Failed to delete task")
+    def delete_task(self, task_id: int) -> Tuple[str, str]:
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.cursor()
+            ts = begin_write(cursor)
+            rows = complete_tasks(cursor, EVENT_DELETE, ts, "id = ? AND completed_at IS NULL", (task_id,))
+            if not rows:
+                raise TaskNotFoundError(task_id)
+            return rows[0]["queue_name"], rows[0]["task_text"]
+
+    @retrying("Failed to delete queue")
+    def delete_queue(self, queue_name: str) -> List[Dict[str, Any]]:
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.cursor()
+            ts = begin_write(cursor)
+            rows = complete_tasks(
+                cursor,
+                EVENT_DELETE,
+                ts,
+                "queue_id = (SELECT id FROM queues WHERE name = ?) AND completed_at IS NULL",
+                (queue_name,),
+            )
+            if not rows:
+                raise EmptyQueueError(queue_name)
+            return [{"id": row["id"], "task_text": row["task_text"]} for row in rows]
+
+    @retrying("Failed to rename queue")
+    def rename_queue(self, queue_name: str, new_name: str) -> None:
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            ts = begin_write(cursor)
+            queue_id = self._find_queue(cursor, queue_name)
+            if queue_id is None:
+                raise QueueNotFoundError(queue_name)
+            target_id = self._find_queue(cursor, new_name)
+            if target_id == queue_id:
+                return
+            if target_id is not None:
+                if self._has_active_tasks(cursor, target_id):
+                    raise QueueAlreadyExistsError(new_name)
+                # Only completed tasks are left under the new name; keep them, and its counts, with the renamed queue
+                cursor.execute("UPDATE tasks SET queue_id = ? WHERE queue_id = ?", (queue_id, target_id))
+                cursor.execute(
+                    """
+                    UPDATE queues
+                    SET added_count = added_count + (SELECT added_count FROM queues WHERE id = ?),
+                        completed_count = completed_count + (SELECT completed_count FROM queues WHERE id = ?)
+                    WHERE id = ?
+                """,
+                    (target_id, target_id, queue_id),
+                )
+                cursor.execute("DELETE FROM queues WHERE id = ?", (target_id,))
+            # Only the queue row changes; sync carries the rename over to its active tasks
+            cursor.execute("UPDATE queues SET name = ?, updated_at = ? WHERE id = ?", (new_name, ts, queue_id))
+            cursor.execute(
+                "INSERT INTO events (created_at, kind, task_id, queue_name, task_text) VALUES (?, ?, 0, ?, ?)",
+                (ts, EVENT_RENAME, queue_name, new_name),
+            )
+
+    @retrying("Failed to merge queues")
+    def merge_queues(self, source: str, target: str) -> Tuple[int, int]:
+        if source == target:
+            raise QueueError(f"Cannot merge queue '{source}' into itself.")
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            ts = begin_write(cursor)
+            source_id = self._find_queue(cursor, source)
+            if source_id is None:
+                raise QueueNotFoundError(source)
+            target_id = self._ensure_queue(cursor, target)
+
+            duplicate_condition = f"""
+                t.queue_id = ? AND t.completed_at IS NULL AND EXISTS (
+                    SELECT 1 FROM tasks AS other
+                    WHERE other.queue_id = ? AND other.completed_at IS NULL AND {same_text("t")}
+                )
+            """
+            record_events(cursor, EVENT_DELETE, ts, duplicate_condition, (source_id, target_id))
+            cursor.execute(
+                f"""
+                UPDATE tasks AS t
+                SET completed_at = ?, updated_at = ?
+                WHERE {duplicate_condition}
+            """,
+                (ts, ts, source_id, target_id),
+            )
+            duplicates = cursor.rowcount
+            record_events(cursor, EVENT_MOVE, ts, "t.queue_id = ? AND t.completed_at IS NULL", (source_id,), target)
+            cursor.execute(
+                """
+                UPDATE tasks
+                SET queue_id = ?, updated_at = ?
+                WHERE queue_id = ? AND completed_at IS NULL
+            """,
+                (target_id, ts, source_id),
+            )
+            moved = cursor.rowcount
+            cursor.execute("UPDATE tasks SET queue_id = ? WHERE queue_id = ?", (target_id, source_id))
+            cursor.execute("DELETE FROM queues WHERE id = ?", (source_id,))
+            return moved, duplicates
+
+    @retrying("Failed to move tasks")
+    def move_tasks(
+        self, source: str, target: str, limit: Optional[int] = 1, last: bool = False, task_id: Optional[int] = None
+    ) -> Tuple[int, int]:
+        if source == target:
+            raise QueueError(f"Cannot move tasks from queue '{source}' into itself.")
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            ts = begin_write(cursor)
+            selected = "t.queue_id = (SELECT id FROM queues WHERE name = ?) AND t.completed_at IS NULL"
+            params: List[Any] = [source]
+            if task_id is not None:
+                selected += " AND t.id = ?"
+                params.append(task_id)
+            else:
+                selected += f" AND t.visible_at <= ? AND {due_positions('t.position')}"
+                params.extend([ts, ts])
+                if limit is not None:
+                    # Pin the selection to a range of positions, so dropping duplicates does not widen it
+                    direction = "DESC" if last else "ASC"
+                    cursor.execute(
+                        f"""
+                        SELECT position, id FROM tasks t WHERE {selected}
+                        ORDER BY position {direction}, id {direction}
+                        LIMIT 1 OFFSET ?
+                    """,
+                        (*params, limit - 1),
+                    )
+                    row = cursor.fetchone()
+                    if row is not None:
+                        selected += f" AND (t.position, t.id) {'>=' if last else '<='} (?, ?)"
+                        params.extend(row)
+            target_id = self._ensure_queue(cursor, target)
+
+            duplicate_condition = f"""
+                {selected} AND EXISTS (
+                    SELECT 1 FROM tasks AS other
+                    WHERE other.queue_id = ? AND other.completed_at IS NULL AND {same_text("t")}
+                )
+            """
+            record_events(cursor, EVENT_DELETE, ts, duplicate_condition, (*params, target_id))
+            cursor.execute(
+                f"UPDATE tasks AS t SET completed_at = ?, updated_at = ? WHERE {duplicate_condition}",
+                (ts, ts, *params, target_id),
+            )
+            duplicates = cursor.rowcount
+            record_events(cursor, EVENT_MOVE, ts, selected, params, target)
+            cursor.execute(
+                f"UPDATE tasks AS t SET queue_id = ?, updated_at = ? WHERE {selected}", (target_id, ts, *params)
+            )
+            moved = cursor.rowcount
+            if not moved and not duplicates:
+                # Leaving the block with an exception rolls back the target queue created above
+                raise EmptyQueueError(source) if task_id is None else TaskNotFoundError(task_id)
+            return moved, duplicates
+
+    @retrying("Failed to limit queue")
+    def set_queue_limit(self, queue_name: str, max_length: Optional[int]) -> None:
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            begin_write(cursor)
+            queue_id = self._ensure_queue(cursor, queue_name)
+            cursor.execute("UPDATE queues SET max_length = ? WHERE id = ?", (max_length, queue_id))
+
+    @retrying("Failed to read queue limit")
+    def queue_limit(self, queue_name: str) -> Tuple[Optional[int], int]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT max_length, active_count FROM queues WHERE name = ?", (queue_name,)).fetchone()
+            return (None, 0) if row is None else row
+
+    @retrying("Failed to list queues")
+    def list_queues(self) -> List[Tuple[str, int]]:
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"{QUEUE_COUNTS.format(schema='main')} ORDER BY name")
+            return cursor.fetchall()
+
+    @retrying("Failed to collect queue metrics")
+    def queue_metrics(self) -> List[Dict[str, Any]]:
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.cursor()
+            cursor.execute(f"{QUEUE_METRICS.format(schema='main')} ORDER BY name")
+            return [dict(row) for row in cursor.fetchall()]
+
+    @retrying("Failed to find task")
+    def task_exists(self, task_id: int) -> bool:
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                SELECT id FROM tasks
+                WHERE id = ? AND completed_at IS NULL
+            """,
+                (task_id,),
+            )
+            return cursor.fetchone() is not None
+
+    @retrying("Failed to read events")
+    def list_events(
+        self, from_seq: int = 0, queue_name: Optional[str] = None, limit: Optional[int] = None, newest: bool = False
+    ) -> List[Dict[str, Any]]:
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.cursor()
+            queue_condition = "" if queue_name is None else "AND queue_name = ?"
+            cursor.execute(
+                f"""
+                SELECT seq, created_at, kind, task_id, queue_name, task_text
+                FROM events
+                WHERE seq >= ? {queue_condition}
+                ORDER BY seq {"DESC" if newest else "ASC"}
+                LIMIT ?
+            """,
+                (from_seq, *([] if queue_name is None else [queue_name]), -1 if limit is None else limit),
+            )
+            events = [dict(row) for row in cursor.fetchall()]
+            return events[::-1] if newest else events
+
+    @retrying("Failed to prune events")
+    def prune_events(self, before: int) -> int:
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM events WHERE created_at < ?", (before,))
+            return cursor.rowcount
+
+    @staticmethod
+    def _find_queue(cursor: sqlite3.Cursor, queue_name: str) -> Optional[int]:
+        row = cursor.execute("SELECT id FROM queues WHERE name = ?", (queue_name,)).fetchone()
+        return row[0] if row else None
+
+    @staticmethod
+    def _ensure_queue(cursor: sqlite3.Cursor, queue_name: str) -> int:
+        cursor.execute("INSERT OR IGNORE INTO queues (name) VALUES (?)", (queue_name,))
+        return cursor.execute("SELECT id FROM queues WHERE name = ?", (queue_name,)).fetchone()[0]
+
+    @staticmethod
+    def _has_active_tasks(cursor: sqlite3.Cursor, queue_id: int) -> bool:
+        cursor.execute("SELECT 1 FROM tasks WHERE queue_id = ? AND completed_at IS NULL LIMIT 1", (queue_id,))
+        return cursor.fetchone() is not None
@@ -0,0 +1,156 @@
+import gzip
+import shutil
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, NamedTuple, Optional
+
+from tqu import db
+from tqu.backends import SQLiteBackend
+from tqu.backends.sqlite import SCHEMA_VERSION
+from tqu.exceptions import DatabaseError
+
+DEFAULT_PAGES = 256
+DEFAULT_SLEEP = 0.005
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+class BackupResult(NamedTuple):
+    path: Path
+    pages: int
+    size: int
+    elapsed: float
+
+
+def database_path() -> str:
+    """Return the path of the SQLite database that backups read and restores write."""
+    backend = db.get_backend()
+    if not isinstance(backend, SQLiteBackend):
+        raise DatabaseError(f"Backup and restore need a SQLite database, not the {backend.name} backend.")
+    return backend.path
+
+
+def _check_integrity(conn: sqlite3.Connection) -> None:
+    result = conn.execute("PRAGMA integrity_check").fetchone()[0]
+    if result != "ok":
+        raise DatabaseError(f"Integrity check failed: {result}")
+
+
+def _copy(
+    source: sqlite3.Connection,
+    target: sqlite3.Connection,
+    pages: int,
+    sleep: float,
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> int:
+    """Copy a database in steps of `pages` pages, or in one step if `pages` is -1.
+
+    Between steps, `sleep` seconds pass and other connections can take the locks
+    the copy holds. SQLite restarts the copy by itself if another connection
+    changes the source in between.
+    """
+    total_pages = 0
+
+    def on_progress(status: int, remaining: int, total: int) -> None:
+        nonlocal total_pages
+        total_pages = total
+        if progress:
+            progress(total - remaining, total)
+        if remaining and sleep:
+            time.sleep(sleep)
+
+    source.backup(target, pages=pages, progress=on_progress, sleep=max(sleep, DEFAULT_SLEEP))
+    return total_pages
+
+
+def backup(
+    destination: str,
+    compress: bool = False,
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> BackupResult:
+    """Back up the database to `destination` while other processes keep using it.
+
+    The copy is made in one step, within one read transaction: in WAL mode writers
+    carry on meanwhile, and their commits cannot restart it as they would restart a
+    copy made in steps. The copy is integrity-checked before it replaces
+    `destination`, optionally gzipped.
+    """
+    source_path = database_path()
+    target = Path(destination)
+    start = time.monotonic()
+    with tempfile.TemporaryDirectory(dir=target.parent) as temp_dir:
+        temp_path = Path(temp_dir) / "backup.sqlite"
+        try:
+            # Read-only, like the other commands that only read, so a backup never takes the write lock
+            source = sqlite3.connect(f"{Path(source_path).resolve().as_uri()}?mode=ro", uri=True)
+            copy = sqlite3.connect(temp_path)
+            try:
+                total_pages = _copy(source, copy, -1, 0, progress)
+                _check_integrity(copy)
+            finally:
+                copy.close()
+                source.close()
+        except sqlite3.Error as e:
+            raise DatabaseError(f"Failed to back up database: {str(e)}", e)
+
+        if compress:
+            compressed_path = Path(temp_dir) / "backup.sqlite.gz"
+            with temp_path.open("rb") as src, gzip.open(compressed_path, "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            temp_path = compressed_path
+        temp_path.replace(target)
+
+    return BackupResult(target, total_pages, target.stat().st_size, time.monotonic() - start)
+
+
+def restore(
+    source: str,
+    pages: int = DEFAULT_PAGES,
+    sleep: float = DEFAULT_SLEEP,
+    progress: Optional[Callable[[int, int], None]] = None,
+) -> BackupResult:
+    """Replace the database with a backup made by `backup()`, plain or gzipped.
+
+    The backup is checked for integrity and a known schema version first, and is
+    written through SQLite so connections held by other processes stay valid.
+    """
+    target_path = database_path()
+    source_file = Path(source)
+    start = time.monotonic()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        with source_file.open("rb") as f:
+            compressed = f.read(2) == GZIP_MAGIC
+        if compressed:
+            temp_path = Path(temp_dir) / "restore.sqlite"
+            with gzip.open(source_file, "rb") as src, temp_path.open("wb") as dst:
+                shutil.copyfileobj(src, dst)
+            source_file = temp_path
+
+        try:
+            # Read-only, so validating a backup can never modify it
+            copy = sqlite3.connect(f"{source_file.resolve().as_uri()}?mode=ro", uri=True)
+            try:
+                _check_integrity(copy)
+                version = copy.execute("PRAGMA user_version").fetchone()[0]
+                has_tasks = copy.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'tasks'")
+                if has_tasks.fetchone() is None:
+                    raise DatabaseError(f"'{source}' is not a tqu database.")
+                if version > SCHEMA_VERSION:
+                    raise DatabaseError(
+                        f"Backup schema version {version} is newer than the supported version {SCHEMA_VERSION}."
+                    )
+                target = sqlite3.connect(target_path)
+                try:
+                    total_pages = _copy(copy, target, pages, sleep, progress)
+                finally:
+                    target.close()
+            finally:
+                copy.close()
+        except sqlite3.Error as e:
+            raise DatabaseError(f"Failed to restore database: {str(e)}", e)
+
+    # Backups of older schema versions are migrated in place
+    db.init_db()
+    return BackupResult(Path(target_path), total_pages, Path(target_path).stat().st_size, time.monotonic() - start)
@@ -1,16 +1,26 @@
+import json
+import os
+import re
 import sys
-from typing import Any, Callable, Dict, Optional
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
 
 import click
 from rich import box
-from rich.console import Console
+from rich.console import Console, RenderableType
+from rich.live import Live
 from rich.panel import Panel
 from rich.style import Style
 from rich.table import Table
 from rich.text import Text
 
-from tqu import db
+from tqu import backup as backups
+from tqu import completion, db, instrumentation, metrics, worker
+from tqu import sync as syncing
+from tqu.backends.sqlite import PROFILES
 from tqu.exceptions import (
+    EXIT_PERMANENT_ERROR,
     DatabaseError,
     EmptyQueueError,
     QueueNotFoundError,
@@ -20,6 +30,19 @@ from tqu.exceptions import (
 )
 
 console = Console()
+error_console = Console(stderr=True)
+
+# Rows shown at each end of a long task table
+WINDOW_SIZE = 20
+
+# Commands that only read, run over read-only connections like the queue overview
+READ_ONLY_COMMANDS = {"list", "show", "tail", "metrics", "backup"}
+
+# Commands that can read several databases given with --db at once, besides the queue overview
+COMBINED_COMMANDS = {"list", "metrics"}
+
+# Seconds per unit accepted by --delay
+DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
 
 # Consistent styling
 STYLES = {
@@ -33,134 +56,421 @@ STYLES = {
 
 
 @click.group(invoke_without_command=True)
+@click.option(
+    "--db",
+    "databases",
+    multiple=True,
+    type=click.Path(dir_okay=False),
+    envvar="TQU_DB_PATHS",
+    help="Database to use instead of TQU_DB_PATH. Repeat to view several at once.",
+)
+@click.option("--stats", is_flag=True, help="Print instrumentation counters to stderr on exit.")
+@click.option("--watch", is_flag=True, help="Keep the queue overview open and update it on changes.")
+@click.option("--interval", type=click.FloatRange(min=0.05), default=1.0, help="Seconds between change checks.")
 @click.pass_context
-def cli(ctx: click.Context) -> None:
+def cli(ctx: click.Context, databases: Tuple[str, ...], stats: bool, watch: bool, interval: float) -> None:
     """Task Queue CLI application."""
+    if stats:
+        ctx.call_on_close(show_stats)
+    if watch and ctx.invoked_subcommand is not None:
+        raise click.UsageError("--watch applies to the queue overview; use 'tqu list --watch' to watch a queue.")
+    if len(databases) > 1 and ctx.invoked_subcommand not in (None, *COMBINED_COMMANDS):
+        raise click.UsageError(f"'{ctx.invoked_subcommand}' works on a single database; pass one --db.")
+    if databases:
+        ctx.with_resource(db.databases(databases))
+    if ctx.invoked_subcommand is None or ctx.invoked_subcommand in READ_ONLY_COMMANDS:
+        ctx.with_resource(db.read_only())
     db.init_db()
     if ctx.invoked_subcommand is None:
-        show_queues()
+        if watch:
+            watch_view(build_queues_view, interval)
+        else:
+            show_queues()
+
+
+class Duration(click.ParamType):
+    """A duration such as 90, 30s, 10m or 1h30m, converted to seconds."""
+
+    name = "duration"
+
+    def convert(self, value: Any, param: Optional[click.Parameter], ctx: Optional[click.Context]) -> int:
+        if isinstance(value, int):
+            return value
+        text = str(value).strip().lower()
+        if text.isdigit():
+            return int(text)
+        parts = re.findall(r"(\d+)([smhd])", text)
+        if not parts or "".join(number + unit for number, unit in parts) != text:
+            self.fail(f"{value!r} is not a duration like 90, 30s, 10m or 1h30m.", param, ctx)
+        return sum(int(number) * DURATION_UNITS[unit] for number, unit in parts)
+
+
+class Timestamp(click.ParamType):
+    """A Unix timestamp or an ISO 8601 date and time (local time unless it has an offset)."""
+
+    name = "timestamp"
+
+    def convert(self, value: Any, param: Optional[click.Parameter], ctx: Optional[click.Context]) -> int:
+        if isinstance(value, int):
+            return value
+        text = str(value).strip()
+        if text.isdigit():
+            return int(text)
+        try:
+            return int(datetime.fromisoformat(re.sub(r"[Zz]$", "+00:00", text)).timestamp())
+        except ValueError:
+            self.fail(f"{value!r} is not a Unix timestamp or an ISO 8601 date and time.", param, ctx)
+
+
+def format_timestamp(ts: int) -> str:
+    return datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def build_queues_view() -> RenderableType:
+    """Build the overview of all active queues."""
+    queues = db.list_queues()
+    if not queues:
+        return Panel("No active queues found.", style="yellow", box=box.ROUNDED)
+
+    table = Table(title="Active Queues", box=box.ROUNDED)
+    table.add_column("Queue Name", style="blue")
+    table.add_column("Number of Tasks", justify="right", style="cyan")
+
+    for name, count in queues:
+        table.add_row(name, f"{count}")
+
+    return table
 
 
 def show_queues() -> None:
     """Display all active queues."""
     try:
-        queues = db.list_queues()
-        if not queues:
-            console.print(Panel("No active queues found.", style="yellow", box=box.ROUNDED))
-            return
+        console.print(build_queues_view())
+    except DatabaseError as e:
+        exit_with_error(f"Failed to list queues: {e.message}", e.exit_code)
 
-        table = Table(title="Active Queues", box=box.ROUNDED)
-        table.add_column("Queue Name", style="blue")
-        table.add_column("Number of Tasks", justify="right", style="cyan")
 
-        for name, count in queues:
-            table.add_row(name, f"{count}")
+def watch_view(build_view: Callable[[], RenderableType], interval: float) -> None:
+    """Show a view and rebuild it in place whenever the database changes, until interrupted.
 
-        console.print(table)
-    except DatabaseError as e:
-        exit_with_error(f"Failed to list queues: {e.message}")
+    Everything runs over one connection, and the view is only rebuilt when the
+    database's data version moves, so an idle queue costs one cheap PRAGMA per interval.
+    """
+    try:
+        with db.session():
+            version = db.data_version()
+            with Live(build_view(), console=console, auto_refresh=False) as live:
+                try:
+                    while True:
+                        time.sleep(interval)
+                        current = db.data_version()
+                        if current != version:
+                            version = current
+                            live.update(build_view(), refresh=True)
+                except KeyboardInterrupt:
+                    pass
+    except TQUError as e:
+        exit_with_error(e.message, e.exit_code)
 
 
 @cli.command()
 @click.argument("task_text")
-@click.argument("queue", required=False, default="default")
-def add(task_text: str, queue: str) -> None:
-    """Add a task to the specified queue."""
+@click.argument("queue", required=False, default="default", shell_complete=completion.complete_queue)
+@click.option("--delay", type=Duration(), help="Keep the task hidden from pops for this long, e.g. 10m or 1h30m.")
+@click.option("--at", "at", type=Timestamp(), help="Keep the task hidden from pops until this time.")
+@click.option("--key", help="Idempotency key: adding again with the same key returns the first task's ID.")
+@click.option("--wait", type=Duration(), default=0, help="If the queue is full, wait this long for room, e.g. 30s.")
+def add(task_text: str, queue: str, delay: Optional[int], at: Optional[int], key: Optional[str], wait: int) -> None:
+    """Add a task to the specified queue.
+
+    With --key, a retried add (say, after a timeout) never adds the task twice,
+    even if it has been popped since: it reports the ID of the task first added.
+    """
+    if delay is not None and at is not None:
+        raise click.UsageError("--delay and --at cannot be used together.")
+    visible_at = int(time.time()) + delay if delay is not None else at
     try:
-        db.add_task(task_text, queue)
+        task_id, replayed = db.add_task(task_text, queue, visible_at, key, wait)
         text = Text()
-        text.append("Added task to '", style="white")
+        if replayed:
+            text.append("Task ", style="white")
+            text.append(str(task_id), style=STYLES["id"])
+            text.append(f" already added with key '{key}'", style="white")
+            console.print(text)
+            return
+        text.append("Added task ", style="white")
+        text.append(str(task_id), style=STYLES["id"])
+        text.append(" to '", style="white")
         text.append(queue, style=STYLES["queue"])
         text.append("' queue: ", style="white")
         text.append(task_text, style=STYLES["task"])
+        if visible_at is not None:
+            text.append(f" (due {format_timestamp(visible_at)})", style="white")
         console.print(text)
     except TaskAlreadyExistsError as e:
         console.print(f"[yellow]{e.message}[/yellow]")
     except TQUError as e:
-        exit_with_error(e.message)
-
-
-@cli.command()
-@click.argument("queue", required=False, default="default")
-def list(queue: str) -> None:
-    """List all tasks in the specified queue."""
+        exit_with_error(e.message, e.exit_code)
+
+
+def build_task_table(
+    title: str,
+    head: Sequence[Dict[str, Any]],
+    tail: Sequence[Dict[str, Any]] = (),
+    hidden: int = 0,
+    due: bool = False,
+) -> Table:
+    """Build a task table, with a summary row standing in for hidden rows between head and tail.
+
+    With due, a column shows when each task becomes visible to pops.
+    """
+    table = Table(title=title, box=box.ROUNDED)
+    table.add_column("ID", justify="right", style="cyan")
+    table.add_column("Task", style="yellow")
+    if due:
+        table.add_column("Due", style="magenta")
+
+    def add_row(task: Dict[str, Any]) -> None:
+        table.add_row(str(task["id"]), task["task_text"], *([format_timestamp(task["visible_at"])] if due else []))
+
+    for task in head:
+        add_row(task)
+    if hidden:
+        table.add_row("…", Text(f"{hidden:,} more tasks", style="dim italic"))
+        for task in tail:
+            add_row(task)
+        table.caption = f"Showing {len(head) + len(tail):,} of {len(head) + len(tail) + hidden:,} tasks"
+
+    return table
+
+
+def scheduled_note(queue: str) -> Optional[str]:
+    """Describe the tasks of a queue that are not due yet, if there are any."""
+    count = db.count_tasks(queue, scheduled=True)
+    if not count:
+        return None
+    return f"{count:,} scheduled {'task' if count == 1 else 'tasks'} not yet due (tqu list {queue} --scheduled)"
+
+
+def windowed_task_table(title: str, tasks: Sequence[Dict[str, Any]], window: Optional[int]) -> Table:
+    """Build a task table from tasks already in memory, showing at most `window` rows at each end."""
+    if window is None or len(tasks) <= 2 * window:
+        return build_task_table(title, tasks)
+    return build_task_table(title, tasks[:window], tasks[-window:], len(tasks) - 2 * window)
+
+
+def build_tasks_view(
+    queue: str,
+    window: Optional[int] = WINDOW_SIZE,
+    scheduled: bool = False,
+    filters: Optional[Dict[str, Any]] = None,
+) -> RenderableType:
+    """Build the table of due tasks in a queue, or of its scheduled tasks with scheduled.
+
+    With a window, only the first and last `window` tasks are fetched and rendered,
+    both read from an end of the queue's index, so the cost stays the same however
+    long the queue grows. Filters are passed on to db.list_tasks, so only matching
+    rows are read.
+    """
+    title = f"Scheduled Tasks in '{queue}' Queue" if scheduled else f"Tasks in '{queue}' Queue"
+    query = {"scheduled": scheduled, **(filters or {})}
+    note = None if scheduled or filters else scheduled_note(queue)
     try:
-        tasks = db.list_tasks(queue)
-        if not tasks:
+        head = db.list_tasks(queue, limit=window, **query)
+        if not head:
             raise EmptyQueueError(queue)
+        tail: List[Dict[str, Any]] = []
+        if window is not None and len(head) == window:
+            # One task more than the window tells whether any are left out between the two ends
+            tail = db.list_tasks(queue, limit=window + 1, after_id=head[-1]["id"], newest=True, **query)
+        if window is None or len(tail) <= window:
+            table = build_task_table(title, head + tail, due=scheduled)
+        else:
+            hidden = max(db.count_tasks(queue, **query) - 2 * window, 1)
+            table = build_task_table(title, head, tail[1:], hidden, due=scheduled)
+        if note:
+            table.caption = f"{table.caption}; {note}" if table.caption else note.capitalize()
+        return table
+    except EmptyQueueError as e:
+        if filters:
+            message = f"No tasks in '{queue}' queue match the filters."
+        else:
+            message = f"No scheduled tasks in '{queue}' queue." if scheduled else e.message
+        return Panel(f"{message} {note.capitalize()}." if note else message, style="yellow", box=box.ROUNDED)
+
+
+def page_tasks(queue: str, page_size: int, scheduled: bool = False, filters: Optional[Dict[str, Any]] = None) -> None:
+    """Print a queue one page at a time, fetching each page only when the user asks for it."""
+    title = f"Scheduled Tasks in '{queue}' Queue" if scheduled else f"Tasks in '{queue}' Queue"
+    query = {"scheduled": scheduled, **(filters or {})}
+    total = db.count_tasks(queue, **query)
+    shown = 0
+    after_id = None
+    while True:
+        # Each page follows on from the last task shown, so later pages cost no more than the first
+        tasks = db.list_tasks(queue, limit=page_size, after_id=after_id, **query)
+        if not tasks:
+            if shown == 0:
+                raise EmptyQueueError(queue)
+            return
 
-        table = Table(title=f"Tasks in '{queue}' Queue", box=box.ROUNDED)
-        table.add_column("ID", justify="right", style="cyan")
-        table.add_column("Task", style="yellow")
+        table = build_task_table(title, tasks, due=scheduled)
+        table.caption = f"Tasks {shown + 1:,}-{shown + len(tasks):,} of {total:,}"
+        console.print(table)
+        shown += len(tasks)
+        after_id = tasks[-1]["id"]
+        if shown >= total:
+            return
 
-        for task in tasks:
-            table.add_row(str(task["id"]), task["task_text"])
+        console.print("[dim]-- More -- press any key for the next page, q to quit[/dim]")
+        if click.getchar() in ("q", "Q"):
+            return
 
-        console.print(table)
+
+@cli.command()
+@click.argument("queue", required=False, default="default", shell_complete=completion.complete_queue)
+@click.option("--all", "show_all", is_flag=True, help="Show every task instead of the first and last few.")
+@click.option("--page", "page_size", type=click.IntRange(min=1), help="Page through tasks, N at a time.")
+@click.option("--scheduled", is_flag=True, help="List tasks that are not due yet, soonest first.")
+@click.option("--older-than", type=Duration(), help="Only tasks added at least this long ago, e.g. 2d.")
+@click.option("--newer-than", type=Duration(), help="Only tasks added less than this long ago, e.g. 1h.")
+# The name of --newer-than before it was renamed, kept so that existing scripts keep working
+@click.option("--since", type=Duration(), hidden=True)
+@click.option("--match", help="Only tasks whose text contains this text, or matches it as a glob pattern.")
+@click.option("--count", "count_only", is_flag=True, help="Print only the number of matching tasks.")
+@click.option("--watch", is_flag=True, help="Keep the list open and update it on changes.")
+@click.option("--interval", type=click.FloatRange(min=0.05), default=1.0, help="Seconds between change checks.")
+def list(
+    queue: str,
+    show_all: bool,
+    page_size: Optional[int],
+    scheduled: bool,
+    older_than: Optional[int],
+    newer_than: Optional[int],
+    since: Optional[int],
+    match: Optional[str],
+    count_only: bool,
+    watch: bool,
+    interval: float,
+) -> None:
+    """List all due tasks in the specified queue."""
+    if watch and (count_only or page_size is not None):
+        raise click.UsageError("--watch cannot be combined with --count or --page.")
+    if since is not None:
+        if newer_than is not None:
+            raise click.UsageError("--since is another name for --newer-than; pass only one of them.")
+        newer_than = since
+    window = None if show_all else WINDOW_SIZE
+    now = int(time.time())
+    filters = {
+        name: value
+        for name, value in [
+            ("created_before", None if older_than is None else now - older_than + 1),
+            ("created_after", None if newer_than is None else now - newer_than + 1),
+            ("match", match),
+        ]
+        if value is not None
+    }
+    if watch:
+        watch_view(lambda: build_tasks_view(queue, window, scheduled, filters), interval)
+        return
+    try:
+        if count_only:
+            click.echo(db.count_tasks(queue, scheduled, **filters))
+        elif page_size is not None:
+            page_tasks(queue, page_size, scheduled, filters)
+        else:
+            console.print(build_tasks_view(queue, window, scheduled, filters))
     except EmptyQueueError as e:
         console.print(Panel(e.message, style="yellow", box=box.ROUNDED))
     except TQUError as e:
-        exit_with_error(e.message)
+        exit_with_error(e.message, e.exit_code)
+
+
+@cli.command()
+@click.argument("task_id", type=int)
+def show(task_id: int) -> None:
+    """Print the full text of the task with TASK_ID, active or completed."""
+    try:
+        click.echo(db.get_task(task_id)["task_text"])
+    except TQUError as e:
+        exit_with_error(e.message, e.exit_code)
 
 
 def pop_task(queue: str, pop_function: Callable[[str], Dict[str, Any]]) -> None:
     """Remove a task using the provided pop function."""
     try:
         task = pop_function(queue)
-        text = Text()
-        text.append("Removed from '", style="white")
-        text.append(queue, style=STYLES["queue"])
-        text.append("' queue: ", style="white")
-        text.append(task["task_text"], style=STYLES["task"])
-        console.print(text)
+        console.print(removed_text(queue, task))
     except EmptyQueueError as e:
         console.print(Panel(e.message, style="yellow", box=box.ROUNDED))
     except TQUError as e:
-        exit_with_error(e.message)
+        exit_with_error(e.message, e.exit_code)
+
+
+def removed_text(queue: str, task: Dict[str, Any]) -> Text:
+    text = Text()
+    text.append("Removed from '", style="white")
+    text.append(queue, style=STYLES["queue"])
+    text.append("' queue: ", style="white")
+    text.append(task["task_text"], style=STYLES["task"])
+    return text
 
 
 @cli.command()
-@click.argument("queue", required=False, default="default")
+@click.argument("queue", required=False, default="default", shell_complete=completion.complete_queue)
 def pop(queue: str) -> None:
     """Remove the last task from the queue (alias for poplast)."""
     pop_task(queue, db.pop_last)
 
 
 @cli.command(name="poplast")
-@click.argument("queue", required=False, default="default")
+@click.argument("queue", required=False, default="default", shell_complete=completion.complete_queue)
 def pop_last(queue: str) -> None:
     """Remove the last task from the queue."""
     pop_task(queue, db.pop_last)
 
 
 @cli.command(name="popfirst")
-@click.argument("queue", required=False, default="default")
+@click.argument("queue", required=False, default="default", shell_complete=completion.complete_queue)
 def pop_first(queue: str) -> None:
     """Remove the first task from the queue."""
     pop_task(queue, db.pop_first)
 
 
+@cli.command(name="poprandom")
+@click.argument("queue", required=False, default="default", shell_complete=completion.complete_queue)
+@click.option("-n", "count", type=click.IntRange(min=1), default=1, help="Number of tasks to remove.")
+def pop_random(queue: str, count: int) -> None:
+    """Remove random tasks from the queue."""
+    try:
+        tasks = db.pop_random(queue, count)
+        if not tasks:
+            raise EmptyQueueError(queue)
+        for task in tasks:
+            console.print(removed_text(queue, task))
+    except EmptyQueueError as e:
+        console.print(Panel(e.message, style="yellow", box=box.ROUNDED))
+    except TQUError as e:
+        exit_with_error(e.message, e.exit_code)
+
+
 @cli.command()
-@click.argument("id_or_queue", required=False, default="default")
+@click.argument("id_or_queue", required=False, default="default", shell_complete=completion.complete_id_or_queue)
 def delete(id_or_queue: str) -> None:
     """Delete a task by ID or an entire queue by name."""
+    # Queue names cannot be numeric, so there is no need to look the ID up before deleting
     try:
-        is_id, entity_id = db.find_by_id_or_name(id_or_queue)
-
-        if is_id:
-            delete_task_by_id(entity_id)
-        else:
-            delete_queue_by_name(id_or_queue)
-    except TQUError as e:
-        exit_with_error(e.message)
+        task_id = int(id_or_queue)
+    except ValueError:
+        delete_queue_by_name(id_or_queue)
+    else:
+        delete_task_by_id(task_id)
 
 
-def delete_task_by_id(task_id: Optional[int]) -> None:
+def delete_task_by_id(task_id: int) -> None:
     """Delete a specific task by its ID."""
     try:
-        if task_id is None:
-            raise TaskNotFoundError("unknown")
-
         result = db.delete_task(task_id)
         queue_name, task_text = result
         text = Text()
@@ -174,28 +484,377 @@ def delete_task_by_id(task_id: Optional[int]) -> None:
     except TaskNotFoundError as e:
         console.print(f"[yellow]{e.message}[/yellow]")
     except TQUError as e:
-        exit_with_error(e.message)
+        exit_with_error(e.message, e.exit_code)
 
 
 def delete_queue_by_name(queue_name: str) -> None:
     """Delete an entire queue and all its tasks."""
     try:
         tasks = db.delete_queue(queue_name)
-        table = Table(title=f"Deleted '{queue_name}' Queue", box=box.ROUNDED)
-        table.add_column("ID", justify="right", style="cyan")
-        table.add_column("Task", style="yellow")
-
-        for task in tasks:
-            table.add_row(str(task["id"]), task["task_text"])
-
+        table = windowed_task_table(f"Deleted '{queue_name}' Queue", tasks, WINDOW_SIZE)
         console.print(Panel(f"Deleted '{queue_name}' queue with {len(tasks)} tasks:", style="green", box=box.ROUNDED))
         console.print(table)
     except EmptyQueueError as e:
         console.print(Panel(e.message, style="yellow", box=box.ROUNDED))
     except QueueNotFoundError as e:
-        exit_with_error(e.message)
+        exit_with_error(e.message, e.exit_code)
+    except TQUError as e:
+        exit_with_error(e.message, e.exit_code)
+
+
+@cli.command()
+@click.argument("queue")
+@click.argument("new_name")
+def rename(queue: str, new_name: str) -> None:
+    """Rename a queue."""
+    try:
+        db.rename_queue(queue, new_name)
+        text = Text()
+        text.append("Renamed queue '", style="white")
+        text.append(queue, style=STYLES["queue"])
+        text.append("' to '", style="white")
+        text.append(new_name, style=STYLES["queue"])
+        text.append("'", style="white")
+        console.print(text)
+    except TQUError as e:
+        exit_with_error(e.message, e.exit_code)
+
+
+@cli.command()
+@click.argument("source")
+@click.argument("target")
+def merge(source: str, target: str) -> None:
+    """Move all tasks from the source queue into the target queue."""
+    try:
+        moved, duplicates = db.merge_queues(source, target)
+        console.print(moved_text(source, target, moved, duplicates))
+    except TQUError as e:
+        exit_with_error(e.message, e.exit_code)
+
+
+@cli.command()
+@click.argument("source")
+@click.argument("target")
+@click.option("--first", "end", flag_value="first", default=True, help="Move the least recent tasks [default].")
+@click.option("--last", "end", flag_value="last", help="Move the most recent tasks.")
+@click.option("--id", "task_id", type=int, help="Move the task with this ID.")
+@click.option("-n", "count", type=click.IntRange(min=1), help="Number of tasks to move [default: 1].")
+@click.option("--all", "move_all", is_flag=True, help="Move every due task.")
+def move(source: str, target: str, end: str, task_id: Optional[int], count: Optional[int], move_all: bool) -> None:
+    """Move due tasks from the source queue to the target queue in one step.
+
+    Unlike popping a task and adding it again, the task keeps its ID and age,
+    and a crash can never lose it. Tasks already in the target queue are dropped.
+    """
+    if task_id is not None and (count is not None or move_all):
+        raise click.UsageError("--id cannot be combined with -n or --all.")
+    if count is not None and move_all:
+        raise click.UsageError("-n and --all are mutually exclusive.")
+    try:
+        moved, duplicates = db.move_tasks(source, target, None if move_all else count or 1, end == "last", task_id)
+        console.print(moved_text(source, target, moved, duplicates))
+    except TQUError as e:
+        exit_with_error(e.message, e.exit_code)
+
+
+def moved_text(source: str, target: str, moved: int, duplicates: int) -> Text:
+    text = Text()
+    text.append(f"Moved {moved} tasks from '", style="white")
+    text.append(source, style=STYLES["queue"])
+    text.append("' to '", style="white")
+    text.append(target, style=STYLES["queue"])
+    text.append("'", style="white")
+    if duplicates:
+        text.append(f" ({duplicates} already in '{target}' were dropped)", style=STYLES["warning"])
+    return text
+
+
+@cli.command()
+@click.argument("queue")
+@click.argument("command", nargs=-1, required=True, type=click.UNPROCESSED)
+@click.option(
+    "-c", "--concurrency", type=click.IntRange(min=1), default=os.cpu_count() or 1, help="Commands to run at once."
+)
+@click.option(
+    "--batch", "batch_size", type=click.IntRange(min=1), help="Tasks to claim per query [default: concurrency]."
+)
+@click.option("--retries", type=click.IntRange(min=0), default=0, help="Times to requeue a task whose command fails.")
+def work(queue: str, command: Tuple[str, ...], concurrency: int, batch_size: Optional[int], retries: int) -> None:
+    """Run each task of QUEUE as COMMAND, replacing {} with the task text.
+
+    Put COMMAND after `--`, for example `tqu work jobs -c 4 -- sh -c 'echo {}'`. If it has
+    no {}, the task text is appended as the last argument. Stops when the queue is
+    empty; on Ctrl+C, running commands finish and unstarted tasks go back to the queue.
+    """
+
+    def report(result: worker.TaskResult) -> None:
+        text = Text()
+        if result.returncode == 0:
+            text.append("✓ ", style=STYLES["success"])
+        else:
+            text.append("✗ ", style=STYLES["error"])
+        text.append(f"[{result.task['id']}] ", style=STYLES["id"])
+        text.append(result.task["task_text"], style=STYLES["task"])
+        text.append(f" {result.duration:.2f}s", style="white")
+        if result.returncode != 0:
+            text.append(f" exit {result.returncode}", style=STYLES["error"])
+            if result.requeued:
+                text.append(" (requeued)", style=STYLES["warning"])
+        console.print(text)
+
+    try:
+        with worker.stop_on_signals() as stop:
+            summary = worker.work(queue, command, concurrency, batch_size or concurrency, retries, report, stop)
+        if not summary.processed:
+            raise EmptyQueueError(queue)
+
+        message = (
+            f"Processed {summary.processed} tasks in {summary.elapsed:.2f}s ({summary.throughput:.1f} tasks/s): "
+            f"{summary.succeeded} succeeded, {summary.failed} failed"
+        )
+        if summary.requeued:
+            message += f", {summary.requeued} requeued"
+        if summary.released:
+            message += f", {summary.released} released unstarted"
+        console.print(Panel(message, style="red" if summary.failed else "green", box=box.ROUNDED))
+        if summary.failed:
+            sys.exit(1)
+    except EmptyQueueError as e:
+        console.print(Panel(e.message, style="yellow", box=box.ROUNDED))
+    except TQUError as e:
+        exit_with_error(e.message, e.exit_code)
+
+
+@cli.command(name="metrics")
+@click.option("-o", "--output", type=click.Path(dir_okay=False), help="Write to a file atomically instead of stdout.")
+@click.option("--serve", "port", type=click.IntRange(min=0, max=65535), help="Serve metrics over HTTP on this port.")
+@click.option("--bind", default="127.0.0.1", show_default=True, help="Address to serve metrics on.")
+def export_metrics(output: Optional[str], port: Optional[int], bind: str) -> None:
+    """Export queue metrics in the Prometheus text format."""
+    try:
+        if port is None:
+            if output:
+                metrics.write_textfile(output)
+            else:
+                click.echo(metrics.render_metrics(), nl=False)
+            return
+
+        server = metrics.make_server(bind, port)
+        host, bound_port = server.server_address[:2]
+        error_console.print(f"Serving metrics on http://{host}:{bound_port}/metrics", highlight=False)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+    except TQUError as e:
+        exit_with_error(e.message, e.exit_code)
+    except OSError as e:
+        exit_with_error(f"Failed to export metrics: {e}")
+
+
+@cli.command()
+@click.argument("destination", type=click.Path(dir_okay=False))
+@click.option("--gzip", "compress", is_flag=True, help="Compress the backup (implied by a .gz destination).")
+def backup(destination: str, compress: bool) -> None:
+    """Back up the database to DESTINATION without blocking other processes."""
+    try:
+        result = backups.backup(destination, compress or destination.endswith(".gz"))
+        text = Text()
+        text.append("Backed up ", style="white")
+        text.append(f"{result.pages} pages", style=STYLES["id"])
+        text.append(f" to {result.path} ({result.size:,} bytes, {result.elapsed:.2f}s, integrity ok)", style="white")
+        console.print(text)
+    except TQUError as e:
+        exit_with_error(e.message, e.exit_code)
+    except OSError as e:
+        exit_with_error(f"Failed to back up database: {e}")
+
+
+@cli.command()
+@click.argument("source", type=click.Path(exists=True, dir_okay=False))
+@click.option("--pages", type=click.IntRange(min=1), default=backups.DEFAULT_PAGES, help="Pages copied per step.")
+@click.option("--sleep", "sleep_ms", type=click.FloatRange(min=0), default=5.0, help="Milliseconds between steps.")
+@click.option("-y", "--yes", is_flag=True, help="Do not ask for confirmation.")
+def restore(source: str, pages: int, sleep_ms: float, yes: bool) -> None:
+    """Replace the database with the backup in SOURCE."""
+    try:
+        if not yes and not click.confirm(f"Replace all tasks in {backups.database_path()} with '{source}'?"):
+            return
+        result = backups.restore(source, pages, sleep_ms / 1000)
+        console.print(
+            Text(f"Restored {result.pages} pages from {source} in {result.elapsed:.2f}s", style=STYLES["success"])
+        )
+    except TQUError as e:
+        exit_with_error(e.message, e.exit_code)
+    except OSError as e:
+        exit_with_error(f"Failed to restore database: {e}")
+
+
+@cli.command()
+@click.argument("other", type=click.Path(exists=True, dir_okay=False))
+def sync(other: str) -> None:
+    """Exchange tasks changed since the last sync with the database in OTHER."""
+    try:
+        result = syncing.sync(other)
+        text = Text()
+        text.append(f"Synced with {other}: ", style="white")
+        text.append(f"{result.pulled} pulled", style=STYLES["id"])
+        text.append(", ", style="white")
+        text.append(f"{result.pushed} pushed", style=STYLES["id"])
+        if result.duplicates:
+            text.append(f", {result.duplicates} duplicates dropped", style=STYLES["warning"])
+        text.append(f" ({result.elapsed:.2f}s)", style="white")
+        console.print(text)
+    except TQUError as e:
+        exit_with_error(e.message, e.exit_code)
+
+
+def format_event(event: Dict[str, Any], as_json: bool = False) -> str:
+    """Format an event as one tab-separated line, or as a JSON object."""
+    if as_json:
+        return json.dumps(event, ensure_ascii=False)
+    fields = [event["seq"], format_timestamp(event["created_at"]), event["kind"]]
+    return "\t".join(str(field) for field in [*fields, event["queue_name"], event["task_id"], event["task_text"]])
+
+
+@cli.command()
+@click.argument("queue", required=False)
+@click.option("-f", "--follow", is_flag=True, help="Keep printing events as they are logged.")
+@click.option("--from", "from_seq", type=click.IntRange(min=0), help="Start at this event sequence number.")
+@click.option("-n", "--lines", type=click.IntRange(min=0), default=10, help="Recent events to show without --from.")
+@click.option("--json", "as_json", is_flag=True, help="Print one JSON object per event.")
+@click.option("--interval", type=click.FloatRange(min=0.05), default=1.0, help="Seconds between change checks.")
+def tail(
+    queue: Optional[str], follow: bool, from_seq: Optional[int], lines: int, as_json: bool, interval: float
+) -> None:
+    """Print the log of added, completed, deleted and moved tasks, of all queues or of QUEUE."""
+    try:
+        if from_seq is None:
+            recent = db.list_events(queue_name=queue, limit=max(lines, 1), newest=True)
+            if not recent:
+                from_seq = 0
+            else:
+                from_seq = recent[0]["seq"] if lines else recent[-1]["seq"] + 1
+        for event in db.iter_events(from_seq, queue, follow, interval):
+            click.echo(format_event(event, as_json))
+    except KeyboardInterrupt:
+        pass
     except TQUError as e:
-        exit_with_error(e.message)
+        exit_with_error(e.message, e.exit_code)
+
+
+@cli.command(name="prune-events")
+@click.option("--older-than", "max_age", type=Duration(), required=True, help="Age of the events to remove, e.g. 30d.")
+def prune_events(max_age: int) -> None:
+    """Remove events older than the given age from the events log."""
+    try:
+        pruned = db.prune_events(max_age)
+        console.print(Text(f"Removed {pruned:,} events", style=STYLES["success"]))
+    except TQUError as e:
+        exit_with_error(e.message, e.exit_code)
+
+
+@cli.command()
+@click.option("--vacuum", is_flag=True, help="Rebuild the whole file, locking out other processes meanwhile.")
+@click.option("--quick", is_flag=True, help="Sample statistics, never wait for readers and skip the integrity check.")
+def maintain(vacuum: bool, quick: bool) -> None:
+    """Refresh query planner statistics, free unused pages, checkpoint the WAL and check integrity.
+
+    Set TQU_MAINTAIN_EVERY=N to run quick maintenance after every N task changes instead.
+    """
+    try:
+        report = db.maintain(vacuum, quick)
+    except TQUError as e:
+        exit_with_error(e.message, e.exit_code)
+    text = Text()
+    text.append(f"Maintained the database in {report.elapsed:.2f}s: reclaimed ", style="white")
+    text.append(f"{report.reclaimed:,} bytes", style=STYLES["id"])
+    text.append(
+        f" ({report.size_before:,} → {report.size_after:,}), {report.vacuumed_pages:,} pages freed", style="white"
+    )
+    if report.integrity is not None:
+        text.append(", integrity ok" if report.integrity == "ok" else ", integrity check failed", style="white")
+    console.print(text)
+    if report.free_pages:
+        console.print(
+            Text(
+                f"{report.free_pages:,} unused pages remain; 'tqu maintain --vacuum' frees them.",
+                style=STYLES["warning"],
+            )
+        )
+    if not report.checkpointed:
+        console.print(Text("The WAL is still in use by other processes; run again later.", style=STYLES["warning"]))
+    if report.integrity not in (None, "ok"):
+        exit_with_error(f"Integrity check failed: {report.integrity}", EXIT_PERMANENT_ERROR)
+
+
+@cli.command()
+@click.argument("queue")
+@click.argument("max_length", required=False, type=click.IntRange(min=0))
+@click.option("--clear", is_flag=True, help="Remove the queue's limit.")
+def limit(queue: str, max_length: Optional[int], clear: bool) -> None:
+    """Show the limit of QUEUE, or allow it at most MAX_LENGTH active tasks.
+
+    Adding to a full queue fails with exit code 73, or with 'add --wait' waits for room.
+    """
+    if max_length is not None and clear:
+        raise click.UsageError("Pass a limit or --clear, not both.")
+    try:
+        if max_length is not None or clear:
+            db.set_queue_limit(queue, max_length)
+        current, active = db.queue_limit(queue)
+        text = Text()
+        text.append("Queue '", style="white")
+        text.append(queue, style=STYLES["queue"])
+        if current is None:
+            text.append(f"' has no limit and holds {active:,} tasks.", style="white")
+        else:
+            text.append(f"' holds {active:,} of at most {current:,} tasks.", style="white")
+        console.print(text)
+    except TQUError as e:
+        exit_with_error(e.message, e.exit_code)
+
+
+@cli.command()
+@click.argument("name", required=False, type=click.Choice(tuple(PROFILES)))
+@click.option("--clear", is_flag=True, help="Remove the profile stored in the database.")
+def profile(name: Optional[str], clear: bool) -> None:
+    """Show the tuning profile in use, or store NAME as the database's own profile.
+
+    A stored profile applies to every process using the database unless TQU_PROFILE is set.
+    """
+    if name is not None and clear:
+        raise click.UsageError("Pass a profile name or --clear, not both.")
+    try:
+        if name is not None or clear:
+            db.set_profile(name)
+        current, source = db.get_profile()
+        settings = PROFILES[current]
+        text = Text()
+        text.append("Profile ", style="white")
+        text.append(current, style=STYLES["queue"])
+        text.append(f" (from {source}): synchronous={settings.synchronous}, cache_size={settings.cache_size}, ")
+        text.append(f"mmap_size={settings.mmap_size}, temp_store={settings.temp_store}, ")
+        text.append(f"busy_timeout={settings.busy_timeout:g}s")
+        console.print(text)
+    except TQUError as e:
+        exit_with_error(e.message, e.exit_code)
+
+
+def show_stats() -> None:
+    """Print the instrumentation counters and timings collected during this invocation."""
+    counters = instrumentation.get_counters()
+    histograms = instrumentation.get_histograms()
+    if not counters and not histograms:
+        error_console.print("No instrumentation counters recorded.", style="dim")
+        return
+    for name, value in counters.items():
+        error_console.print(f"{name} {value}", style="dim", highlight=False)
+    for name, histogram in histograms.items():
+        average = histogram["sum"] / histogram["count"] * 1000
+        error_console.print(f"{name} calls={histogram['count']} avg={average:.2f}ms", style="dim", highlight=False)
 
 
 def exit_with_error(message: str, exit_code: int = 1) -> None:
@@ -207,9 +866,10 @@ def exit_with_error(message: str, exit_code: int = 1) -> None:
 def main() -> None:
     """Main entry point for the CLI application."""
     try:
-        cli()
+        # Named explicitly, since click derives the variable from the program name, which varies with how tqu is run
+        cli(complete_var=completion.COMPLETE_VAR)
     except TQUError as e:
-        exit_with_error(e.message, e.code if e.code is not None else 1)
+        exit_with_error(e.message, e.exit_code)
     except Exception as e:
         exit_with_error(f"Unexpected error: {str(e)}")
 
@@ -0,0 +1,213 @@
+"""Shell completion of queue names and task IDs that answers without loading the CLI.
+
+Completing an argument through click means importing the whole CLI, rich
+included, on every TAB. Instead, the `tqu` entry point calls complete_fast()
+first. It answers requests for the completion scripts and for queue or task ID
+arguments using only click's shell classes and a small cache file, and leaves
+everything else, such as subcommands and options, to click.
+
+The cache holds the active queues and the most recent active tasks of a
+database. It is rebuilt when the sequence of the events log, which moves with
+every change to a task, differs from the one it was built at.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import click
+from click.shell_completion import CompletionItem, get_completion_class
+
+PROG_NAME = "tqu"
+COMPLETE_VAR = "_TQU_COMPLETE"
+
+# Most recent active tasks offered when completing task IDs
+CACHED_TASKS = 200
+HELP_LENGTH = 60
+
+# Options that take a value, before the subcommand and after each completed one
+GROUP_VALUE_OPTIONS = {"--db", "--interval"}
+VALUE_OPTIONS: Dict[str, Tuple[str, ...]] = {
+    "add": ("--delay", "--at", "--key", "--wait"),
+    "list": ("--page", "--older-than", "--newer-than", "--since", "--match", "--interval"),
+    "poprandom": ("-n",),
+}
+
+# Positional arguments of the commands whose queue or task ID arguments are completed; None is not completed
+COMPLETED_ARGUMENTS: Dict[str, Tuple[Optional[str], ...]] = {
+    "add": (None, "queue"),
+    "list": ("queue",),
+    "pop": ("queue",),
+    "poplast": ("queue",),
+    "popfirst": ("queue",),
+    "poprandom": ("queue",),
+    "delete": ("id_or_queue",),
+}
+
+
+def _default_db_path() -> str:
+    # Mirrors tqu.db.get_db_path, which would import every backend
+    return str(os.environ.get("TQU_DB_PATH", Path("~/.tqu.sqlite").expanduser()))
+
+
+def cache_path(db_path: str) -> Path:
+    cache_home = Path(os.environ.get("XDG_CACHE_HOME") or Path("~/.cache").expanduser())
+    digest = hashlib.sha256(str(Path(db_path).resolve()).encode("utf-8")).hexdigest()[:16]
+    return cache_home / "tqu" / f"completion-{digest}.json"
+
+
+def _read_database(conn: sqlite3.Connection, version: Optional[int]) -> Dict[str, Any]:
+    queues = conn.execute("SELECT name, active_count FROM queues WHERE active_count > 0 ORDER BY name").fetchall()
+    tasks = conn.execute(
+        """
+        SELECT t.id, q.name, t.task_text
+        FROM tasks t JOIN queues q ON q.id = t.queue_id
+        WHERE t.completed_at IS NULL
+        ORDER BY t.id DESC
+        LIMIT ?
+    """,
+        (CACHED_TASKS,),
+    ).fetchall()
+    # As lists, like the rows of a cache read back from JSON
+    return {"version": version, "queues": [list(row) for row in queues], "tasks": [list(row) for row in tasks]}
+
+
+def load_candidates(db_path: str) -> Dict[str, Any]:
+    """Return the active queues and recent active tasks of a database, from the cache while it is current.
+
+    Any failure, such as a missing database or an unwritable cache, yields fewer
+    candidates rather than an error, since the shell would print it mid-line.
+    """
+    empty: Dict[str, Any] = {"queues": [], "tasks": []}
+    if not Path(db_path).is_file():
+        return empty
+    cache = cache_path(db_path)
+    try:
+        conn = sqlite3.connect(f"{Path(db_path).resolve().as_uri()}?mode=ro", uri=True)
+        try:
+            row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'events'").fetchone()
+            version = None if row is None else row[0]
+            try:
+                cached = json.loads(cache.read_text(encoding="utf-8"))
+                if cached["version"] == version:
+                    return cached
+            except (OSError, ValueError, KeyError):
+                pass
+            candidates = _read_database(conn, version)
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return empty
+    try:
+        cache.parent.mkdir(parents=True, exist_ok=True)
+        # Written aside and renamed, so a concurrent completion never reads half a file
+        temporary = cache.with_name(f"{cache.name}.{os.getpid()}")
+        temporary.write_text(json.dumps(candidates), encoding="utf-8")
+        temporary.replace(cache)
+    except OSError:
+        pass
+    return candidates
+
+
+def completion_items(kind: str, db_path: str, incomplete: str) -> List[CompletionItem]:
+    """Return the queue names, and for "id_or_queue" also task IDs, that start with `incomplete`."""
+    candidates = load_candidates(db_path)
+    items = [
+        CompletionItem(name, help=f"{count} tasks")
+        for name, count in candidates["queues"]
+        if name.startswith(incomplete)
+    ]
+    # Queue names are never numeric, so IDs are only offered once a digit has been typed
+    if kind == "id_or_queue" and incomplete.isdigit():
+        items.extend(
+            CompletionItem(str(task_id), help=f"{queue}: {text[:HELP_LENGTH]}")
+            for task_id, queue, text in candidates["tasks"]
+            if str(task_id).startswith(incomplete)
+        )
+    return items
+
+
+def argument_kind(args: Sequence[str], incomplete: str) -> Tuple[Optional[str], List[str]]:
+    """Return what the word being completed is, "queue", "id_or_queue" or None for anything else.
+
+    Also returns the --db paths given before the subcommand.
+    """
+    command: Optional[str] = None
+    databases: List[str] = []
+    positionals = 0
+    pending: Optional[str] = None
+    for word in args:
+        if pending is not None:
+            if pending == "--db":
+                databases.append(word)
+            pending = None
+        elif word.startswith("-"):
+            value_options = GROUP_VALUE_OPTIONS if command is None else VALUE_OPTIONS.get(command, ())
+            if word in value_options:
+                pending = word
+        elif command is None:
+            command = word
+        else:
+            positionals += 1
+    if pending is not None or incomplete.startswith("-") or command not in COMPLETED_ARGUMENTS:
+        return None, databases
+    kinds = COMPLETED_ARGUMENTS[command]
+    return (kinds[positionals] if positionals < len(kinds) else None), databases
+
+
+def _single_database(databases: Sequence[str]) -> Optional[str]:
+    if not databases:
+        # As click splits TQU_DB_PATHS for the multiple --db option
+        databases = [path for path in click.Path().split_envvar_value(os.environ.get("TQU_DB_PATHS", "")) if path]
+    if len(databases) > 1:
+        # Queues of several databases are qualified by their source; not completed
+        return None
+    return databases[0] if databases else _default_db_path()
+
+
+def complete_fast() -> bool:
+    """Answer the shell's completion request, if there is one that needs no CLI.
+
+    Returns False when the process was not started for completion, or for a
+    request click has to answer from the CLI itself.
+    """
+    instruction = os.environ.get(COMPLETE_VAR)
+    if not instruction:
+        return False
+    shell, _, action = instruction.partition("_")
+    comp_cls = get_completion_class(shell)
+    if comp_cls is None:
+        return False
+    # The shell classes only need the CLI itself for click's own completions
+    comp = comp_cls(None, {}, PROG_NAME, COMPLETE_VAR)
+    if action == "source":
+        click.echo(comp.source())
+        return True
+    if action != "complete":
+        return False
+    args, incomplete = comp.get_completion_args()
+    kind, databases = argument_kind(args, incomplete)
+    db_path = _single_database(databases)
+    if kind is None or db_path is None:
+        return False
+    click.echo("\n".join(comp.format_completion(item) for item in completion_items(kind, db_path, incomplete)))
+    return True
+
+
+def _context_db_path(ctx: click.Context) -> Optional[str]:
+    return _single_database(ctx.find_root().params.get("databases") or ())
+
+
+def complete_queue(ctx: click.Context, param: click.Parameter, incomplete: str) -> List[CompletionItem]:
+    """Complete a queue name when click, rather than complete_fast, handles the request."""
+    db_path = _context_db_path(ctx)
+    return [] if db_path is None else completion_items("queue", db_path, incomplete)
+
+
+def complete_id_or_queue(ctx: click.Context, param: click.Parameter, incomplete: str) -> List[CompletionItem]:
+    """Complete a queue name or task ID when click, rather than complete_fast, handles the request."""
+    db_path = _context_db_path(ctx)
+    return [] if db_path is None else completion_items("id_or_queue", db_path, incomplete)
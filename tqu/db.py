@@ -1,17 +1,40 @@
+import functools
 import os
-import sqlite3
 import time
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple, Union
-
-from tqu.exceptions import (
-    ConfigError,
-    DatabaseError,
-    EmptyQueueError,
-    TaskAlreadyExistsError,
-    TaskError,
-    TaskNotFoundError,
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Type, TypeVar, Union
+
+from tqu import instrumentation
+from tqu.backends import Backend, CombinedBackend, MemoryBackend, SQLiteBackend
+from tqu.backends.base import DEFAULT_KEY_RETENTION, AddedTask
+from tqu.backends.sqlite import (
+    DEFAULT_BUSY_TIMEOUT,
+    DEFAULT_MAX_RETRIES,
+    DEFAULT_PROFILE,
+    PROFILES,
+    MaintenanceReport,
+    read_stored_profile,
 )
+from tqu.exceptions import ConfigError, DatabaseError, QueueError, QueueFullError, TaskError, TQUError
+
+MEMORY_DB_PATH = ":memory:"
+
+# Rows fetched per query by iter_tasks and iter_events
+TASK_BATCH_SIZE = 500
+EVENT_BATCH_SIZE = 500
+
+# Seconds between checks for room in a full queue while add_task waits
+FULL_QUEUE_POLL_INTERVAL = 0.1
+
+_backend_override: Optional[Backend] = None
+_memory_backend: Optional[MemoryBackend] = None
+_read_only = False
+_db_paths: Optional[List[str]] = None
+# Profiles stored in each database, read once per process
+_stored_profiles: Dict[str, Optional[str]] = {}
+
+T = TypeVar("T")
 
 
 def get_db_path() -> str:
@@ -22,256 +45,401 @@ def get_db_path() -> str:
         raise ConfigError(f"Failed to determine database path: {str(e)}")
 
 
-def init_db() -> None:
+def _get_env_number(name: str, default: T, cast: Callable[[str], T]) -> T:
+    value = os.environ.get(name)
+    if value is None:
+        return default
     try:
-        with sqlite3.connect(get_db_path()) as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS tasks (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    queue_name TEXT NOT NULL,
-                    task_text TEXT NOT NULL,
-                    created_at INTEGER NOT NULL,
-                    updated_at INTEGER NOT NULL,
-                    completed_at INTEGER
-                )
-            """)
-            cursor.execute("""
-                CREATE INDEX IF NOT EXISTS idx_queue_completed
-                ON tasks(queue_name, completed_at)
-            """)
-    except sqlite3.Error as e:
-        raise DatabaseError(f"Failed to initialize database: {str(e)}", e)
-
-
-def add_task(task_text: str, queue_name: str = "default") -> bool:
-    if queue_name.isdigit():
-        raise TaskError(f"Queue name '{queue_name}' cannot be numeric only")
+        number = cast(value)
+    except ValueError:
+        raise ConfigError(f"Invalid value for {name}: {value!r}")
+    if number < 0:
+        raise ConfigError(f"{name} must not be negative")
+    return number
+
+
+def _profile_for(path: str) -> Tuple[str, str]:
+    name, source = os.environ.get("TQU_PROFILE"), "TQU_PROFILE"
+    if name is None:
+        if path not in _stored_profiles:
+            _stored_profiles[path] = read_stored_profile(path)
+        name, source = _stored_profiles[path], "database"
+    if name is None:
+        name, source = DEFAULT_PROFILE, "default"
+    if name not in PROFILES:
+        raise ConfigError(f"Invalid profile {name!r} from {source}; choose one of {', '.join(PROFILES)}")
+    return name, source
+
+
+def _sqlite_backend(feature: str = "Profiles apply") -> SQLiteBackend:
+    backend = get_backend()
+    if not isinstance(backend, SQLiteBackend):
+        raise ConfigError(f"{feature} to a single SQLite database, not the {backend.name} backend.")
+    return backend
 
+
+def get_profile() -> Tuple[str, str]:
+    """Return the profile of the current database and where it was chosen: "TQU_PROFILE", "database" or "default"."""
+    return _profile_for(_sqlite_backend().path)
+
+
+def set_profile(name: Optional[str]) -> None:
+    """Store a profile in the current database, used whenever TQU_PROFILE is not set; None removes it."""
+    if name is not None and name not in PROFILES:
+        raise ConfigError(f"Invalid profile {name!r}; choose one of {', '.join(PROFILES)}")
+    backend = _sqlite_backend()
+    backend.store_profile(name)
+    _stored_profiles[backend.path] = name
+
+
+def set_backend(backend: Optional[Backend]) -> None:
+    """Route all db functions to the given backend, or back to TQU_DB_PATH when None."""
+    global _backend_override
+    _backend_override = backend
+
+
+def get_backend() -> Backend:
+    global _memory_backend
+    if _backend_override is not None:
+        return _backend_override
+
+    max_retries = _get_env_number("TQU_MAX_RETRIES", DEFAULT_MAX_RETRIES, int)
+    if _db_paths is not None and len(_db_paths) > 1:
+        busy_timeout = _get_env_number("TQU_BUSY_TIMEOUT", DEFAULT_BUSY_TIMEOUT, float)
+        return CombinedBackend(_db_paths, busy_timeout=busy_timeout, max_retries=max_retries)
+
+    path = _db_paths[0] if _db_paths else get_db_path()
+    if path == MEMORY_DB_PATH:
+        # A single process-wide instance, so that data survives between calls
+        if _memory_backend is None:
+            _memory_backend = MemoryBackend()
+        return _memory_backend
+    profile = PROFILES[_profile_for(path)[0]]
+    busy_timeout = _get_env_number("TQU_BUSY_TIMEOUT", profile.busy_timeout, float)
+    return SQLiteBackend(path, busy_timeout, max_retries, read_only=_read_only, profile=profile)
+
+
+@contextmanager
+def databases(paths: Sequence[str]) -> Iterator[None]:
+    """Use the given database files instead of TQU_DB_PATH inside the block.
+
+    A single path is used like TQU_DB_PATH. Several are opened together read-only,
+    with queue names qualified by their database as "source:queue".
+    """
+    global _db_paths
+    previous, _db_paths = _db_paths, list(paths)
     try:
-        with sqlite3.connect(get_db_path()) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                """
-                SELECT id FROM tasks
-                WHERE queue_name = ? AND task_text = ? AND completed_at IS NULL
-            """,
-                (queue_name, task_text),
-            )
-            if cursor.fetchone():
-                raise TaskAlreadyExistsError(task_text, queue_name)
-
-            ts = int(time.time())
-            cursor.execute(
-                """
-                INSERT INTO tasks (queue_name, task_text, created_at, updated_at, completed_at)
-                VALUES (?, ?, ?, ?, NULL)
-            """,
-                (queue_name, task_text, ts, ts),
-            )
-        return True
-    except TaskAlreadyExistsError:
-        # Re-raise the specific exception to be caught by the caller
-        raise
-    except sqlite3.Error as e:
-        raise DatabaseError(f"Failed to add task: {str(e)}", e)
+        yield
+    finally:
+        _db_paths = previous
+
 
+@contextmanager
+def read_only() -> Iterator[None]:
+    """Open SQLite connections inside the block read-only, so reads never contend for the write lock.
 
-def list_tasks(queue_name: str = "default") -> List[Dict[str, Any]]:
+    Writes inside the block fail with a DatabaseError. Backends set with set_backend are used as they are.
+    """
+    global _read_only
+    previous, _read_only = _read_only, True
     try:
-        with sqlite3.connect(get_db_path()) as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            cursor.execute(
-                """
-                SELECT id, task_text, created_at
-                FROM tasks
-                WHERE queue_name = ? AND completed_at IS NULL
-                ORDER BY created_at ASC
-            """,
-                (queue_name,),
-            )
-            return [dict(row) for row in cursor.fetchall()]
-    except sqlite3.Error as e:
-        raise DatabaseError(f"Failed to list tasks: {str(e)}", e)
+        yield
+    finally:
+        _read_only = previous
 
 
-def pop_last(queue_name: str = "default") -> Dict[str, Any]:
+@contextmanager
+def session() -> Iterator[Backend]:
+    """Route every db call inside the block through one backend and one open connection."""
+    global _backend_override
+    backend = get_backend()
+    previous = _backend_override
+    _backend_override = backend
     try:
-        with sqlite3.connect(get_db_path()) as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            cursor.execute(
-                """
-                SELECT id, task_text
-                FROM tasks
-                WHERE queue_name = ? AND completed_at IS NULL
-                ORDER BY id DESC
-                LIMIT 1
-            """,
-                (queue_name,),
-            )
-            row = cursor.fetchone()
-            if not row:
-                raise EmptyQueueError(queue_name)
-
-            task_id = row["id"]
-            ts = int(time.time())
-            cursor.execute(
-                """
-                UPDATE tasks
-                SET completed_at = ?, updated_at = ?
-                WHERE id = ?
-            """,
-                (ts, ts, task_id),
-            )
-            return dict(row)
-    except EmptyQueueError:
-        # Re-raise to be caught by the caller
-        raise
-    except sqlite3.Error as e:
-        raise DatabaseError(f"Failed to pop last task: {str(e)}", e)
+        with backend.session():
+            yield backend
+    finally:
+        _backend_override = previous
 
 
-def pop_first(queue_name: str = "default") -> Dict[str, Any]:
+def data_version() -> int:
+    return get_backend().data_version()
+
+
+@instrumentation.timed("db.init_db")
+def init_db() -> None:
+    get_backend().init()
+
+
+@instrumentation.timed("db.maintain")
+def maintain(vacuum: bool = False, quick: bool = False) -> MaintenanceReport:
+    """Refresh planner statistics, free unused pages, checkpoint the WAL and check integrity of the database.
+
+    See SQLiteBackend.maintain for what vacuum and quick change.
+    """
+    return _sqlite_backend("Maintenance applies").maintain(vacuum, quick)
+
+
+def _maintain_if_due() -> None:
+    every = _get_env_number("TQU_MAINTAIN_EVERY", 0, int)
+    if not every:
+        return
+    backend = get_backend()
+    if not isinstance(backend, SQLiteBackend) or backend.read_only:
+        return
     try:
-        with sqlite3.connect(get_db_path()) as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            cursor.execute(
-                """
-                SELECT id, task_text
-                FROM tasks
-                WHERE queue_name = ? AND completed_at IS NULL
-                ORDER BY created_at ASC
-                LIMIT 1
-            """,
-                (queue_name,),
-            )
-            row = cursor.fetchone()
-            if not row:
-                raise EmptyQueueError(queue_name)
-
-            task_id = row["id"]
-            ts = int(time.time())
-            cursor.execute(
-                """
-                UPDATE tasks
-                SET completed_at = ?, updated_at = ?
-                WHERE id = ?
-            """,
-                (ts, ts, task_id),
+        if backend.changes_since_maintenance() >= every:
+            maintain(quick=True)
+            instrumentation.increment("db.maintenance_runs")
+    except DatabaseError:
+        # The write has already committed; failing it now would only make the caller repeat it
+        instrumentation.increment("db.maintenance_failures")
+
+
+def _maintains(function: Callable[..., T]) -> Callable[..., T]:
+    """After a successful write, run quick maintenance once TQU_MAINTAIN_EVERY task changes have been logged."""
+
+    @functools.wraps(function)
+    def wrapper(*args: Any, **kwargs: Any) -> T:
+        result = function(*args, **kwargs)
+        _maintain_if_due()
+        return result
+
+    return wrapper
+
+
+def _validate_queue_name(queue_name: str, error: Type[TQUError] = TaskError) -> None:
+    if queue_name.isdigit():
+        raise error(f"Queue name '{queue_name}' cannot be numeric only")
+
+
+@_maintains
+@instrumentation.timed("db.add_task")
+def add_task(
+    task_text: str,
+    queue_name: str = "default",
+    visible_at: Optional[int] = None,
+    key: Optional[str] = None,
+    wait: float = 0,
+) -> AddedTask:
+    """Add a task and return its ID, with replayed set to False.
+
+    With an idempotency key, adding again within TQU_KEY_RETENTION seconds returns
+    the first task's ID instead, with replayed set, so producers can safely retry
+    adds that failed.
+
+    If the queue is at its limit, wait up to `wait` seconds for consumers to make
+    room before raising QueueFullError. The queue is only tried again after another
+    process has changed the database.
+    """
+    _validate_queue_name(queue_name)
+    if key is not None and not key:
+        raise TaskError("Idempotency key cannot be empty")
+    key_retention = _get_env_number("TQU_KEY_RETENTION", DEFAULT_KEY_RETENTION, int)
+    if not wait:
+        return get_backend().add_task(task_text, queue_name, visible_at, key, key_retention)
+
+    deadline = time.monotonic() + wait
+    with session() as backend:
+        while True:
+            version = backend.data_version()
+            try:
+                return backend.add_task(task_text, queue_name, visible_at, key, key_retention)
+            except QueueFullError:
+                if time.monotonic() >= deadline:
+                    raise
+            while backend.data_version() == version and time.monotonic() < deadline:
+                time.sleep(FULL_QUEUE_POLL_INTERVAL)
+
+
+@instrumentation.timed("db.get_task")
+def get_task(task_id: int) -> Dict[str, Any]:
+    return get_backend().get_task(task_id)
+
+
+@instrumentation.timed("db.list_tasks")
+def list_tasks(
+    queue_name: str = "default",
+    limit: Optional[int] = None,
+    offset: int = 0,
+    scheduled: bool = False,
+    created_after: Optional[int] = None,
+    created_before: Optional[int] = None,
+    match: Optional[str] = None,
+    after_id: Optional[int] = None,
+    newest: bool = False,
+) -> List[Dict[str, Any]]:
+    return get_backend().list_tasks(
+        queue_name, limit, offset, scheduled, created_after, created_before, match, after_id, newest
+    )
+
+
+def iter_tasks(
+    queue_name: str = "default",
+    scheduled: bool = False,
+    created_after: Optional[int] = None,
+    created_before: Optional[int] = None,
+    match: Optional[str] = None,
+) -> Iterator[Dict[str, Any]]:
+    """Yield the tasks that list_tasks would return, fetching TASK_BATCH_SIZE at a time over one connection."""
+    with session():
+        after_id = None
+        while True:
+            tasks = list_tasks(
+                queue_name, TASK_BATCH_SIZE, 0, scheduled, created_after, created_before, match, after_id
             )
-            return dict(row)
-    except EmptyQueueError:
-        # Re-raise to be caught by the caller
-        raise
-    except sqlite3.Error as e:
-        raise DatabaseError(f"Failed to pop first task: {str(e)}", e)
+            yield from tasks
+            if len(tasks) < TASK_BATCH_SIZE:
+                return
+            after_id = tasks[-1]["id"]
+
+
+@instrumentation.timed("db.count_tasks")
+def count_tasks(
+    queue_name: str = "default",
+    scheduled: bool = False,
+    created_after: Optional[int] = None,
+    created_before: Optional[int] = None,
+    match: Optional[str] = None,
+) -> int:
+    return get_backend().count_tasks(queue_name, scheduled, created_after, created_before, match)
+
+
+@_maintains
+@instrumentation.timed("db.pop_last")
+def pop_last(queue_name: str = "default") -> Dict[str, Any]:
+    return get_backend().pop_last(queue_name)
+
+
+@_maintains
+@instrumentation.timed("db.pop_first")
+def pop_first(queue_name: str = "default") -> Dict[str, Any]:
+    return get_backend().pop_first(queue_name)
+
+
+@_maintains
+@instrumentation.timed("db.claim_tasks")
+def claim_tasks(queue_name: str = "default", limit: int = 1) -> List[Dict[str, Any]]:
+    return get_backend().claim_tasks(queue_name, limit)
+
 
+@_maintains
+@instrumentation.timed("db.pop_random")
+def pop_random(queue_name: str = "default", limit: int = 1) -> List[Dict[str, Any]]:
+    """Complete and return up to `limit` due tasks chosen at random, without sorting the queue."""
+    return get_backend().pop_random(queue_name, limit)
 
+
+@_maintains
+@instrumentation.timed("db.release_task")
+def release_task(task_id: int) -> bool:
+    return get_backend().release_task(task_id)
+
+
+@_maintains
+@instrumentation.timed("db.delete_task")
 def delete_task(task_id: int) -> Optional[Tuple[str, str]]:
-    try:
-        with sqlite3.connect(get_db_path()) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                """
-                SELECT queue_name, task_text
-                FROM tasks
-                WHERE id = ? AND completed_at IS NULL
-            """,
-                (task_id,),
-            )
-            row = cursor.fetchone()
-            if not row:
-                raise TaskNotFoundError(task_id)
-
-            ts = int(time.time())
-            cursor.execute(
-                """
-                UPDATE tasks
-                SET completed_at = ?, updated_at = ?
-                WHERE id = ?
-            """,
-                (ts, ts, task_id),
-            )
-            return row
-    except TaskNotFoundError:
-        # Re-raise to be caught by the caller
-        raise
-    except sqlite3.Error as e:
-        raise DatabaseError(f"Failed to delete task: {str(e)}", e)
+    return get_backend().delete_task(task_id)
 
 
+@_maintains
+@instrumentation.timed("db.delete_queue")
 def delete_queue(queue_name: str = "default") -> List[Dict[str, Any]]:
-    try:
-        with sqlite3.connect(get_db_path()) as conn:
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            cursor.execute(
-                """
-                SELECT id, task_text
-                FROM tasks
-                WHERE queue_name = ? AND completed_at IS NULL
-                ORDER BY created_at ASC
-            """,
-                (queue_name,),
-            )
-            tasks = [dict(row) for row in cursor.fetchall()]
-
-            if not tasks:
-                raise EmptyQueueError(queue_name)
-
-            ts = int(time.time())
-            cursor.execute(
-                """
-                UPDATE tasks
-                SET completed_at = ?, updated_at = ?
-                WHERE queue_name = ? AND completed_at IS NULL
-            """,
-                (ts, ts, queue_name),
-            )
-            return tasks
-    except EmptyQueueError:
-        # Re-raise to be caught by the caller
-        raise
-    except sqlite3.Error as e:
-        raise DatabaseError(f"Failed to delete queue: {str(e)}", e)
+    return get_backend().delete_queue(queue_name)
+
+
+@instrumentation.timed("db.rename_queue")
+def rename_queue(queue_name: str, new_name: str) -> None:
+    _validate_queue_name(new_name, QueueError)
+    get_backend().rename_queue(queue_name, new_name)
+
+
+@_maintains
+@instrumentation.timed("db.merge_queues")
+def merge_queues(source: str, target: str) -> Tuple[int, int]:
+    _validate_queue_name(target, QueueError)
+    return get_backend().merge_queues(source, target)
+
+
+@_maintains
+@instrumentation.timed("db.move_tasks")
+def move_tasks(
+    source: str, target: str, limit: Optional[int] = 1, last: bool = False, task_id: Optional[int] = None
+) -> Tuple[int, int]:
+    """Move tasks from source to target in one transaction, so a crash can never lose or duplicate them."""
+    _validate_queue_name(target, QueueError)
+    return get_backend().move_tasks(source, target, limit, last, task_id)
+
+
+@instrumentation.timed("db.set_queue_limit")
+def set_queue_limit(queue_name: str, max_length: Optional[int]) -> None:
+    """Refuse adds to a queue once it holds max_length active tasks; None removes the limit."""
+    _validate_queue_name(queue_name, QueueError)
+    if max_length is not None and max_length < 0:
+        raise QueueError("Queue limit must not be negative")
+    get_backend().set_queue_limit(queue_name, max_length)
+
+
+@instrumentation.timed("db.queue_limit")
+def queue_limit(queue_name: str) -> Tuple[Optional[int], int]:
+    """Return the limit of a queue, or None, and its number of active tasks, without counting them."""
+    return get_backend().queue_limit(queue_name)
 
 
+@instrumentation.timed("db.list_queues")
 def list_queues() -> List[Tuple[str, int]]:
-    try:
-        with sqlite3.connect(get_db_path()) as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT queue_name, COUNT(*) as task_count
-                FROM tasks
-                WHERE completed_at IS NULL
-                GROUP BY queue_name
-                ORDER BY queue_name
-            """)
-            return cursor.fetchall()
-    except sqlite3.Error as e:
-        raise DatabaseError(f"Failed to list queues: {str(e)}", e)
+    return get_backend().list_queues()
+
+
+@instrumentation.timed("db.queue_metrics")
+def queue_metrics() -> List[Dict[str, Any]]:
+    return get_backend().queue_metrics()
+
+
+@instrumentation.timed("db.list_events")
+def list_events(
+    from_seq: int = 0, queue_name: Optional[str] = None, limit: Optional[int] = None, newest: bool = False
+) -> List[Dict[str, Any]]:
+    return get_backend().list_events(from_seq, queue_name, limit, newest)
+
 
+def iter_events(
+    from_seq: int = 0, queue_name: Optional[str] = None, follow: bool = False, interval: float = 1.0
+) -> Iterator[Dict[str, Any]]:
+    """Yield logged events in sequence order, starting at sequence number from_seq.
 
+    Consumers store the seq of the last event they handled and resume from seq + 1.
+    With follow, wait for new events instead of stopping; the database is checked
+    every `interval` seconds and only queried when it has changed.
+    """
+    with session():
+        version = data_version()
+        while True:
+            events = list_events(from_seq, queue_name, EVENT_BATCH_SIZE)
+            yield from events
+            if events:
+                from_seq = events[-1]["seq"] + 1
+                if len(events) == EVENT_BATCH_SIZE:
+                    continue
+            if not follow:
+                return
+            while data_version() == version:
+                time.sleep(interval)
+            version = data_version()
+
+
+@instrumentation.timed("db.prune_events")
+def prune_events(max_age: int) -> int:
+    """Remove events older than max_age seconds and return how many were removed."""
+    return get_backend().prune_events(int(time.time()) - max_age)
+
+
+@instrumentation.timed("db.find_by_id_or_name")
 def find_by_id_or_name(id_or_name: Union[str, int]) -> Tuple[bool, Optional[int]]:
     try:
         task_id = int(id_or_name)
     except ValueError:
         return False, None
 
-    try:
-        with sqlite3.connect(get_db_path()) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                """
-                SELECT id FROM tasks
-                WHERE id = ? AND completed_at IS NULL
-            """,
-                (task_id,),
-            )
-            exists = cursor.fetchone() is not None
-        return True, task_id if exists else None
-    except sqlite3.Error as e:
-        raise DatabaseError(f"Failed to find task: {str(e)}", e)
+    exists = get_backend().task_exists(task_id)
+    return True, task_id if exists else None
@@ -1,5 +1,10 @@
 from typing import Any, Optional
 
+# Exit codes for database failures, following sysexits.h
+EXIT_TRANSIENT_ERROR = 75  # EX_TEMPFAIL: retrying later may succeed
+EXIT_PERMANENT_ERROR = 74  # EX_IOERR: retrying will not help
+EXIT_QUEUE_FULL = 73  # EX_CANTCREAT: the queue is at its limit until consumers catch up
+
 
 class TQUError(Exception):
     """Base exception for all TQU errors."""
@@ -9,6 +14,10 @@ class TQUError(Exception):
         self.code = code
         super().__init__(message)
 
+    @property
+    def exit_code(self) -> int:
+        return self.code if self.code is not None else 1
+
 
 class QueueError(TQUError):
     """Errors related to queue operations."""
@@ -23,6 +32,13 @@ class QueueNotFoundError(QueueError):
         super().__init__(f"Queue '{queue_name}' not found.")
 
 
+class QueueAlreadyExistsError(QueueError):
+    """Raised when a queue name is already used by a queue with active tasks."""
+
+    def __init__(self, queue_name: str) -> None:
+        super().__init__(f"Queue '{queue_name}' already exists.")
+
+
 class EmptyQueueError(QueueError):
     """Raised when trying to perform operations on an empty queue."""
 
@@ -30,6 +46,13 @@ class EmptyQueueError(QueueError):
         super().__init__(f"No tasks in '{queue_name}' queue.")
 
 
+class QueueFullError(QueueError):
+    """Raised when adding to a queue that holds as many tasks as its limit allows."""
+
+    def __init__(self, queue_name: str, max_length: int) -> None:
+        super().__init__(f"Queue '{queue_name}' is full: it holds its limit of {max_length} tasks.", EXIT_QUEUE_FULL)
+
+
 class TaskError(TQUError):
     """Errors related to task operations."""
 
@@ -53,9 +76,28 @@ class TaskAlreadyExistsError(TaskError):
 class DatabaseError(TQUError):
     """Errors related to database operations."""
 
-    def __init__(self, message: str = "Database error occurred", original_error: Optional[Exception] = None) -> None:
+    def __init__(
+        self,
+        message: str = "Database error occurred",
+        original_error: Optional[Exception] = None,
+        code: Optional[int] = None,
+    ) -> None:
         self.original_error = original_error
-        super().__init__(message)
+        super().__init__(message, code)
+
+
+class TransientDatabaseError(DatabaseError):
+    """Raised when a database operation failed for a reason that may go away, such as a lock."""
+
+    def __init__(self, message: str = "Database is busy", original_error: Optional[Exception] = None) -> None:
+        super().__init__(message, original_error, EXIT_TRANSIENT_ERROR)
+
+
+class PermanentDatabaseError(DatabaseError):
+    """Raised when a database operation failed in a way that retrying will not fix."""
+
+    def __init__(self, message: str = "Database error occurred", original_error: Optional[Exception] = None) -> None:
+        super().__init__(message, original_error, EXIT_PERMANENT_ERROR)
 
 
 class ConfigError(TQUError):
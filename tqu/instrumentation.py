@@ -0,0 +1,70 @@
+import bisect
+import functools
+import threading
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, Tuple, TypeVar
+
+# Upper bounds in seconds of the latency histogram buckets, as used by Prometheus
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+T = TypeVar("T")
+
+_lock = threading.Lock()
+_counters: Counter = Counter()
+# Per histogram: observations per bucket (the last one is +Inf) and their sum
+_histograms: Dict[str, Tuple[List[int], List[float]]] = {}
+
+
+def increment(name: str, amount: int = 1) -> None:
+    with _lock:
+        _counters[name] += amount
+
+
+def observe(name: str, value: float) -> None:
+    with _lock:
+        buckets, total = _histograms.setdefault(name, ([0] * (len(LATENCY_BUCKETS) + 1), [0.0]))
+        buckets[bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+        total[0] += value
+
+
+def timed(name: str) -> Callable[[Callable[..., T]], Callable[..., T]]:
+    """Record the duration of every call, including failed ones, in the named histogram."""
+
+    def decorator(function: Callable[..., T]) -> Callable[..., T]:
+        @functools.wraps(function)
+        def wrapper(*args: Any, **kwargs: Any) -> T:
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                observe(name, time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+
+def get_counters() -> Dict[str, int]:
+    with _lock:
+        return dict(sorted(_counters.items()))
+
+
+def get_histograms() -> Dict[str, Dict[str, Any]]:
+    """Return each histogram with cumulative bucket counts, total count and sum."""
+    with _lock:
+        histograms = {}
+        for name, (buckets, total) in sorted(_histograms.items()):
+            cumulative = []
+            count = 0
+            for bound, observations in zip((*LATENCY_BUCKETS, float("inf")), buckets):
+                count += observations
+                cumulative.append((bound, count))
+            histograms[name] = {"buckets": cumulative, "count": count, "sum": total[0]}
+        return histograms
+
+
+def reset() -> None:
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
@@ -0,0 +1,106 @@
+import os
+import tempfile
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import List, Optional
+
+from tqu import db, instrumentation
+from tqu.exceptions import TQUError
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(value)
+
+
+def _family(lines: List[str], name: str, kind: str, help_text: str) -> None:
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {kind}")
+
+
+def render_metrics(now: Optional[float] = None) -> str:
+    """Render queue and operation metrics in the Prometheus text exposition format."""
+    now = time.time() if now is None else now
+    queues = db.queue_metrics()
+    lines: List[str] = []
+
+    gauges = [
+        ("tqu_queue_active_tasks", "Number of active tasks in the queue.", "active"),
+        ("tqu_queue_oldest_task_age_seconds", "Age of the oldest active task in the queue.", "oldest"),
+    ]
+    counters = [
+        ("tqu_queue_tasks_added_total", "Tasks ever added to the queue.", "added"),
+        ("tqu_queue_tasks_completed_total", "Tasks popped or deleted from the queue.", "completed"),
+    ]
+    for name, help_text, key in gauges + counters:
+        _family(lines, name, "counter" if name.endswith("_total") else "gauge", help_text)
+        for queue in queues:
+            value = queue[key]
+            if key == "oldest":
+                value = max(0, now - value) if value is not None else 0
+            lines.append(f'{name}{{queue="{_escape(queue["name"])}"}} {_format_value(value)}')
+
+    histograms = instrumentation.get_histograms()
+    if histograms:
+        name = "tqu_operation_duration_seconds"
+        _family(lines, name, "histogram", "Duration of tqu database operations in this process.")
+        for operation, histogram in histograms.items():
+            label = f'operation="{_escape(operation)}"'
+            for bound, count in histogram["buckets"]:
+                lines.append(f'{name}_bucket{{{label},le="{_format_value(bound)}"}} {count}')
+            lines.append(f"{name}_sum{{{label}}} {_format_value(histogram['sum'])}")
+            lines.append(f"{name}_count{{{label}}} {histogram['count']}")
+
+    for counter, value in instrumentation.get_counters().items():
+        name = "tqu_" + counter.replace(".", "_") + "_total"
+        _family(lines, name, "counter", f"Value of the {counter} counter in this process.")
+        lines.append(f"{name} {value}")
+
+    return "\n".join(lines) + "\n"
+
+
+def write_textfile(path: str) -> None:
+    """Write the metrics atomically, as the node_exporter textfile collector expects."""
+    target = Path(path)
+    content = render_metrics()
+    fd, temp_name = tempfile.mkstemp(dir=target.parent, prefix=f".{target.name}.", suffix=".tmp")
+    temp_path = Path(temp_name)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(content)
+        temp_path.replace(target)
+    except BaseException:
+        temp_path.unlink(missing_ok=True)
+        raise
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        try:
+            body = render_metrics().encode("utf-8")
+        except TQUError as e:
+            self.send_error(500, e.message)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: object) -> None:
+        pass
+
+
+def make_server(host: str, port: int) -> ThreadingHTTPServer:
+    return ThreadingHTTPServer((host, port), MetricsHandler)
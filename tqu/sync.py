@@ -0,0 +1,316 @@
+import sqlite3
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple, TypeVar
+
+from tqu import db
+from tqu.backends import SQLiteBackend
+from tqu.backends.base import EVENT_ADD, EVENT_COMPLETE, EVENT_DELETE, EVENT_MOVE
+from tqu.backends.sqlite import NEW_UID, advance_clock, record_events, retrying, text_key, text_prefix
+from tqu.exceptions import DatabaseError
+
+# Schema names of the two databases on the sync connection
+LOCAL = "main"
+PEER = "peer"
+
+T = TypeVar("T")
+
+# An active task counts as updated when its queue was last renamed, if that is later
+TASK_COLUMNS = """
+    t.uid, q.name AS queue_name, t.task_text, t.text_hash, t.created_at,
+    CASE WHEN t.completed_at IS NULL THEN MAX(t.updated_at, q.updated_at) ELSE t.updated_at END AS updated_at,
+    t.completed_at, t.visible_at, t.position, (SELECT data FROM {schema}.payloads WHERE task_id = t.id) AS payload
+"""
+
+
+class SyncResult(NamedTuple):
+    pulled: int
+    pushed: int
+    duplicates: int
+    elapsed: float
+
+
+def _database() -> SQLiteBackend:
+    backend = db.get_backend()
+    if not isinstance(backend, SQLiteBackend):
+        raise DatabaseError(f"Sync needs a SQLite database, not the {backend.name} backend.")
+    return backend
+
+
+def _check_tqu_database(path: Path) -> None:
+    # Read-only, so that a file that is not a tqu database is left untouched
+    conn = sqlite3.connect(f"{path.resolve().as_uri()}?mode=ro", uri=True)
+    try:
+        has_tasks = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'tasks'")
+        if has_tasks.fetchone() is None:
+            raise DatabaseError(f"'{path}' is not a tqu database.")
+    finally:
+        conn.close()
+
+
+def _precedence(task: Dict[str, Any]) -> Tuple[Any, ...]:
+    """Order two versions of a task; the greater one wins.
+
+    Completion wins over any other change, then the latest update. The remaining
+    fields only break ties, so both databases always pick the same version.
+    """
+    return (
+        task["completed_at"] is not None,
+        task["updated_at"],
+        task["completed_at"] or 0,
+        task["queue_name"],
+        task["task_text"],
+        task["visible_at"],
+        task["created_at"],
+        task["position"],
+    )
+
+
+def _replica_uid(conn: sqlite3.Connection, schema: str) -> str:
+    return conn.execute(f"SELECT value FROM {schema}.meta WHERE key = 'uid'").fetchone()[0]
+
+
+def _watermarks(conn: sqlite3.Connection, peer_uid: str) -> Tuple[int, int]:
+    row = conn.execute(f"SELECT pulled, pushed FROM {LOCAL}.sync_peers WHERE peer = ?", (peer_uid,)).fetchone()
+    return (row[0], row[1]) if row else (0, 0)
+
+
+def _save_watermarks(conn: sqlite3.Connection, schema: str, peer_uid: str, pulled: int, pushed: int) -> None:
+    conn.execute(
+        f"INSERT OR REPLACE INTO {schema}.sync_peers (peer, pulled, pushed) VALUES (?, ?, ?)",
+        (peer_uid, pulled, pushed),
+    )
+
+
+def _changes(conn: sqlite3.Connection, schema: str, since: int) -> List[Dict[str, Any]]:
+    # Rows updated in the watermark's own second are sent again; applying them twice is harmless
+    cursor = conn.execute(
+        f"""
+        SELECT {TASK_COLUMNS.format(schema=schema)}
+        FROM {schema}.tasks t JOIN {schema}.queues q ON q.id = t.queue_id
+        WHERE t.id IN (
+            SELECT id FROM {schema}.tasks WHERE updated_at >= ?
+            UNION
+            SELECT renamed.id FROM {schema}.queues r JOIN {schema}.tasks renamed ON renamed.queue_id = r.id
+            WHERE r.updated_at >= ? AND renamed.completed_at IS NULL
+        )
+    """,
+        (since, since),
+    )
+    return [dict(row) for row in cursor.fetchall()]
+
+
+def _next_watermark(changes: List[Dict[str, Any]], previous: int, now: int) -> int:
+    # Never beyond now, so that a peer with a clock running ahead cannot hide later changes
+    return max(previous, min(now, max((task["updated_at"] for task in changes), default=previous)))
+
+
+def _ensure_queue(conn: sqlite3.Connection, schema: str, queue_name: str) -> int:
+    conn.execute(f"INSERT OR IGNORE INTO {schema}.queues (name) VALUES (?)", (queue_name,))
+    return conn.execute(f"SELECT id FROM {schema}.queues WHERE name = ?", (queue_name,)).fetchone()[0]
+
+
+def _drop_duplicate(conn: sqlite3.Connection, schema: str, queue_id: int, task: Dict[str, Any], now: int) -> bool:
+    """Complete one of two active tasks with the same text in a queue, keeping the one ahead in the queue.
+
+    Both databases keep the same task, whichever side the duplicate is found on.
+    """
+    other = conn.execute(
+        f"""
+        SELECT uid, position FROM {schema}.tasks
+        WHERE queue_id = ? AND completed_at IS NULL AND {text_prefix("task_text")} = {text_prefix("?")}
+        AND text_key = ? AND task_text IS ? AND text_hash IS ? AND uid != ?
+    """,
+        (queue_id, task["task_text"], task["text_key"], task["task_text"], task["text_hash"], task["uid"]),
+    ).fetchone()
+    if other is None:
+        return False
+    loser = max((task["position"], task["uid"]), (other["position"], other["uid"]))[1]
+    conn.execute(f"UPDATE {schema}.tasks SET completed_at = ?, updated_at = ? WHERE uid = ?", (now, now, loser))
+    record_events(conn.cursor(), EVENT_DELETE, now, "t.uid = ?", (loser,), schema=schema)
+    return True
+
+
+def _event_kind(existing: Optional[Dict[str, Any]], task: Dict[str, Any]) -> Optional[str]:
+    """Return the kind of event that replacing `existing` with `task` amounts to, if any."""
+    was_active = existing is not None and existing["completed_at"] is None
+    if task["completed_at"] is not None:
+        return EVENT_COMPLETE if was_active else None
+    if not was_active:
+        return EVENT_ADD
+    return EVENT_MOVE if existing["queue_name"] != task["queue_name"] else None
+
+
+def _apply(conn: sqlite3.Connection, schema: str, task: Dict[str, Any], now: int) -> Tuple[bool, bool]:
+    """Merge one task version into a database; return whether it changed and whether a duplicate was dropped.
+
+    Tasks are matched by uid. A task new to the database gets a fresh local ID, so
+    IDs that collide between the two databases never overwrite each other. Its
+    position comes along, so it takes its place in the queue by when it was added.
+    """
+    existing = conn.execute(
+        f"""
+        SELECT {TASK_COLUMNS.format(schema=schema)}
+        FROM {schema}.tasks t JOIN {schema}.queues q ON q.id = t.queue_id
+        WHERE t.uid = ?
+    """,
+        (task["uid"],),
+    ).fetchone()
+    existing = None if existing is None else dict(existing)
+    if existing is not None and _precedence(existing) >= _precedence(task):
+        return False, False
+
+    queue_id = _ensure_queue(conn, schema, task["queue_name"])
+    task["text_key"] = text_key(task["task_text"], task["text_hash"])
+    values = (
+        queue_id,
+        task["task_text"],
+        task["text_hash"],
+        task["text_key"],
+        task["created_at"],
+        task["updated_at"],
+        task["position"],
+    )
+    if existing is None:
+        cursor = conn.execute(
+            f"""
+            INSERT INTO {schema}.tasks (
+                queue_id, task_text, text_hash, text_key, created_at, updated_at, position, completed_at, visible_at,
+                uid
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+            (*values, task["completed_at"], task["visible_at"], task["uid"]),
+        )
+        if task["payload"] is not None:
+            conn.execute(
+                f"INSERT INTO {schema}.payloads (task_id, data) VALUES (?, ?)", (cursor.lastrowid, task["payload"])
+            )
+    else:
+        # A task's text never changes, so neither does its payload
+        conn.execute(
+            f"""
+            UPDATE {schema}.tasks
+            SET queue_id = ?, task_text = ?, text_hash = ?, text_key = ?, created_at = ?, updated_at = ?,
+                position = ?, completed_at = ?, visible_at = ?
+            WHERE uid = ?
+        """,
+            (*values, task["completed_at"], task["visible_at"], task["uid"]),
+        )
+    if task["position"] > task["visible_at"] * 1_000_000:
+        # The position came from the other database's clock, not from when a scheduled task is due
+        advance_clock(conn.cursor(), task["position"], schema)
+    kind = _event_kind(existing, task)
+    if kind is not None:
+        record_events(conn.cursor(), kind, now, "t.uid = ?", (task["uid"],), schema=schema)
+    return True, task["completed_at"] is None and _drop_duplicate(conn, schema, queue_id, task, now)
+
+
+class Exchange(NamedTuple):
+    local_uid: str
+    peer_uid: str
+    pulled_mark: int
+    pushed_mark: int
+    pulled: int
+    pushed: int
+    duplicates: int
+
+
+def _exchange(conn: sqlite3.Connection) -> Exchange:
+    now = int(time.time())
+    local_uid = _replica_uid(conn, LOCAL)
+    peer_uid = _replica_uid(conn, PEER)
+    if peer_uid == local_uid:
+        # The peer is a copy of this database file; from now on it is a database of its own
+        conn.execute(f"UPDATE {PEER}.meta SET value = {NEW_UID} WHERE key = 'uid'")
+        peer_uid = _replica_uid(conn, PEER)
+
+    pulled_mark, pushed_mark = _watermarks(conn, peer_uid)
+    # Both sides are read before either is written, so each only receives the other's own changes
+    incoming = _changes(conn, PEER, pulled_mark)
+    outgoing = _changes(conn, LOCAL, pushed_mark)
+    pulled = pushed = duplicates = 0
+    for task in incoming:
+        changed, dropped = _apply(conn, LOCAL, task, now)
+        pulled += changed
+        duplicates += dropped
+    for task in outgoing:
+        changed, dropped = _apply(conn, PEER, task, now)
+        pushed += changed
+        duplicates += dropped
+
+    return Exchange(
+        local_uid,
+        peer_uid,
+        _next_watermark(incoming, pulled_mark, now),
+        _next_watermark(outgoing, pushed_mark, now),
+        pulled,
+        pushed,
+        duplicates,
+    )
+
+
+def _record_watermarks(conn: sqlite3.Connection, exchange: Exchange) -> None:
+    _save_watermarks(conn, LOCAL, exchange.peer_uid, exchange.pulled_mark, exchange.pushed_mark)
+    _save_watermarks(conn, PEER, exchange.local_uid, exchange.pushed_mark, exchange.pulled_mark)
+
+
+@retrying("Failed to sync")
+def _in_transaction(backend: SQLiteBackend, conn: sqlite3.Connection, step: Callable[[sqlite3.Connection], T]) -> T:
+    # Takes the write lock of both databases; a lock held elsewhere is waited for and retried like any write
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        result = step(conn)
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return result
+
+
+def sync(other: str) -> SyncResult:
+    """Exchange changed tasks with another tqu database, so that both end up with the same tasks.
+
+    Only rows updated since the last sync between the two databases are read, through
+    the updated_at index. Each database records how far it has synced with the other,
+    so either side can start the next sync.
+
+    A transaction over two database files in WAL mode is atomic in each file but not
+    across them: a crash while committing can leave one side written and the other
+    not. So the tasks are exchanged in one transaction and the watermarks recorded in
+    a second one, once the tasks are committed on both sides. After a crash in the
+    first, neither watermark has moved and the next sync exchanges the same changes
+    again, which merges to the same result; after a crash in the second, a side that
+    kept its old watermark only reads some changes twice.
+    """
+    backend = _database()
+    other_path = Path(other)
+    if not other_path.is_file():
+        raise DatabaseError(f"'{other}' does not exist.")
+    if other_path.resolve() == Path(backend.path).resolve():
+        raise DatabaseError("Cannot sync a database with itself.")
+
+    start = time.monotonic()
+    try:
+        _check_tqu_database(other_path)
+    except sqlite3.Error as e:
+        raise DatabaseError(f"Failed to open '{other}': {str(e)}", e)
+    # The other database may have been written by an older version of tqu
+    SQLiteBackend(str(other_path), busy_timeout=backend.busy_timeout, max_retries=backend.max_retries).init()
+    backend.init()
+
+    try:
+        conn = sqlite3.connect(backend.path, timeout=backend.busy_timeout, isolation_level=None)
+    except sqlite3.Error as e:
+        raise DatabaseError(f"Failed to sync with '{other}': {str(e)}", e)
+    try:
+        conn.row_factory = sqlite3.Row
+        conn.execute(f"ATTACH DATABASE ? AS {PEER}", (str(other_path),))
+        exchange = _in_transaction(backend, conn, _exchange)
+        _in_transaction(backend, conn, lambda conn: _record_watermarks(conn, exchange))
+    except sqlite3.Error as e:
+        raise DatabaseError(f"Failed to sync with '{other}': {str(e)}", e)
+    finally:
+        conn.close()
+
+    return SyncResult(exchange.pulled, exchange.pushed, exchange.duplicates, time.monotonic() - start)
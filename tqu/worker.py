@@ -0,0 +1,126 @@
+import signal
+import subprocess
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, Iterator, List, NamedTuple, Sequence, Tuple
+
+from tqu import db
+
+PLACEHOLDER = "{}"
+
+# Exit code reported when a command cannot be started, as in shells
+COMMAND_NOT_FOUND = 127
+
+
+class TaskResult(NamedTuple):
+    task: Dict[str, Any]
+    returncode: int
+    duration: float
+    requeued: bool
+
+
+class WorkSummary(NamedTuple):
+    succeeded: int
+    failed: int
+    requeued: int
+    released: int
+    elapsed: float
+
+    @property
+    def processed(self) -> int:
+        return self.succeeded + self.failed + self.requeued
+
+    @property
+    def throughput(self) -> float:
+        return self.processed / self.elapsed if self.elapsed > 0 else 0.0
+
+
+def build_command(command: Sequence[str], task_text: str) -> List[str]:
+    """Substitute the task text for every `{}` in the command, or append it if there is none."""
+    if any(PLACEHOLDER in arg for arg in command):
+        return [arg.replace(PLACEHOLDER, task_text) for arg in command]
+    return [*command, task_text]
+
+
+def run_command(command: List[str]) -> Tuple[int, float]:
+    start = time.monotonic()
+    try:
+        # A new session keeps Ctrl+C in the terminal from killing commands we want to drain
+        returncode = subprocess.run(command, start_new_session=True).returncode
+    except OSError:
+        returncode = COMMAND_NOT_FOUND
+    return returncode, time.monotonic() - start
+
+
+@contextmanager
+def stop_on_signals() -> Iterator[threading.Event]:
+    """Yield an event that is set, instead of raising, on SIGINT and SIGTERM."""
+    stop = threading.Event()
+    signals = (signal.SIGINT, signal.SIGTERM)
+    previous = {signum: signal.signal(signum, lambda *_: stop.set()) for signum in signals}
+    try:
+        yield stop
+    finally:
+        for signum, handler in previous.items():
+            signal.signal(signum, handler)
+
+
+def work(
+    queue: str,
+    command: Sequence[str],
+    concurrency: int,
+    batch_size: int,
+    retries: int,
+    on_result: Callable[[TaskResult], None],
+    stop: threading.Event,
+) -> WorkSummary:
+    """Run the tasks of a queue as commands until it is empty or `stop` is set.
+
+    Tasks are claimed in batches over one connection and handed to `concurrency`
+    threads that each wait on one child process. A failed task is released back
+    to its place in the queue up to `retries` times. Once `stop` is set, running
+    commands are drained and claimed tasks that never started are released.
+    """
+    attempts: Dict[int, int] = {}
+    pending: Deque[Dict[str, Any]] = deque()
+    running: Dict[Future, Dict[str, Any]] = {}
+    succeeded = failed = requeued = released = 0
+    start = time.monotonic()
+
+    with db.session(), ThreadPoolExecutor(max_workers=concurrency) as pool:
+        try:
+            while True:
+                while not stop.is_set() and len(running) < concurrency:
+                    if not pending:
+                        pending.extend(db.claim_tasks(queue, batch_size))
+                        if not pending:
+                            break
+                    task = pending.popleft()
+                    running[pool.submit(run_command, build_command(command, task["task_text"]))] = task
+                if not running:
+                    break
+
+                done, _ = wait(running, timeout=0.2, return_when=FIRST_COMPLETED)
+                for future in done:
+                    task = running.pop(future)
+                    returncode, duration = future.result()
+                    was_requeued = False
+                    if returncode == 0:
+                        succeeded += 1
+                    else:
+                        attempts[task["id"]] = attempts.get(task["id"], 0) + 1
+                        was_requeued = attempts[task["id"]] <= retries and db.release_task(task["id"])
+                        if was_requeued:
+                            requeued += 1
+                        else:
+                            failed += 1
+                    on_result(TaskResult(task, returncode, duration, was_requeued))
+        finally:
+            while pending:
+                if db.release_task(pending.popleft()["id"]):
+                    released += 1
+
+    return WorkSummary(succeeded, failed, requeued, released, time.monotonic() - start)